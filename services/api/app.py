@@ -3,6 +3,7 @@ from pydantic import BaseModel
 import uuid
 import logging
 import os
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Dict, Any, Optional
 
@@ -13,9 +14,34 @@ import uvicorn
 import json
 
 # import existing functions
-from ..llm.orchestrator import protocol_analyze  
+from ..llm.orchestrator import protocol_analyze, warm_up as warm_up_services
+from ..chroma_storage.chroma_config import close_chroma
 
-app = FastAPI()
+
+def warm_up():
+    if os.getenv("WARMUP_ON_STARTUP", "1") == "0":
+        return
+    try:
+        warm_up_services()
+    except Exception as e:
+        # not fatal: each resource is created lazily on first use anyway
+        logging.warning("Warm-up failed, resources will load on first request: %s", e)
+
+
+# importing this module only wires routes; the Chroma collection, embedding backend and
+# LLM client are opened when the server starts, before the first request (set
+# WARMUP_ON_STARTUP=0 to skip), and the Chroma store is released on shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up()
+    try:
+        yield
+    finally:
+        # release the Chroma store (SQLite handles, background threads) held since warm-up
+        close_chroma()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # simple home page UI
 @app.get("/", response_class=HTMLResponse)
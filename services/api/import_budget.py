@@ -0,0 +1,49 @@
+# Import-time budget for the API service.
+# Importing services.api.app must stay cheap: no database opens, network calls or model
+# loads (those happen in the startup warm-up). This measures the import in a fresh
+# interpreter and fails when it exceeds the budget, listing the slowest modules.
+#
+#   python -m services.api.import_budget [--budget-ms 1500] [--module services.api.app]
+import argparse
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+API_IMPORT_BUDGET_MS = float(os.getenv("API_IMPORT_BUDGET_MS", "1500"))
+
+
+def measure_import(module: str) -> Tuple[float, List[Tuple[float, str]]]:
+    """Import `module` in a new interpreter; return (total ms, [(self ms, module), ...])."""
+    env = dict(os.environ, WARMUP_ON_STARTUP="0")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr.strip()}")
+    total_us = 0
+    modules = []
+    # lines look like "import time:   self [us] | cumulative | imported package"
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        modules.append((int(self_us) / 1000, name.strip()))
+        if name.strip() == module:
+            total_us = int(cumulative_us)
+    return total_us / 1000, sorted(modules, reverse=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the API import-time budget")
+    parser.add_argument("--module", default="services.api.app")
+    parser.add_argument("--budget-ms", type=float, default=API_IMPORT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=10, help="Slowest modules to list")
+    args = parser.parse_args()
+
+    total_ms, modules = measure_import(args.module)
+    print(f"import {args.module}: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    for ms, name in modules[:args.top]:
+        print(f"  {ms:8.1f} ms  {name}")
+    sys.exit(0 if total_ms <= args.budget_ms else 1)
@@ -1,15 +1,139 @@
-import chromadb
-from chromadb.config import Settings
-import os 
+# Chroma client and collection registry.
+# One PersistentClient per storage path and one handle per collection are shared by the
+# indexer, retriever and API for the life of the process, instead of reopening the
+# SQLite-backed store on every call. close_chroma() releases them (e.g. on API shutdown);
+# modules holding state derived from a collection register on_close hooks to reset it.
+import logging
+import os
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
 
-# Persistent directory shared by all services
-CHROMA_DB_DIR = "./chroma_storage"
+logger = logging.getLogger(__name__)
 
-# Persist directory (relative to project root)
-#CHROMA_DB_DIR = os.path.join(os.path.dirname(__file__), "../../chroma_storage")
+# Persistent directory shared by all services: CHROMA_DB_PATH, or chroma_storage/ at the
+# project root. Resolved once at import, so processes started from different working
+# directories still share one store.
+CHROMA_DB_DIR = os.path.abspath(
+    os.getenv("CHROMA_DB_PATH") or os.path.join(os.path.dirname(__file__), "../../chroma_storage")
+)
 
-print("CHROMA_DB_DIR =", os.path.abspath(CHROMA_DB_DIR))
+# Collection the indexer writes to and the retriever reads from
+DEFAULT_COLLECTION = os.getenv("CHROMA_COLLECTION", "protocol_docs")
 
-def get_chroma_client():
-    """Return a ChromaDB client that persists data."""
-    return chromadb.PersistentClient(path=CHROMA_DB_DIR)
+# With SHARD_BY_PROTOCOL=1, chunks indexed with a protocol go to their own collection
+# "<collection>-<protocol>", so protocol-scoped queries only search that protocol's vectors
+SHARD_BY_PROTOCOL = os.getenv("SHARD_BY_PROTOCOL", "0") == "1"
+
+
+
+def storage_path(*parts: str) -> str:
+    """Path under CHROMA_DB_DIR, for the stores kept next to the collections they describe
+    (manifests, lexical index, snapshots, caches)."""
+    return os.path.join(CHROMA_DB_DIR, *parts)
+
+
+_SLUG_RE = re.compile(r"[^a-z0-9]+")
+
+_clients: Dict[str, object] = {}
+_collections: Dict[Tuple[str, str], object] = {}
+_open_hooks: List[Callable[[str, object], None]] = []
+_close_hooks: List[Callable[[str], None]] = []
+_lock = threading.RLock()
+
+
+def _resolve(path: Optional[str]) -> str:
+    return os.path.abspath(path or CHROMA_DB_DIR)
+
+
+def get_chroma_client(path: Optional[str] = None):
+    """Return the process-wide ChromaDB client for `path` (CHROMA_DB_PATH by default).
+
+    chromadb is imported and the database opened on first use, not at import time.
+    """
+    path = _resolve(path)
+    client = _clients.get(path)
+    if client is None:
+        with _lock:
+            client = _clients.get(path)
+            if client is None:
+                import chromadb
+
+                logger.info("Opening Chroma store at %s", path)
+                client = chromadb.PersistentClient(path=path)
+                _clients[path] = client
+                for hook in list(_open_hooks):
+                    hook(path, client)
+    return client
+
+
+def get_collection(name: str, metadata: Optional[Dict] = None, create: bool = True,
+                   path: Optional[str] = None):
+    """Cached collection handle. Created with `metadata` if missing (create=True),
+    otherwise chromadb's not-found error is raised."""
+    key = (_resolve(path), name)
+    collection = _collections.get(key)
+    if collection is None:
+        with _lock:
+            collection = _collections.get(key)
+            if collection is None:
+                client = get_chroma_client(path)
+                if create:
+                    collection = client.get_or_create_collection(name=name, metadata=metadata)
+                else:
+                    collection = client.get_collection(name)
+                _collections[key] = collection
+    return collection
+
+
+def forget_collection(name: str, path: Optional[str] = None) -> None:
+    """Drop a cached handle, e.g. after the collection was deleted or recreated."""
+    with _lock:
+        _collections.pop((_resolve(path), name), None)
+
+
+def close_chroma(path: Optional[str] = None) -> None:
+    """Close the client for `path` (every open client when None) and drop its collection
+    handles. The next get_chroma_client()/get_collection() opens it again."""
+    with _lock:
+        paths = [_resolve(path)] if path else list(_clients)
+        for p in paths:
+            client = _clients.pop(p, None)
+            if client is None:
+                continue
+            for hook in list(_close_hooks):
+                hook(p)
+            for key in [k for k in _collections if k[0] == p]:
+                del _collections[key]
+            close = getattr(client, "close", None)
+            # older chromadb clients have no close(); their handles are released on exit
+            if close is not None:
+                close()
+
+
+def on_open(hook: Callable[[str, object], None]) -> Callable[[str, object], None]:
+    """Register hook(path, client), called whenever a client is opened."""
+    with _lock:
+        _open_hooks.append(hook)
+    return hook
+
+
+def on_close(hook: Callable[[str], None]) -> Callable[[str], None]:
+    """Register hook(path), called before a client is closed."""
+    with _lock:
+        _close_hooks.append(hook)
+    return hook
+
+
+def protocol_key(protocol: str) -> str:
+    """Protocol names are stored and matched lowercased ("Aave" and "aave" are one protocol)."""
+    return protocol.strip().lower()
+
+
+def shard_name(collection_name: str, protocol: str) -> str:
+    """Collection holding `protocol`'s chunks when sharding by protocol."""
+    slug = _SLUG_RE.sub("-", protocol_key(protocol)).strip("-")
+    if not slug:
+        return collection_name
+    # Chroma names are at most 63 chars and must end in a letter or digit
+    return f"{collection_name}-{slug}"[:63].rstrip("-_.")
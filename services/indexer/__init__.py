@@ -11,8 +11,14 @@ from .indexer import (
     extract_text_from_pdf,
     extract_text_from_url,
     chunk_words_with_overlap,
-    chunk_by_tokens
+    chunk_by_tokens,
+    iter_pdf_pages,
+    iter_word_chunks,
+    iter_text_chunks,
+    iter_pdf_chunks
 )
+from .token_chunker import iter_token_chunks, chunk_text_by_tokens
+from .merkle import MerkleTree, prove_chunk, verify_chunk_proof
 
 __all__ = [
     "index_pdf",
@@ -20,5 +26,14 @@ __all__ = [
     "extract_text_from_pdf",
     "extract_text_from_url",
     "chunk_words_with_overlap",
-    "chunk_by_tokens"
+    "chunk_by_tokens",
+    "iter_pdf_pages",
+    "iter_word_chunks",
+    "iter_text_chunks",
+    "iter_pdf_chunks",
+    "iter_token_chunks",
+    "chunk_text_by_tokens",
+    "MerkleTree",
+    "prove_chunk",
+    "verify_chunk_proof"
 ]
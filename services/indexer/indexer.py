@@ -6,23 +6,36 @@ import hashlib
 
 # Indexer: chunk documents, embed, insert into vector DB, then anchor merkle root on chain
 
+import datetime
 import os
-from typing import List, Dict, Iterable, Optional 
+import re
+from typing import Callable, List, Dict, Iterable, Iterator, Optional, Tuple
 
 import chromadb
 from chromadb.config import Settings
-from ..chroma_storage.chroma_config import get_chroma_client
+from ..chroma_storage.chroma_config import (
+    DEFAULT_COLLECTION,
+    SHARD_BY_PROTOCOL,
+    get_collection,
+    protocol_key,
+    shard_name,
+)
 
-import pdfplumber
-import PyPDF2
-import trafilatura
 import requests
 import tiktoken
 import hashlib 
-from bs4 import BeautifulSoup
 import argparse
+from collections import deque
 
-from ..retriever.encoder import get_embedding
+from ..retriever.encoder import get_embeddings
+from ..retriever.lexical import get_lexical_index
+from ..retriever.query_cache import mark_collection_written
+from ..retriever.snapshot import journal_writes, refresh_snapshot, snapshot_exists
+from ..retriever.backends import get_backend, collection_backend_metadata, ensure_collection_backend
+from .manifest import delete_manifest, load_manifest, save_manifest, manifest_hashes
+from .token_chunker import get_encoder, iter_token_chunks
+from .merkle import MerkleTree, delete_tree, load_tree, save_tree
+from .writer import ChromaWriter, DEFAULT_BATCH_SIZE
 
 
 def extract_text_from_url(url: str) -> str:
@@ -39,6 +52,7 @@ def extract_text_from_url(url: str) -> str:
         raise ValueError(f"Invalid URL: {url}")
    
     # trafilatura  
+    import trafilatura
 
     downloaded = trafilatura.fetch_url(url)
     if downloaded:
@@ -47,44 +61,64 @@ def extract_text_from_url(url: str) -> str:
             return text.strip()
     # BeautifulSoup 
 
+    # a failed fetch must not look like an empty document, which would un-index the source
+    raise RuntimeError(f"Could not extract text from {url}")
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-    """Extract text from a PDF file using the best available backend.
 
-    Priority:
-    1) pdfplumber if installed
-    2) PyPDF2 if installed
-    3) Raise a helpful error instructing how to install
+def iter_pdf_pages(pdf_path: str) -> Iterator[Tuple[int, str]]:
+    """Yield (page_number, text) one page at a time, 1-based.
+
+    Only the current page is held in memory. Uses pdfplumber, falling back to PyPDF2
+    for the remaining pages if pdfplumber is missing or fails part-way.
     """
     if not pdf_path or not os.path.exists(pdf_path):
         raise FileNotFoundError(f"PDF not found: {pdf_path}")
 
-    # pdfplumber
+    done = 0
+
+    # pdfplumber (PDF backends are imported on first use, so the package imports without them)
     try:
-        text_parts: List[str] = []
+        import pdfplumber
+
         with pdfplumber.open(pdf_path) as pdf:
             for page in pdf.pages:
                 page_text = page.extract_text() or ""
-                text_parts.append(page_text)
-        return "\n".join(text_parts).strip()
+                # drop the page's cached layout objects before moving on
+                page.flush_cache()
+                done += 1
+                yield done, page_text
+        return
     except Exception:
         pass
 
     # PyPDF2
     try:
-        text_parts = []
+        import PyPDF2
+
         with open(pdf_path, "rb") as fh:
             reader = PyPDF2.PdfReader(fh)
-            for page in reader.pages:
-                page_text = page.extract_text() or ""
-                text_parts.append(page_text)
-        return "\n".join(text_parts).strip()
+            for page_number, page in enumerate(reader.pages, start=1):
+                if page_number <= done:
+                    continue
+                yield page_number, page.extract_text() or ""
     except Exception as e:
         raise RuntimeError(
             "No PDF backend available. Install one of: `pip install pdfplumber` or `pip install PyPDF2`"
         ) from e
 
 
+def extract_text_from_pdf(pdf_path: str) -> str:
+    """Extract text from a PDF file using the best available backend.
+
+    Priority:
+    1) pdfplumber if installed
+    2) PyPDF2 if installed
+    3) Raise a helpful error instructing how to install
+    Loads the whole document; prefer iter_pdf_chunks for indexing large PDFs.
+    """
+    return "\n".join(text for _, text in iter_pdf_pages(pdf_path)).strip()
+
+
 def chunk_text(text, size=500): # 500 words per chunk first
     # word-based chunking: split by words and produce chunks with up to `size` words each
     words = text.split()
@@ -120,22 +154,101 @@ def chunk_words_with_overlap(text: str, size: int = 500, overlap: int = 50) -> L
 def chunk_by_tokens(text: str, size_tokens: int = 1024, overlap_tokens: int = 128,
                     encoding_name: str = "cl100k_base") -> List[str]:
     
-    # chunk text by tokens using tiktoken
-   
-    enc = tiktoken.get_encoding(encoding_name)
+    # chunk text into fixed token windows using tiktoken and return the chunk texts
+    # (see token_chunker.iter_token_chunks for sentence-aligned chunks with offsets)
+    if overlap_tokens < 0 or overlap_tokens >= size_tokens:
+        raise ValueError("overlap_tokens must be >=0 and < size_tokens")
+
+    enc = get_encoder(encoding_name)
     # encode -> list[int]
-    token_ids = enc.encode(text)
-    chunks = []
-    for i in range(0, len(token_ids), size_tokens - overlap_tokens):
-        chunk = token_ids[i:i + size_tokens]
-        chunks.append(chunk)
-    return chunks
+    token_ids = enc.encode_ordinary(text)
+    windows = [token_ids[i:i + size_tokens]
+               for i in range(0, len(token_ids), size_tokens - overlap_tokens)]
+    return enc.decode_batch(windows)
+
+
+def iter_word_chunks(words: Iterable[Tuple[str, Optional[int]]], size: int = 500,
+                     overlap: int = 50) -> Iterator[Dict]:
+    """Streaming counterpart of chunk_words_with_overlap.
+
+    Consumes (word, page) pairs and yields {"text", "page_start", "page_end",
+    "word_start", "word_end"} dicts, holding at most `size` words at a time. Produces
+    the same chunk texts as chunk_words_with_overlap over the same words.
+    """
+    if size <= 0:
+        raise ValueError("size must > 0")
+    if overlap < 0 or overlap >= size:
+        raise ValueError("overlap must be >=0 and < size")
+    step = size - overlap
+
+    def emit(window, start):
+        return {
+            "text": " ".join(w for w, _ in window),
+            "page_start": window[0][1],
+            "page_end": window[-1][1],
+            "word_start": start,
+            "word_end": start + len(window),
+        }
+
+    window = deque()
+    start = 0
+    for item in words:
+        window.append(item)
+        if len(window) == size:
+            yield emit(window, start)
+            for _ in range(step):
+                window.popleft()
+            start += step
+    # tail: same trailing (possibly overlap-only) chunks as the list version
+    while window:
+        yield emit(window, start)
+        dropped = min(step, len(window))
+        for _ in range(dropped):
+            window.popleft()
+        start += dropped
+
+
+def iter_text_chunks(text: str, size: int = 500, overlap: int = 50) -> Iterator[Dict]:
+    # words are pulled lazily from the text instead of materialising text.split()
+    words = ((m.group(0), None) for m in re.finditer(r"\S+", text or ""))
+    return iter_word_chunks(words, size, overlap)
+
+
+def iter_pdf_chunks(pdf_path: str, size: int = 500, overlap: int = 50) -> Iterator[Dict]:
+    """Chunk a PDF page by page, holding one page and one chunk window at a time."""
+    def words():
+        for page_number, page_text in iter_pdf_pages(pdf_path):
+            for m in re.finditer(r"\S+", page_text):
+                yield m.group(0), page_number
+    return iter_word_chunks(words(), size, overlap)
+
+
+CHUNKERS = ("words", "tokens")
+
+
+def _chunk_source(source: str, source_type: str, text: Optional[str] = None,
+                  chunker: str = "words",
+                  chunk_size_words: int = 500, overlap_words: int = 50,
+                  chunk_size_tokens: int = 512, overlap_tokens: int = 64) -> Iterator[Dict]:
+    # PDFs are read page by page from `source`; everything else chunks the given text
+    if chunker not in CHUNKERS:
+        raise ValueError(f"Unknown chunker {chunker!r}, expected one of {CHUNKERS}")
+    if source_type == "pdf" and text is None:
+        if chunker == "tokens":
+            return iter_token_chunks(iter_pdf_pages(source), chunk_size_tokens, overlap_tokens)
+        return iter_pdf_chunks(source, chunk_size_words, overlap_words)
+    if chunker == "tokens":
+        return iter_token_chunks([(text or "", None)], chunk_size_tokens, overlap_tokens)
+    return iter_text_chunks(text, chunk_size_words, overlap_words)
 
 
 # Indexing pipeline for a single PDF 
-def _ensure_collection(collection_name: str = "my_collection"):
-    client = get_chroma_client()
-    return client.get_or_create_collection(name=collection_name)
+def _ensure_collection(collection_name: str = DEFAULT_COLLECTION):
+    # the handle is opened once per process and reused by every index call
+    backend = get_backend()
+    collection = get_collection(collection_name, metadata=collection_backend_metadata(backend))
+    # refuse to mix vectors from a different embedding backend/dimension
+    return ensure_collection_backend(collection, backend)
 
 
 def _hash_bytes(data: bytes) -> str:
@@ -143,128 +256,361 @@ def _hash_bytes(data: bytes) -> str:
 
 
 def _compute_merkle_root(hashes: List[str]) -> Optional[str]:
-    if not hashes:
-        return None
-    layer = hashes[:]
-    while len(layer) > 1:
-        next_layer: List[str] = []
-        for i in range(0, len(layer), 2):
-            left = layer[i]
-            right = layer[i + 1] if i + 1 < len(layer) else left
-            combined = bytes.fromhex(left) + bytes.fromhex(right)
-            next_layer.append(_hash_bytes(combined))
-        layer = next_layer
-    return layer[0]
+    return MerkleTree.from_hex(hashes).root_hex
+
+
+# chunk position fields copied into Chroma metadata when the chunker provides them
+_CHUNK_POSITION_KEYS = ("page_start", "page_end", "word_start", "word_end",
+                        "char_start", "char_end", "token_start", "token_end")
+
+
+def _date_key(value) -> int:
+    # dates are stored as YYYYMMDD ints so `where` filters can compare them ($gte/$lt)
+    if isinstance(value, int):
+        return value
+    if not isinstance(value, datetime.date):
+        value = datetime.date.fromisoformat(str(value))
+    return int(value.strftime("%Y%m%d"))
+
+
+def document_metadata(metadata: Optional[Dict]) -> Dict:
+    """Normalize document-level metadata copied onto every chunk of a source:
+    protocol and chain are lowercased, date becomes a YYYYMMDD int, None values are dropped."""
+    result = {}
+    for key, value in (metadata or {}).items():
+        if value is None:
+            continue
+        if key in ("protocol", "chain"):
+            value = protocol_key(str(value))
+        elif key == "date":
+            value = _date_key(value)
+        elif not isinstance(value, (str, int, float, bool)):
+            raise ValueError(f"Metadata value for {key!r} must be str, int, float or bool")
+        result[key] = value
+    return result
+
+
+def target_collection(collection_name: str, metadata: Optional[Dict] = None) -> str:
+    """Collection a source's chunks are written to: its protocol's shard when
+    SHARD_BY_PROTOCOL is set and the source has a protocol, otherwise `collection_name`."""
+    protocol = (metadata or {}).get("protocol")
+    if SHARD_BY_PROTOCOL and protocol:
+        return shard_name(collection_name, protocol)
+    return collection_name
+
+
+def _plan_index(source: str, source_type: str,
+                collection_name: str = DEFAULT_COLLECTION,
+                metadata: Optional[Dict] = None) -> Dict:
+    # what a re-index of `source` diffs against; filled in by _stream_plan as chunks arrive.
+    # Only chunk ids and hashes are kept for the whole document, never chunk text.
+    metadata = document_metadata(metadata)
+    collection_name = target_collection(collection_name, metadata)
+    manifest = load_manifest(source, collection_name)
+    return {
+        "source": source,
+        "source_type": source_type,
+        "collection_name": collection_name,
+        "metadata": metadata,
+        "manifest": manifest,
+        "old": manifest_hashes(manifest),
+        # re-tagged documents (e.g. a new protocol or date) rewrite every chunk's metadata
+        "retag": manifest is not None and manifest.get("metadata", {}) != metadata,
+        "indexed_at": _date_key(datetime.date.today()),
+        "ids": [],
+        "content_hashes": [],
+        "changed": [],
+        "unchanged": [],
+    }
 
 
-def _index_text(text: str, source: str, source_type: str,
-                collection_name: str = "my_collection",
-                chunk_size_words: int = 500,
-                overlap_words: int = 50) -> Dict[str, Optional[str]]:
-    """Core indexing logic: chunk, embed, and insert text into Chroma.
-    placeholder for later on-chain anchoring"""
-    
-    chunks = chunk_words_with_overlap(text, size=chunk_size_words, overlap=overlap_words)
-    if not chunks:
+def _chunk_metadata(plan: Dict, idx: int, chunk: Dict) -> Dict:
+    meta = {
+        "source": plan["source"],
+        "source_type": plan["source_type"],
+        "chunk_index": str(idx),
+        "indexed_at": plan["indexed_at"],
+    }
+    meta.update(plan["metadata"])
+    for key in _CHUNK_POSITION_KEYS:
+        if chunk.get(key) is not None:
+            meta[key] = chunk[key]
+    return meta
+
+
+def _changed_windows(plan: Dict, chunks: Iterable[Dict], size: int) -> Iterator[Tuple[List[int], List[str], List[Dict]]]:
+    # hash the chunk stream into the plan and yield the changed chunks in windows of at most
+    # `size` (positions, texts, metadatas), so only one window of text is alive at a time
+    positions: List[int] = []
+    texts: List[str] = []
+    metadatas: List[Dict] = []
+    for idx, chunk in enumerate(chunks):
+        cid = f"{plan['source']}:{idx}"
+        h = _hash_bytes(chunk["text"].encode("utf-8"))
+        plan["ids"].append(cid)
+        plan["content_hashes"].append(h)
+        if not plan["retag"] and plan["old"].get(cid) == h:
+            plan["unchanged"].append(idx)
+            continue
+        plan["changed"].append(idx)
+        positions.append(idx)
+        texts.append(chunk["text"])
+        metadatas.append(_chunk_metadata(plan, idx, chunk))
+        if len(positions) >= size:
+            yield positions, texts, metadatas
+            positions, texts, metadatas = [], [], []
+    if positions:
+        yield positions, texts, metadatas
+
+
+def _finish_plan(plan: Dict) -> Dict:
+    # once the stream is consumed: update the persisted tree along the changed paths
+    # instead of rebuilding it, and decide whether anything needs committing
+    manifest, old = plan["manifest"], plan["old"]
+    ids, content_hashes, changed = plan["ids"], plan["content_hashes"], plan["changed"]
+    tree = load_tree(plan["source"], plan["collection_name"]) if manifest else None
+    if tree is None or len(tree) != len(old) or tree.root_hex != manifest.get("merkle_root"):
+        # missing or out of step with the manifest (e.g. an interrupted write): rebuild
+        tree = MerkleTree.from_hex(content_hashes)
+    elif changed or len(tree) != len(ids):
+        tree.apply(len(ids), {i: bytes.fromhex(content_hashes[i]) for i in changed})
+    new_ids = set(ids)
+    if not ids:
+        # nothing new to write; a source that had chunks before is now empty, so every
+        # old chunk (and its manifest) goes
+        skip = manifest is None
+    else:
+        skip = bool(manifest and not plan["retag"] and manifest.get("merkle_root") == tree.root_hex)
+    plan.update(
+        merkle_tree=tree,
+        merkle_root=tree.root_hex,
+        removed=[cid for cid in old if cid not in new_ids],
+        skip=skip,
+    )
+    return plan
+
+
+def _stale_ids(collection, plan: Dict) -> List[str]:
+    if plan["manifest"] is not None:
+        return plan["removed"]
+    # no manifest yet (first run, or data indexed before manifests existed):
+    # anything stored for this source that we aren't about to write is stale
+    existing = collection.get(where={"source": plan["source"]}, include=[])
+    new_ids = set(plan["ids"])
+    return [cid for cid in existing["ids"] if cid not in new_ids]
+
+
+def _plan_result(plan: Dict, deleted: int) -> Dict[str, Optional[str]]:
+    if not plan["ids"] and plan["manifest"] is None:
         return {"added": "0", "merkle_root": None}
+    if plan["skip"]:
+        return {
+            "added": "0",
+            "updated": "0",
+            "deleted": "0",
+            "unchanged": str(len(plan["ids"])),
+            "skipped": "true",
+            "merkle_root": plan["merkle_root"],
+            "collection": plan["collection_name"],
+            "source": plan["source"],
+            "source_type": plan["source_type"]
+        }
+    changed = plan["changed"]
+    old_ids = plan["old"]
+    added = sum(1 for i in changed if plan["ids"][i] not in old_ids)
+    return {
+        "added": str(added),
+        "updated": str(len(changed) - added),
+        "deleted": str(deleted),
+        "unchanged": str(len(plan["unchanged"])),
+        "merkle_root": plan["merkle_root"],
+        "collection": plan["collection_name"],
+        "source": plan["source"],
+        "source_type": plan["source_type"]
+    }
 
-    collection = _ensure_collection(collection_name)
 
-    ids: List[str] = []
-    documents: List[str] = []
-    metadatas: List[Dict[str, str]] = []
-    embeddings: List[List[float]] = []
-    content_hashes: List[str] = []
+def _stream_plan(plan: Dict, chunks: Iterable[Dict], writer: ChromaWriter,
+                 on_commit: Optional[Callable[[Dict[str, Optional[str]]], None]] = None) -> Dict:
+    """Consume a source's chunk stream, embedding its changed chunks one writer batch at
+    a time and handing each batch to the writer as soon as it is embedded. Memory stays at
+    one batch of text plus the ids and hashes of the whole source. Then queue stale-chunk
+    deletes and the manifest/Merkle commit behind them, unless nothing changed. on_commit
+    receives the result dict once the writer has applied everything for this source.
+    Returns the finished plan."""
+    lexical = get_lexical_index()
+    collection_name = plan["collection_name"]
+    try:
+        for positions, texts, metadatas in _changed_windows(plan, chunks, writer.batch_size):
+            # chunk hashes double as embedding cache keys, so unchanged chunks are not re-embedded
+            embeddings = get_embeddings(texts, content_hashes=[plan["content_hashes"][i] for i in positions])
+            window_ids = [plan["ids"][i] for i in positions]
+            writer.upsert(ids=window_ids, documents=texts, metadatas=metadatas, embeddings=embeddings)
+            if lexical is not None:
+                # keep the BM25 index in step with Chroma, batch by batch
+                writer.submit(lambda ids=window_ids, docs=texts: lexical.upsert(collection_name, ids, docs))
+    except Exception:
+        # the manifest won't be written, so chunks it doesn't know about would be orphaned
+        written = [plan["ids"][i] for i in plan["changed"] if plan["ids"][i] not in plan["old"]]
+        try:
+            writer.delete(written)
+            if lexical is not None:
+                writer.submit(lambda: lexical.delete(collection_name, written))
+        except RuntimeError:
+            pass  # the writer itself failed, so nothing more reaches Chroma anyway
+        raise
+
+    _finish_plan(plan)
+    if plan["skip"]:
+        if on_commit is not None:
+            on_commit(_plan_result(plan, 0))
+        return plan
+
+    removed = _stale_ids(writer.collection, plan)
+    writer.delete(removed)
+    changed_ids = [plan["ids"][i] for i in plan["changed"]]
+
+    def commit():
+        if lexical is not None:
+            lexical.delete(collection_name, removed)
+        # collections served from a read-only snapshot pick these up on the next refresh
+        journal_writes(collection_name, changed_ids, removed)
+        # cached retrieval results for this collection are now stale
+        mark_collection_written(collection_name)
+        # manifests only move forward once Chroma has the data they describe
+        if plan["ids"]:
+            save_tree(plan["source"], collection_name, plan["merkle_tree"])
+            save_manifest(plan["source"], collection_name, plan["ids"],
+                          plan["content_hashes"], plan["merkle_root"], metadata=plan["metadata"])
+        else:
+            delete_tree(plan["source"], collection_name)
+            delete_manifest(plan["source"], collection_name)
+        if on_commit is not None:
+            on_commit(_plan_result(plan, len(removed)))
+    writer.submit(commit)
+    return plan
+
+
+def _index_chunks(chunks: Iterable[Dict], source: str, source_type: str,
+                  collection_name: str = DEFAULT_COLLECTION,
+                  write_batch_size: int = DEFAULT_BATCH_SIZE,
+                  metadata: Optional[Dict] = None) -> Dict[str, Optional[str]]:
+    plan = _plan_index(source, source_type, collection_name, metadata)
+    results: List[Dict[str, Optional[str]]] = []
+    collection = _ensure_collection(plan["collection_name"])
+    with ChromaWriter(collection, batch_size=write_batch_size) as writer:
+        _stream_plan(plan, chunks, writer, results.append)
+    if not plan["skip"]:
+        _refresh_snapshot(collection)
+    return results[0]
+
+
+def _refresh_snapshot(collection) -> None:
+    # publish what was just indexed to the collection's read-only snapshot, if it has one
+    if not snapshot_exists(collection.name):
+        return
+    info = refresh_snapshot(collection)
+    if info is not None:
+        mark_collection_written(collection.name)
+        print(f"snapshot {collection.name} {info['version']}: {info['count']} rows "
+              f"({info['copied']} copied, {info['fetched']} fetched)")
 
-    for idx, chunk in enumerate(chunks):
-        emb = get_embedding(chunk)
-        embeddings.append(emb)
-        documents.append(chunk)
-        cid = f"{source}:{idx}"
-        ids.append(cid)
-        metadatas.append({
-            "source": source, 
-            "source_type": source_type,
-            "chunk_index": str(idx)
-        })
-        content_hashes.append(_hash_bytes(chunk.encode("utf-8")))
-
-    #print("embeddings:", embeddings)
-    #print("documents:", documents)
-    #print("metadatas:", metadatas)
-    #print("checky")
-    
-    collection.add(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
 
-    merkle_root = _compute_merkle_root(content_hashes)
+def _index_text(text: str, source: str, source_type: str,
+                collection_name: str = DEFAULT_COLLECTION,
+                chunk_size_words: int = 500,
+                overlap_words: int = 50,
+                chunker: str = "words",
+                chunk_size_tokens: int = 512,
+                overlap_tokens: int = 64,
+                metadata: Optional[Dict] = None) -> Dict[str, Optional[str]]:
+    """Core indexing logic: chunk, embed, and insert text into Chroma.
 
-    return {
-        "added": str(len(ids)),
-        "merkle_root": merkle_root,
-        "source": source,
-        "source_type": source_type
-    }
+    chunker="words" uses fixed word windows, chunker="tokens" packs sentences
+    into a token budget. Re-indexing a source diffs against its manifest:
+    unchanged documents are skipped, changed chunks are upserted and chunks
+    that no longer exist are deleted. `metadata` (protocol, chain, date, ...)
+    is copied onto every chunk, see document_metadata().
+    placeholder for later on-chain anchoring"""
+    chunks = _chunk_source(source, source_type, text, chunker, chunk_size_words, overlap_words,
+                           chunk_size_tokens, overlap_tokens)
+    return _index_chunks(chunks, source, source_type, collection_name, metadata=metadata)
 
 
 def index_pdf(pdf_path: str,
-              collection_name: str = "my_collection",
+              collection_name: str = DEFAULT_COLLECTION,
               chunk_size_words: int = 500,
-              overlap_words: int = 50) -> Dict[str, Optional[str]]:
+              overlap_words: int = 50,
+              chunker: str = "words",
+              chunk_size_tokens: int = 512,
+              overlap_tokens: int = 64,
+              metadata: Optional[Dict] = None) -> Dict[str, Optional[str]]:
     """Extract text from a PDF, chunk, embed, and upsert into Chroma.
 
+    Pages are streamed into the chunker, and each chunk records its page range.
     Returns dict with basic provenance info including optional merkle_root.
     """
-    text = extract_text_from_pdf(pdf_path)
-    return _index_text(text, pdf_path, "pdf", collection_name, chunk_size_words, overlap_words)
+    chunks = _chunk_source(pdf_path, "pdf", None, chunker, chunk_size_words, overlap_words,
+                           chunk_size_tokens, overlap_tokens)
+    return _index_chunks(chunks, pdf_path, "pdf", collection_name, metadata=metadata)
 
 
 def index_url(url: str,
-              collection_name: str = "my_collection", 
+              collection_name: str = DEFAULT_COLLECTION, 
               chunk_size_words: int = 500,
-              overlap_words: int = 50) -> Dict[str, Optional[str]]:
+              overlap_words: int = 50,
+              chunker: str = "words",
+              chunk_size_tokens: int = 512,
+              overlap_tokens: int = 64,
+              metadata: Optional[Dict] = None) -> Dict[str, Optional[str]]:
     """Extract text from a protocol documentation URL, chunk, embed, and upsert into Chroma.
 
     Optimized for technical documentation and protocol blogs.
     Returns dict with basic provenance info including optional merkle_root.
     """
     text = extract_text_from_url(url)
-    return _index_text(text, url, "url", collection_name, chunk_size_words, overlap_words)
+    return _index_text(text, url, "url", collection_name, chunk_size_words, overlap_words,
+                       chunker, chunk_size_tokens, overlap_tokens, metadata)
 
 
 if __name__ == "__main__":
+    from .pipeline import expand_inputs, run_pipeline
 
     parser = argparse.ArgumentParser(description="Index PDF files or protocol documentation URLs into Chroma")
-    parser.add_argument("input", help="Path to a PDF file or URL to protocol documentation")
-    parser.add_argument("--collection", default="my_collection", help="Chroma collection name")
+    parser.add_argument("inputs", nargs="+",
+                        help="PDF files, directories, glob patterns, URLs, or text files listing URLs/paths (one per line)")
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION, help="Chroma collection name")
+    parser.add_argument("--protocol", help="Protocol the documents describe (indexed into its own "
+                                           "collection with SHARD_BY_PROTOCOL=1)")
+    parser.add_argument("--chain", help="Chain the documents apply to, e.g. ethereum")
+    parser.add_argument("--date", help="Document date, YYYY-MM-DD")
     parser.add_argument("--size", type=int, default=500, help="Chunk size in words")
     parser.add_argument("--overlap", type=int, default=50, help="Chunk overlap in words")
+    parser.add_argument("--chunker", choices=CHUNKERS, default="words",
+                        help="words: fixed word windows, tokens: sentence-aligned token budget")
+    parser.add_argument("--size-tokens", type=int, default=512, help="Chunk size in tokens (--chunker tokens)")
+    parser.add_argument("--overlap-tokens", type=int, default=64, help="Chunk overlap in tokens (--chunker tokens)")
+    parser.add_argument("--pdf-workers", type=int, default=os.cpu_count() or 2, help="Processes for PDF extraction")
+    parser.add_argument("--fetch-workers", type=int, default=8, help="Threads for URL fetching")
+    parser.add_argument("--embed-workers", type=int, default=4, help="Threads for embedding")
+    parser.add_argument("--queue-size", type=int, default=16, help="Max documents buffered between stages")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Max records per Chroma write")
     args = parser.parse_args()
 
-    if args.input.startswith(('http://', 'https://')):
-        print(f"Indexing URL: {args.input}")
-        result = index_url(args.input, collection_name=args.collection, chunk_size_words=args.size, overlap_words=args.overlap)
-    else:
-        print(f"Indexing PDF: {args.input}")
-        result = index_pdf(args.input, collection_name=args.collection, chunk_size_words=args.size, overlap_words=args.overlap)
-    
-    print(result)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    sources = expand_inputs(args.inputs)
+    print(f"Indexing {len(sources)} document(s) into '{args.collection}'")
+    results = run_pipeline(sources,
+                           collection_name=args.collection,
+                           chunk_size_words=args.size,
+                           overlap_words=args.overlap,
+                           chunker=args.chunker,
+                           chunk_size_tokens=args.size_tokens,
+                           overlap_tokens=args.overlap_tokens,
+                           pdf_workers=args.pdf_workers,
+                           fetch_workers=args.fetch_workers,
+                           embed_workers=args.embed_workers,
+                           queue_size=args.queue_size,
+                           write_batch_size=args.batch_size,
+                           metadata={"protocol": args.protocol, "chain": args.chain, "date": args.date})
+    for result in results:
+        print(result)
@@ -0,0 +1,72 @@
+# Per-source index manifests.
+# A manifest records what was last written to Chroma for one source (chunk ids, chunk
+# content hashes and the Merkle root) so a re-index can diff against it and only touch
+# the chunks that actually changed.
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+from ..chroma_storage.chroma_config import storage_path
+
+MANIFEST_DIR = os.getenv("INDEX_MANIFEST_DIR", storage_path("manifests"))
+
+
+def source_file(source: str, collection_name: str, suffix: str, manifest_dir: str = MANIFEST_DIR) -> str:
+    # sources are paths/URLs, so name per-source files after a hash of the source
+    name = hashlib.sha256(source.encode("utf-8")).hexdigest()
+    return os.path.join(manifest_dir, collection_name, f"{name}{suffix}")
+
+
+def _manifest_path(source: str, collection_name: str, manifest_dir: str) -> str:
+    return source_file(source, collection_name, ".json", manifest_dir)
+
+
+def load_manifest(source: str, collection_name: str,
+                  manifest_dir: str = MANIFEST_DIR) -> Optional[Dict]:
+    path = _manifest_path(source, collection_name, manifest_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        # a corrupt manifest only costs us a full re-index
+        return None
+
+
+def save_manifest(source: str, collection_name: str, ids: List[str], content_hashes: List[str],
+                  merkle_root: Optional[str], manifest_dir: str = MANIFEST_DIR,
+                  metadata: Optional[Dict] = None) -> None:
+    path = _manifest_path(source, collection_name, manifest_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    manifest = {
+        "source": source,
+        "collection": collection_name,
+        "ids": ids,
+        "content_hashes": content_hashes,
+        "merkle_root": merkle_root,
+        # document-level metadata (protocol, chain, date) the chunks were tagged with
+        "metadata": metadata or {},
+        "updated_at": time.time(),
+    }
+    # write-then-rename so a crash never leaves a half-written manifest behind
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh)
+    os.replace(tmp, path)
+
+
+def delete_manifest(source: str, collection_name: str, manifest_dir: str = MANIFEST_DIR) -> None:
+    try:
+        os.remove(_manifest_path(source, collection_name, manifest_dir))
+    except FileNotFoundError:
+        pass
+
+
+def manifest_hashes(manifest: Optional[Dict]) -> Dict[str, str]:
+    """Map chunk id -> content hash for the chunks a manifest describes."""
+    if not manifest:
+        return {}
+    return dict(zip(manifest.get("ids", []), manifest.get("content_hashes", [])))
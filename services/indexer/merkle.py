@@ -0,0 +1,218 @@
+# Incremental Merkle tree over chunk content hashes.
+# Nodes are raw 32-byte sha256 digests; an odd node at the end of a layer is promoted to
+# the next layer unchanged. (Pairing it with itself would give [A, B, C] and [A, B, C, C]
+# the same root, so a document gaining a copy of its last chunk would look unchanged.)
+# All layers are kept (and persisted next to the source manifest) so a changed chunk only
+# rehashes its path to the root, and inclusion proofs can be served for any indexed chunk.
+import hashlib
+import os
+import struct
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from ..chroma_storage.chroma_config import DEFAULT_COLLECTION
+from .manifest import MANIFEST_DIR, source_file
+
+# MRKL1 files used the duplicate-last-node layout; they fail to load and are rebuilt
+_MAGIC = b"MRKL2"
+_DIGEST = 32
+
+
+def _h(data: bytes) -> bytes:
+    return hashlib.sha256(data).digest()
+
+
+class MerkleTree:
+    def __init__(self, leaves: Sequence[bytes] = ()):
+        self.layers: List[List[bytes]] = [list(leaves)]
+        self._build()
+
+    @classmethod
+    def from_hex(cls, hashes: Sequence[str]) -> "MerkleTree":
+        return cls([bytes.fromhex(h) for h in hashes])
+
+    def _build(self):
+        del self.layers[1:]
+        layer = self.layers[0]
+        while len(layer) > 1:
+            layer = [_h(layer[i] + layer[i + 1]) if i + 1 < len(layer) else layer[i]
+                     for i in range(0, len(layer), 2)]
+            self.layers.append(layer)
+
+    def __len__(self) -> int:
+        return len(self.layers[0])
+
+    @property
+    def root(self) -> Optional[bytes]:
+        return self.layers[-1][0] if self.layers[0] else None
+
+    @property
+    def root_hex(self) -> Optional[str]:
+        root = self.root
+        return root.hex() if root is not None else None
+
+    def _fix_path(self, index: int):
+        # rehash the parents of `index` up to the root, growing/shrinking upper layers
+        level = 0
+        while len(self.layers[level]) > 1:
+            layer = self.layers[level]
+            j = index // 2
+            node = _h(layer[2 * j] + layer[2 * j + 1]) if 2 * j + 1 < len(layer) else layer[2 * j]
+            if level + 1 == len(self.layers):
+                self.layers.append([])
+            parent = self.layers[level + 1]
+            if j < len(parent):
+                parent[j] = node
+            else:
+                parent.append(node)
+            index = j
+            level += 1
+        del self.layers[level + 1:]
+
+    def update(self, index: int, leaf: bytes):
+        """Replace one leaf in O(log n)."""
+        self.layers[0][index] = leaf
+        self._fix_path(index)
+
+    def append(self, leaf: bytes):
+        self.layers[0].append(leaf)
+        self._fix_path(len(self.layers[0]) - 1)
+
+    def truncate(self, size: int):
+        """Drop leaves from `size` on, keeping the rest of the tree."""
+        if size >= len(self):
+            return
+        if size == 0:
+            self.layers = [[]]
+            return
+        expected = size
+        for layer in self.layers:
+            del layer[expected:]
+            expected = (expected + 1) // 2
+        # the new last leaf may have lost its sibling, so its path changes
+        self._fix_path(size - 1)
+
+    def apply(self, size: int, changes: Dict[int, bytes]):
+        """Resize to `size` leaves and set changed leaves. Positions past the current
+        size must all be present in `changes`."""
+        if len(changes) * 4 > max(size, 1):
+            # touching a large share of the leaves: a rebuild is cheaper than many paths
+            leaves = self.layers[0][:size]
+            for i, leaf in changes.items():
+                if i < len(leaves):
+                    leaves[i] = leaf
+            leaves.extend(changes[i] for i in range(len(leaves), size))
+            self.layers = [leaves]
+            self._build()
+            return
+        self.truncate(size)
+        for i in sorted(changes):
+            if i < len(self):
+                self.update(i, changes[i])
+            else:
+                self.append(changes[i])
+
+    def proof(self, index: int) -> List[Tuple[bytes, bool]]:
+        """Sibling path for leaf `index`: (sibling digest, sibling is on the right). Levels
+        where the node is promoted without a sibling are left out."""
+        if not 0 <= index < len(self):
+            raise IndexError(f"leaf {index} out of range for tree of {len(self)} leaves")
+        path = []
+        for layer in self.layers[:-1]:
+            if index % 2 == 0:
+                if index + 1 < len(layer):
+                    path.append((layer[index + 1], True))
+            else:
+                path.append((layer[index - 1], False))
+            index //= 2
+        return path
+
+    def to_bytes(self) -> bytes:
+        out = bytearray(_MAGIC)
+        out += struct.pack("<Q", len(self))
+        for layer in self.layers:
+            for node in layer:
+                out += node
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "MerkleTree":
+        if not data.startswith(_MAGIC):
+            raise ValueError("not a Merkle tree file")
+        offset = len(_MAGIC)
+        (size,) = struct.unpack_from("<Q", data, offset)
+        offset += 8
+        tree = cls.__new__(cls)
+        tree.layers = []
+        width = size
+        while True:
+            end = offset + width * _DIGEST
+            if end > len(data):
+                raise ValueError("truncated Merkle tree file")
+            tree.layers.append([data[i:i + _DIGEST] for i in range(offset, end, _DIGEST)])
+            offset = end
+            if width <= 1:
+                break
+            width = (width + 1) // 2
+        return tree
+
+
+def verify_proof(leaf: bytes, proof: Sequence[Tuple[bytes, bool]], root: bytes) -> bool:
+    node = leaf
+    for sibling, sibling_is_right in proof:
+        node = _h(node + sibling) if sibling_is_right else _h(sibling + node)
+    return node == root
+
+
+def load_tree(source: str, collection_name: str, manifest_dir: str = MANIFEST_DIR) -> Optional[MerkleTree]:
+    path = source_file(source, collection_name, ".merkle", manifest_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as fh:
+            return MerkleTree.from_bytes(fh.read())
+    except (OSError, ValueError, struct.error):
+        # a damaged tree file is rebuilt from the chunk hashes on the next index
+        return None
+
+
+def save_tree(source: str, collection_name: str, tree: MerkleTree, manifest_dir: str = MANIFEST_DIR) -> None:
+    path = source_file(source, collection_name, ".merkle", manifest_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(tree.to_bytes())
+    os.replace(tmp, path)
+
+
+def delete_tree(source: str, collection_name: str, manifest_dir: str = MANIFEST_DIR) -> None:
+    try:
+        os.remove(source_file(source, collection_name, ".merkle", manifest_dir))
+    except FileNotFoundError:
+        pass
+
+
+def prove_chunk(chunk_id: str, collection_name: str = DEFAULT_COLLECTION,
+                manifest_dir: str = MANIFEST_DIR) -> Dict:
+    """Inclusion proof for an indexed chunk id ("{source}:{idx}") against its source's root."""
+    source, _, idx = chunk_id.rpartition(":")
+    index = int(idx)
+    tree = load_tree(source, collection_name, manifest_dir)
+    if tree is None or index >= len(tree):
+        raise KeyError(f"No Merkle tree entry for chunk {chunk_id} in '{collection_name}'")
+    return {
+        "chunk_id": chunk_id,
+        "index": index,
+        "leaf": tree.layers[0][index].hex(),
+        "root": tree.root_hex,
+        "proof": [[sibling.hex(), "right" if is_right else "left"] for sibling, is_right in tree.proof(index)],
+    }
+
+
+def verify_chunk_proof(document: str, proof: Dict, root: Optional[str] = None) -> bool:
+    """Check that `document` is the chunk the proof commits to, under `root`
+    (defaults to the root carried in the proof, e.g. when the root is anchored elsewhere)."""
+    leaf = _h(document.encode("utf-8"))
+    if leaf.hex() != proof["leaf"]:
+        return False
+    path = [(bytes.fromhex(h), side == "right") for h, side in proof["proof"]]
+    return verify_proof(leaf, path, bytes.fromhex(root or proof["root"]))
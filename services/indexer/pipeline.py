@@ -0,0 +1,268 @@
+# Multi-document ingestion pipeline.
+#
+#   inputs ──> extract ──[chunk_q]──> embed ──[ChromaWriter queue]──> writer thread ──> Chroma
+#
+# - extract: PDFs go to a process pool (CPU bound), URLs to a thread pool (I/O bound);
+#            both spool their chunks to a temporary JSON-lines file as they are produced
+#            and hand back its path, so no worker holds a whole document's chunks
+# - embed:   a thread pool streams each spool file, diffs its chunks against the manifest
+#            and embeds the changed ones a writer batch at a time
+# - writer:  a ChromaWriter thread owns the collection and writes size-bounded batches
+#            as embeddings arrive, committing each source's manifest after its data
+# Stages are connected by bounded queues so a slow stage throttles the ones before it.
+import glob
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .indexer import (
+    _chunk_source,
+    _ensure_collection,
+    _plan_index,
+    _refresh_snapshot,
+    _stream_plan,
+    document_metadata,
+    extract_text_from_url,
+    target_collection,
+)
+from ..chroma_storage.chroma_config import DEFAULT_COLLECTION
+from .writer import ChromaWriter, DEFAULT_BATCH_SIZE
+
+_DONE = object()
+
+
+def _is_url(value: str) -> bool:
+    return value.startswith(("http://", "https://"))
+
+
+def _read_list_file(path: str) -> List[str]:
+    entries = []
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                entries.append(line)
+    return entries
+
+
+def expand_inputs(inputs: Iterable[str]) -> List[Tuple[str, str]]:
+    """Resolve CLI inputs into (source, source_type) pairs.
+
+    Accepts URLs, PDF paths, directories (searched recursively for PDFs),
+    glob patterns, and text files listing one URL or path per line.
+    """
+    sources: List[Tuple[str, str]] = []
+    seen = set()
+
+    def add(source: str, source_type: str):
+        if source not in seen:
+            seen.add(source)
+            sources.append((source, source_type))
+
+    pending = list(inputs)
+    while pending:
+        item = pending.pop(0)
+        if _is_url(item):
+            add(item, "url")
+        elif os.path.isdir(item):
+            for path in sorted(glob.glob(os.path.join(item, "**", "*.pdf"), recursive=True)):
+                add(path, "pdf")
+        elif glob.has_magic(item):
+            for path in sorted(glob.glob(item, recursive=True)):
+                if path.lower().endswith(".pdf"):
+                    add(path, "pdf")
+        elif item.lower().endswith(".pdf"):
+            add(item, "pdf")
+        elif os.path.isfile(item):
+            # URL list file; entries may themselves be paths or globs
+            pending[0:0] = _read_list_file(item)
+        else:
+            raise FileNotFoundError(f"Input not found: {item}")
+    return sources
+
+
+class StageStats:
+    """Thread-safe per-stage counters for throughput reporting."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.docs = 0
+        self.chunks = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, chunks: int = 0, error: bool = False):
+        with self._lock:
+            self.docs += 1
+            self.chunks += chunks
+            self.busy_seconds += seconds
+            if error:
+                self.errors += 1
+
+    def summary(self, wall_seconds: float) -> Dict[str, float]:
+        wall = max(wall_seconds, 1e-9)
+        return {
+            "stage": self.name,
+            "docs": self.docs,
+            "chunks": self.chunks,
+            "errors": self.errors,
+            "busy_s": round(self.busy_seconds, 3),
+            "docs_per_s": round(self.docs / wall, 3),
+            "chunks_per_s": round(self.chunks / wall, 3),
+        }
+
+
+def _timed_extract(source: str, source_type: str, chunk_options: Dict) -> Tuple[str, int, float]:
+    # runs inside the worker so the measured time excludes queueing; returns the spool
+    # file path (removed by whoever reads it) and the number of chunks written to it
+    start = time.perf_counter()
+    text = extract_text_from_url(source) if source_type == "url" else None
+    fd, path = tempfile.mkstemp(prefix="index-chunks-", suffix=".jsonl")
+    count = 0
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            for chunk in _chunk_source(source, source_type, text, **chunk_options):
+                fh.write(json.dumps(chunk))
+                fh.write("\n")
+                count += 1
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, count, time.perf_counter() - start
+
+
+def _read_spool(path: str) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            yield json.loads(line)
+
+
+def run_pipeline(sources: List[Tuple[str, str]],
+                 collection_name: str = DEFAULT_COLLECTION,
+                 chunk_size_words: int = 500,
+                 overlap_words: int = 50,
+                 chunker: str = "words",
+                 chunk_size_tokens: int = 512,
+                 overlap_tokens: int = 64,
+                 pdf_workers: int = 2,
+                 fetch_workers: int = 8,
+                 embed_workers: int = 4,
+                 queue_size: int = 16,
+                 write_batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = 1.0,
+                 report: bool = True,
+                 metadata: Optional[Dict] = None) -> List[Dict[str, Optional[str]]]:
+    """Index many documents concurrently. Returns one result dict per source
+    (failed sources carry an "error" key instead of aborting the run).
+    `metadata` (protocol, chain, date) applies to every source in the run."""
+    chunk_q: "queue.Queue" = queue.Queue(maxsize=queue_size)
+    chunk_options = {
+        "chunker": chunker,
+        "chunk_size_words": chunk_size_words,
+        "overlap_words": overlap_words,
+        "chunk_size_tokens": chunk_size_tokens,
+        "overlap_tokens": overlap_tokens,
+    }
+    stats = {name: StageStats(name) for name in ("extract", "embed", "write")}
+    results: List[Dict[str, Optional[str]]] = []
+    errors: List[Dict[str, Optional[str]]] = []
+    results_lock = threading.Lock()
+
+    def fail(source: str, source_type: str, stage: str, exc: Exception):
+        with results_lock:
+            errors.append({"source": source, "source_type": source_type,
+                           "stage": stage, "error": f"{type(exc).__name__}: {exc}"})
+
+    def done(result: Dict[str, Optional[str]], chunks: int, seconds: float = 0.0):
+        stats["write"].record(seconds, chunks=chunks)
+        with results_lock:
+            results.append(result)
+
+    def extract_stage():
+        # cap in-flight extractions so finished documents can't pile up ahead of chunk_q
+        max_in_flight = max(1, pdf_workers + fetch_workers)
+        with ProcessPoolExecutor(max_workers=max(1, pdf_workers)) as pdf_pool, \
+                ThreadPoolExecutor(max_workers=max(1, fetch_workers)) as url_pool:
+            in_flight = {}
+            todo = list(sources)
+            while todo or in_flight:
+                while todo and len(in_flight) < max_in_flight:
+                    source, source_type = todo.pop(0)
+                    pool = pdf_pool if source_type == "pdf" else url_pool
+                    in_flight[pool.submit(_timed_extract, source, source_type,
+                                          chunk_options)] = (source, source_type)
+                finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    source, source_type = in_flight.pop(future)
+                    try:
+                        spool, n_chunks, seconds = future.result()
+                    except Exception as e:
+                        stats["extract"].record(0.0, error=True)
+                        fail(source, source_type, "extract", e)
+                        continue
+                    stats["extract"].record(seconds, chunks=n_chunks)
+                    chunk_q.put((source, source_type, spool))  # blocks when embedders fall behind
+        for _ in range(embed_workers):
+            chunk_q.put(_DONE)
+
+    def embed_stage(writer: ChromaWriter):
+        while True:
+            item = chunk_q.get()
+            if item is _DONE:
+                return
+            source, source_type, spool = item
+            start = time.perf_counter()
+            try:
+                plan = _plan_index(source, source_type, collection_name, metadata)
+                # embedded batches go straight to the writer; its bounded queue
+                # blocks this worker whenever Chroma falls behind
+                _stream_plan(plan, _read_spool(spool), writer,
+                             lambda result, plan=plan: done(result, len(plan["changed"])))
+            except Exception as e:
+                stats["embed"].record(time.perf_counter() - start, error=True)
+                fail(source, source_type, "embed", e)
+                continue
+            finally:
+                os.remove(spool)
+            stats["embed"].record(time.perf_counter() - start, chunks=len(plan["changed"]))
+
+    wall_start = time.perf_counter()
+    # one background writer thread owns all Chroma writes; every source in the run shares
+    # the metadata, so they all go to the same (possibly per-protocol) collection
+    target = target_collection(collection_name, document_metadata(metadata))
+    writer = ChromaWriter(_ensure_collection(target), batch_size=write_batch_size,
+                          max_queued_batches=queue_size, flush_interval=flush_interval)
+    extractor = threading.Thread(target=extract_stage, name="index-extract", daemon=True)
+    embedders = [threading.Thread(target=embed_stage, args=(writer,), name=f"index-embed-{i}", daemon=True)
+                 for i in range(max(1, embed_workers))]
+    embed_workers = len(embedders)
+    extractor.start()
+    for t in embedders:
+        t.start()
+    extractor.join()
+    for t in embedders:
+        t.join()
+    try:
+        writer.close()
+    except RuntimeError as e:
+        # documents whose commit never ran did not make it into Chroma
+        committed = {r.get("source") for r in results}
+        for source, source_type in sources:
+            if source not in committed and not any(err["source"] == source for err in errors):
+                stats["write"].record(0.0, error=True)
+                fail(source, source_type, "write", e.__cause__ or e)
+    _refresh_snapshot(writer.collection)
+
+    wall = time.perf_counter() - wall_start
+    if report:
+        for stage in stats.values():
+            print("stage:", stage.summary(wall))
+        print("writer:", writer.stats())
+        print(f"indexed {len(results)} document(s), {len(errors)} failed in {wall:.2f}s")
+    return results + errors
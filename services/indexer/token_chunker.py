@@ -0,0 +1,172 @@
+# Token-aware chunking.
+# Packs whole sentences into chunks under a token budget, prefers to cut at paragraph
+# boundaries, and carries whole trailing sentences forward as overlap. Each chunk carries
+# its character offsets into the document and its token offsets into the document's
+# sentence token stream.
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import tiktoken
+
+DEFAULT_ENCODING = "cl100k_base"
+
+# a sentence runs to ., ! or ? followed by whitespace, to a blank line (so unpunctuated
+# headings stand alone), or to the end of the unit
+_SENTENCE_RE = re.compile(r"\S.*?(?:[.!?](?=\s)|(?=\n\s*\n)|$)", re.S)
+_PARAGRAPH_BREAK_RE = re.compile(r"\n\s*\n")
+
+# cut early at a paragraph boundary once a chunk is at least this full
+PARAGRAPH_CUT_FILL = 0.75
+
+
+@lru_cache(maxsize=None)
+def get_encoder(encoding_name: str = DEFAULT_ENCODING):
+    """tiktoken encoders are expensive to build; build each one once per process."""
+    return tiktoken.get_encoding(encoding_name)
+
+
+def count_tokens(texts: List[str], encoding_name: str = DEFAULT_ENCODING) -> List[int]:
+    return [len(t) for t in get_encoder(encoding_name).encode_ordinary_batch(texts)]
+
+
+class _Sentence:
+    __slots__ = ("text", "gap", "char_start", "token_start", "tokens", "paragraph_start", "page")
+
+    def __init__(self, text, gap, char_start, token_start, tokens, paragraph_start, page):
+        self.text = text
+        self.gap = gap  # whitespace separating it from the previous sentence
+        self.char_start = char_start
+        self.token_start = token_start
+        self.tokens = tokens
+        self.paragraph_start = paragraph_start
+        self.page = page
+
+    @property
+    def n_tokens(self) -> int:
+        return len(self.tokens)
+
+
+def _iter_sentences(units: Iterable[Tuple[str, Optional[int]]], encoding_name: str) -> Iterator[_Sentence]:
+    # units are pages (or a single whole document) joined by "\n" for char offsets
+    enc = get_encoder(encoding_name)
+    unit_offset = 0
+    token_offset = 0
+    for unit_text, page in units:
+        matches = list(_SENTENCE_RE.finditer(unit_text))
+        # one batched encode per unit instead of one call per sentence
+        encoded = enc.encode_ordinary_batch([m.group(0) for m in matches]) if matches else []
+        prev_end = None
+        for m, tokens in zip(matches, encoded):
+            if prev_end is None:
+                gap = "\n"
+                paragraph_start = True
+            else:
+                gap = unit_text[prev_end:m.start()]
+                paragraph_start = bool(_PARAGRAPH_BREAK_RE.search(gap))
+            yield _Sentence(m.group(0), gap, unit_offset + m.start(), token_offset,
+                            tokens, paragraph_start, page)
+            token_offset += len(tokens)
+            prev_end = m.end()
+        unit_offset += len(unit_text) + 1
+
+
+def _emit(sentences: List[_Sentence]) -> Dict:
+    first, last = sentences[0], sentences[-1]
+    text = first.text + "".join(s.gap + s.text for s in sentences[1:])
+    return {
+        "text": text,
+        "char_start": first.char_start,
+        "char_end": last.char_start + len(last.text),
+        "token_start": first.token_start,
+        "token_end": last.token_start + last.n_tokens,
+        "token_count": sum(s.n_tokens for s in sentences),
+        "page_start": first.page,
+        "page_end": last.page,
+    }
+
+
+def _split_long_sentence(sentence: _Sentence, size_tokens: int, overlap_tokens: int,
+                         encoding_name: str) -> Iterator[Dict]:
+    # a single sentence over budget falls back to fixed token windows
+    _, offsets = get_encoder(encoding_name).decode_with_offsets(sentence.tokens)
+    n = sentence.n_tokens
+    step = size_tokens - overlap_tokens
+    for start in range(0, n, step):
+        end = min(start + size_tokens, n)
+        c_start = offsets[start]
+        c_end = offsets[end] if end < n else len(sentence.text)
+        yield {
+            "text": sentence.text[c_start:c_end],
+            "char_start": sentence.char_start + c_start,
+            "char_end": sentence.char_start + c_end,
+            "token_start": sentence.token_start + start,
+            "token_end": sentence.token_start + end,
+            "token_count": end - start,
+            "page_start": sentence.page,
+            "page_end": sentence.page,
+        }
+        if end == n:
+            break
+
+
+def iter_token_chunks(units: Iterable[Tuple[str, Optional[int]]],
+                      size_tokens: int = 512,
+                      overlap_tokens: int = 64,
+                      encoding_name: str = DEFAULT_ENCODING) -> Iterator[Dict]:
+    """Chunk a stream of (text, page) units into sentence-aligned chunks of at most
+    `size_tokens` tokens. Only the sentences of the current chunk are kept in memory.
+
+    Yields dicts with text, char_start/char_end, token_start/token_end, token_count
+    and page_start/page_end (None when the units carry no page numbers).
+    """
+    if size_tokens <= 0:
+        raise ValueError("size_tokens must > 0")
+    if overlap_tokens < 0 or overlap_tokens >= size_tokens:
+        raise ValueError("overlap_tokens must be >=0 and < size_tokens")
+
+    current: Deque[_Sentence] = deque()
+    current_tokens = 0
+
+    def carry_overlap():
+        # keep whole trailing sentences that fit in the overlap budget
+        tail: Deque[_Sentence] = deque()
+        total = 0
+        for s in reversed(current):
+            if total + s.n_tokens > overlap_tokens:
+                break
+            tail.appendleft(s)
+            total += s.n_tokens
+        if len(tail) == len(current):
+            # never carry the whole chunk, or the next one would just repeat it
+            total -= tail.popleft().n_tokens
+        return tail, total
+
+    for sentence in _iter_sentences(units, encoding_name):
+        if sentence.n_tokens > size_tokens:
+            if current:
+                yield _emit(list(current))
+                current.clear()
+                current_tokens = 0
+            yield from _split_long_sentence(sentence, size_tokens, overlap_tokens, encoding_name)
+            continue
+
+        cut_at_paragraph = (sentence.paragraph_start and current
+                            and current_tokens >= PARAGRAPH_CUT_FILL * size_tokens)
+        if current and (current_tokens + sentence.n_tokens > size_tokens or cut_at_paragraph):
+            yield _emit(list(current))
+            current, current_tokens = carry_overlap()
+            while current and current_tokens + sentence.n_tokens > size_tokens:
+                current_tokens -= current.popleft().n_tokens
+
+        current.append(sentence)
+        current_tokens += sentence.n_tokens
+
+    if current:
+        yield _emit(list(current))
+
+
+def chunk_text_by_tokens(text: str, size_tokens: int = 512, overlap_tokens: int = 64,
+                         encoding_name: str = DEFAULT_ENCODING) -> List[Dict]:
+    return list(iter_token_chunks([(text or "", None)], size_tokens, overlap_tokens, encoding_name))
@@ -0,0 +1,185 @@
+# Background bulk writer for Chroma.
+# Producers hand records to upsert() as soon as they are embedded; the writer cuts them
+# into batches no larger than the client's max batch size and writes them on a single
+# background thread, which also flushes a partial batch once it has sat idle for
+# flush_interval seconds. A bounded queue between the two applies backpressure, so
+# memory stays at a few batches regardless of document size.
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_BATCH_SIZE = 1000
+_STOP = object()
+
+
+def _client_max_batch_size(collection) -> Optional[int]:
+    client = getattr(collection, "_client", None)
+    getter = getattr(client, "get_max_batch_size", None)
+    try:
+        return int(getter()) if getter else None
+    except Exception:
+        return None
+
+
+class ChromaWriter:
+    """Batched, ordered, background writer for one Chroma collection.
+
+    Operations (upserts, deletes and submitted callbacks) run in the order they were
+    issued. flush() blocks until everything issued so far is written; close() flushes
+    and stops the thread. The first write error is re-raised to the caller on the next
+    call, and later operations are skipped so nothing is recorded as written when it
+    wasn't.
+    """
+
+    def __init__(self, collection, batch_size: int = DEFAULT_BATCH_SIZE, max_queued_batches: int = 4,
+                 flush_interval: float = 1.0):
+        limit = _client_max_batch_size(collection)
+        self.collection = collection
+        self.batch_size = max(1, min(batch_size, limit) if limit else batch_size)
+        self.flush_interval = flush_interval
+        self._buffer: Dict[str, list] = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+        # callbacks waiting on buffered records: (records that must be written first, fn)
+        self._callbacks: List[Tuple[int, Callable[[], None]]] = []
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, max_queued_batches))
+        self._error: Optional[BaseException] = None
+        self._closed = False
+
+        self.batches = 0
+        self.records = 0
+        self.deleted = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="chroma-writer", daemon=True)
+        self._thread.start()
+
+    # producer side
+
+    def upsert(self, ids: Sequence[str], documents: Sequence[str],
+               metadatas: Sequence[Dict], embeddings: Sequence) -> None:
+        self._check()
+        with self._lock:
+            self._buffer["ids"].extend(ids)
+            self._buffer["documents"].extend(documents)
+            self._buffer["metadatas"].extend(metadatas)
+            self._buffer["embeddings"].extend(embeddings)
+            while len(self._buffer["ids"]) >= self.batch_size:
+                self._enqueue_buffer(self.batch_size)
+
+    def delete(self, ids: Sequence[str]) -> None:
+        if not ids:
+            return
+        self._check()
+        with self._lock:
+            self._enqueue_buffer()
+            self._queue.put(("delete", list(ids)))
+
+    def submit(self, fn: Callable[[], None]) -> None:
+        """Run `fn` on the writer thread once everything issued before it is written,
+        e.g. to commit a manifest only after its chunks are in Chroma. Does not force
+        a partial batch out, so small documents still share batches."""
+        self._check()
+        with self._lock:
+            self._callbacks.append((len(self._buffer["ids"]), fn))
+
+    def flush(self) -> None:
+        with self._lock:
+            self._enqueue_buffer()
+        self._queue.join()
+        self._check()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self._closed = True
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def __enter__(self) -> "ChromaWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "records": self.records,
+            "deleted": self.deleted,
+            "batch_size": self.batch_size,
+            "flush_ms_total": round(self.flush_seconds_total * 1000, 3),
+            "flush_ms_avg": round(self.flush_seconds_total * 1000 / self.batches, 3) if self.batches else 0.0,
+            "flush_ms_max": round(self.flush_seconds_max * 1000, 3),
+        }
+
+    def _check(self):
+        if self._error is not None:
+            raise RuntimeError("Chroma writer failed") from self._error
+        if self._closed:
+            raise RuntimeError("Chroma writer is closed")
+
+    def _enqueue_buffer(self, limit: Optional[int] = None):
+        # caller holds self._lock
+        n = len(self._buffer["ids"]) if limit is None else min(limit, len(self._buffer["ids"]))
+        ready = [fn for pos, fn in self._callbacks if pos <= n]
+        self._callbacks = [(pos - n, fn) for pos, fn in self._callbacks if pos > n]
+        if not n and not ready:
+            return
+        batch = {key: values[:n] for key, values in self._buffer.items()}
+        for values in self._buffer.values():
+            del values[:n]
+        if n:
+            # one contiguous float32 matrix per batch instead of n separate rows
+            batch["embeddings"] = np.asarray(batch["embeddings"], dtype=np.float32)
+        self._queue.put(("upsert", (batch, ready)))  # blocks while the writer is behind
+
+    # writer thread
+
+    def _run(self):
+        while True:
+            try:
+                op = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                # idle: push out the partial batch. Nothing is queued, and producers need
+                # the lock to queue anything, so buffered records are next in order.
+                with self._lock:
+                    if self._queue.empty():
+                        self._enqueue_buffer()
+                continue
+            try:
+                if op is _STOP:
+                    return
+                if self._error is None:
+                    self._apply(*op)
+            except BaseException as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _apply(self, kind: str, payload):
+        callbacks: List[Callable[[], None]] = []
+        start = time.perf_counter()
+        if kind == "upsert":
+            batch, callbacks = payload
+            if batch["ids"]:
+                self.collection.upsert(**batch)
+                self.records += len(batch["ids"])
+                self._record_latency(time.perf_counter() - start)
+        else:
+            self.collection.delete(ids=payload)
+            self.deleted += len(payload)
+            self._record_latency(time.perf_counter() - start)
+        for fn in callbacks:
+            fn()
+
+    def _record_latency(self, elapsed: float):
+        self.batches += 1
+        self.flush_seconds_total += elapsed
+        self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
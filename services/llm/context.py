@@ -0,0 +1,199 @@
+# Prompt context packing.
+# Retrieved chunks overlap their neighbours (chunk_words_with_overlap repeats 50 words, the
+# token chunker repeats whole sentences), so adjacent chunks from the same source are merged
+# first, using their recorded offsets. The merged segments are then ordered by maximal
+# marginal relevance, so near-duplicate passages don't crowd out other evidence, and packed
+# into a token budget.
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..retriever.encoder import _count_tokens, get_embeddings, get_token_encoder
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_TOP_K = int(os.getenv("CONTEXT_TOP_K", "8"))
+# 1.0 ranks purely by relevance, lower values favour passages unlike those already picked
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+
+# a segment that doesn't fit is cut to the remaining budget only if that leaves this much
+MIN_PARTIAL_TOKENS = 64
+
+
+def _word_overlap(left: List[str], right: List[str]) -> int:
+    # longest suffix of `left` that is also a prefix of `right`, in words. Chunk overlaps
+    # are well under half a chunk, which also keeps repetitive text from over-merging.
+    first = right[0] if right else None
+    for k in range(min(len(left), len(right)) // 2, 0, -1):
+        if left[-k] == first and left[-k:] == right[:k]:
+            return k
+    return 0
+
+
+def _span(prev_meta: Dict, meta: Dict, start_key: str, end_key: str) -> Optional[int]:
+    # overlap implied by recorded positions, when both chunks have them
+    if prev_meta.get(end_key) is None or meta.get(start_key) is None:
+        return None
+    return int(prev_meta[end_key]) - int(meta[start_key])
+
+
+def _new_tail(prev: Dict, chunk: Dict) -> str:
+    """The part of `chunk` not already in `prev`, the chunk before it in the same source.
+    Uses the recorded char/word offsets when they agree with the texts, otherwise the
+    longest repeated run of words."""
+    prev_meta, meta = prev.get("metadata") or {}, chunk.get("metadata") or {}
+    prev_text, text = prev["content"], chunk["content"]
+    k = _span(prev_meta, meta, "char_start", "char_end")
+    if k is not None and 0 <= k <= len(text) and prev_text.endswith(text[:k]):
+        return text[k:]
+    prev_words, words = prev_text.split(), text.split()
+    k = _span(prev_meta, meta, "word_start", "word_end")
+    if k is None or not (0 <= k <= len(words) and prev_words[len(prev_words) - k:] == words[:k]):
+        k = _word_overlap(prev_words, words)
+    return " " + " ".join(words[k:])
+
+
+def _chunk_position(chunk: Dict) -> Tuple[str, Optional[int]]:
+    meta = chunk.get("metadata") or {}
+    source = meta.get("source")
+    index = meta.get("chunk_index")
+    if source is None or index is None:
+        # fall back to the "{source}:{idx}" chunk id
+        source, _, index = str(chunk.get("id", "")).rpartition(":")
+    try:
+        return source, int(index)
+    except (TypeError, ValueError):
+        return str(chunk.get("id", "")), None
+
+
+def merge_adjacent(chunks: Sequence[Dict]) -> List[Dict]:
+    """Merge chunks that are consecutive in the same source into one segment, dropping
+    the text they repeat. Segments keep their member positions so their embeddings can
+    be combined."""
+    positioned = sorted(((_chunk_position(c), i) for i, c in enumerate(chunks)),
+                        key=lambda item: (item[0][0], item[0][1] if item[0][1] is not None else -1))
+    segments: List[Dict] = []
+    for (source, index), i in positioned:
+        chunk = chunks[i]
+        meta = chunk.get("metadata") or {}
+        last = segments[-1] if segments else None
+        if last is not None and index is not None and last["source"] == source and last["last_index"] == index - 1:
+            last["parts"].append(_new_tail(chunks[last["members"][-1]], chunk))
+            last["last_index"] = index
+            last["members"].append(i)
+            if meta.get("page_end") is not None:
+                last["page_end"] = meta["page_end"]
+            continue
+        segments.append({
+            "source": source,
+            "first_index": index,
+            "last_index": index,
+            "parts": [chunk["content"]],
+            "members": [i],
+            "page_start": meta.get("page_start"),
+            "page_end": meta.get("page_end"),
+        })
+    for segment in segments:
+        segment["text"] = "".join(segment.pop("parts")).strip()
+    return segments
+
+
+def mmr_order(query_vec: np.ndarray, vectors: np.ndarray, mmr_lambda: float = CONTEXT_MMR_LAMBDA) -> List[int]:
+    """Indices of `vectors` (unit rows) in maximal-marginal-relevance order."""
+    if not len(vectors):
+        return []
+    relevance = vectors @ query_vec
+    similarity = vectors @ vectors.T
+    order: List[int] = []
+    remaining = list(range(len(vectors)))
+    # most similar already-picked segment per candidate
+    redundancy = np.full(len(vectors), -np.inf, dtype=np.float32)
+    while remaining:
+        scores = [mmr_lambda * relevance[i] - (1 - mmr_lambda) * (redundancy[i] if order else 0.0)
+                  for i in remaining]
+        best = remaining.pop(int(np.argmax(scores)))
+        order.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return order
+
+
+def _unit(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    encoder = get_token_encoder()
+    if encoder is not None:
+        return encoder.decode(encoder.encode(text, disallowed_special=())[:max_tokens])
+    # same chars/4 estimate _count_tokens uses without tiktoken
+    return text[:max(0, (max_tokens - 1) * 4)]
+
+
+def _vectors(query: str, chunks: Sequence[Dict], query_embedding: Optional[np.ndarray]):
+    # reuse the vectors retrieval already has (retrieve_many(..., with_embeddings=True));
+    # only what is missing is embedded
+    missing = [i for i, c in enumerate(chunks) if c.get("embedding") is None]
+    texts = ([query] if query_embedding is None else []) + [chunks[i]["content"] for i in missing]
+    embedded = iter(get_embeddings(texts)) if texts else iter(())
+    if query_embedding is None:
+        query_embedding = next(embedded)
+    fresh = dict(zip(missing, embedded))
+    chunk_vecs = np.stack([np.asarray(fresh[i] if i in fresh else c["embedding"], dtype=np.float32)
+                           for i, c in enumerate(chunks)])
+    return np.asarray(query_embedding, dtype=np.float32), chunk_vecs
+
+
+def select_context(query: str, chunks: Sequence[Dict], token_budget: int = CONTEXT_TOKEN_BUDGET,
+                   mmr_lambda: float = CONTEXT_MMR_LAMBDA,
+                   query_embedding: Optional[np.ndarray] = None) -> List[Dict]:
+    """Merge, diversify and pack retrieved chunks. Returns the chosen segments in MMR
+    order, each with source, chunk index range, pages, text and token count."""
+    chunks = [c for c in chunks if c.get("content")]
+    if not chunks:
+        return []
+    segments = merge_adjacent(chunks)
+
+    query_vec, chunk_vecs = _vectors(query, chunks, query_embedding)
+    query_vec = _unit(query_vec)
+    chunk_vecs = _unit(chunk_vecs)
+    segment_vecs = _unit(np.stack([chunk_vecs[s["members"]].mean(axis=0) for s in segments]))
+
+    packed: List[Dict] = []
+    remaining = token_budget
+    for i in mmr_order(query_vec, segment_vecs, mmr_lambda):
+        segment = segments[i]
+        tokens = _count_tokens(segment["text"])
+        if tokens > remaining:
+            if remaining < MIN_PARTIAL_TOKENS:
+                continue
+            segment["text"] = _truncate(segment["text"], remaining)
+            tokens = _count_tokens(segment["text"])
+            segment["truncated"] = True
+        segment["tokens"] = tokens
+        del segment["members"]
+        packed.append(segment)
+        remaining -= tokens
+        if remaining <= 0:
+            break
+    return packed
+
+
+def _segment_label(segment: Dict) -> str:
+    label = segment["source"]
+    if segment.get("first_index") is not None:
+        first, last = segment["first_index"], segment["last_index"]
+        label += f" chunk {first}" if first == last else f" chunks {first}-{last}"
+    if segment.get("page_start") is not None:
+        start, end = segment["page_start"], segment.get("page_end") or segment["page_start"]
+        label += f", p. {start}" if start == end else f", pp. {start}-{end}"
+    return label
+
+
+def build_context(query: str, chunks: Sequence[Dict], token_budget: int = CONTEXT_TOKEN_BUDGET,
+                  mmr_lambda: float = CONTEXT_MMR_LAMBDA, query_embedding: Optional[np.ndarray] = None) -> str:
+    """Prompt-ready context for `query` from retrieved chunks, within `token_budget`
+    tokens of passage text."""
+    segments = select_context(query, chunks, token_budget, mmr_lambda, query_embedding)
+    return "\n\n".join(f"[{_segment_label(s)}]\n{s['text']}" for s in segments)
@@ -1,15 +1,35 @@
 # pseudo orchestration: accept query and chunks 
-from ..retriever.retriever import retrieve
-from ..log_tracing.trace import get_logs, fetch_abi_from_logs
+from ..retriever.retriever import retrieve_many, warm_up as warm_up_retriever
+from .context import build_context, CONTEXT_TOP_K
+from ..log_tracing.trace import aggregate_protocol_logs, fetch_abi_from_logs
+from ..log_tracing.decoder import compile_abis, describe_abis, summarize_logs
 import json
+import threading
 from ..retriever.encoder import _get_openai_client
-from openai import OpenAI
 
-api_key = _get_openai_client()
-client = OpenAI(api_key=api_key)
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    """OpenAI client, created on first use so importing this module stays cheap."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                _client = OpenAI(api_key=_get_openai_client())
+    return _client
+
+
+def warm_up():
+    """Open the docs collection, load the embedding backend and create the LLM client."""
+    warm_up_retriever()
+    get_llm_client()
+
 
 def llm_generate(prompt):
-    response = client.chat.completions.create(
+    response = get_llm_client().chat.completions.create(
         model="gpt-5",  # or "gpt-4o-mini"
         messages=[
             {"role": "system", "content": "You are an expert blockchain protocol auditor."},
@@ -37,25 +57,32 @@ def run_llm(query, chunks):
     
     
 def protocol_analyze(factory_contract, query):
-    # Retrieve relevant documentation context
-    chunks = retrieve(query)
+    # Retrieve relevant documentation context, merged, diversified and packed into a token budget
+    ranked, query_vecs = retrieve_many([query], top_k=CONTEXT_TOP_K, with_embeddings=True)
+    docs_context = build_context(query, ranked[0], query_embedding=query_vecs[0])
     
-    # Fetch recent on-chain logs for the factory and its deployed contracts
-    logs = get_logs(factory_contract, 21000000)
+    # On-chain logs for the factory, from the local log store (only new blocks are fetched)
+    logs = aggregate_protocol_logs([factory_contract], 21000000)
     
     # For each address in logs, fetch its ABI
     abis = fetch_abi_from_logs(logs)
-    
-    #docs_context = "\n".join(c.get("text", "") for c in chunks)
-    abi_logs = json.dumps(abis, indent=2)
+
+    # Decode the logs once and send per-event aggregates, not raw topics/data or ABI JSON
+    # (without eth-hash the table comes back empty and logs are counted by raw topic0)
+    table = compile_abis(abis)
+    interfaces = json.dumps(describe_abis(abis), indent=2)
+    event_summary = json.dumps(summarize_logs(logs, abis, table), indent=2)
 
     # Build unified context
     context = f"""
     Protocol Docs Context:
-    {chunks}
+    {docs_context}
     
-    ABI from logs data:
-    {abi_logs}
+    Contract interfaces (from verified ABIs):
+    {interfaces}
+
+    Decoded event summary:
+    {event_summary}
     
     """
     
@@ -72,7 +99,8 @@ def protocol_analyze(factory_contract, query):
     response = llm_generate(prompt)
     return response
 
-print("protocol analysis:", protocol_analyze("0x7d2768dE32b0b80b7a3454c06BdAc94A69DDc7A9", "Analyze Aave protocol?" ))
+if __name__ == "__main__":
+    print("protocol analysis:", protocol_analyze("0x7d2768dE32b0b80b7a3454c06BdAc94A69DDc7A9", "Analyze Aave protocol?" ))
     
     
     
@@ -0,0 +1,129 @@
+# Persistent contract ABI cache.
+# Verified ABIs practically never change, so they are kept in SQLite keyed by
+# (chain, address) and fetched from the explorer once. Unverified contracts are cached
+# too (as a negative entry) but expire after ABI_NEGATIVE_TTL so a later verification is
+# picked up. A proxy's entry points at its implementation, whose ABI is stored under its
+# own address and shared by every proxy in front of it; the pointer expires after
+# ABI_PROXY_TTL because proxies get upgraded.
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Sequence, Tuple
+
+from ..chroma_storage.chroma_config import storage_path
+
+ABI_CACHE_PATH = os.getenv("ABI_CACHE_PATH", storage_path("abi_cache.sqlite3"))
+ABI_NEGATIVE_TTL = float(os.getenv("ABI_NEGATIVE_TTL", str(24 * 3600)))
+ABI_PROXY_TTL = float(os.getenv("ABI_PROXY_TTL", str(24 * 3600)))
+
+# sqlite limits the number of bound parameters per statement
+_SQL_CHUNK = 500
+
+# (abi json or None when unverified, implementation address or None)
+AbiEntry = Tuple[Optional[str], Optional[str]]
+
+
+class AbiCache:
+    """On-disk (chain, address) -> (ABI, proxy implementation) store."""
+
+    def __init__(self, path: str = ABI_CACHE_PATH, negative_ttl: float = ABI_NEGATIVE_TTL,
+                 proxy_ttl: float = ABI_PROXY_TTL):
+        self.path = path
+        self.negative_ttl = negative_ttl
+        self.proxy_ttl = proxy_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS abis (
+                   chain TEXT NOT NULL,
+                   address TEXT NOT NULL,
+                   abi TEXT,
+                   implementation TEXT,
+                   fetched_at REAL NOT NULL,
+                   PRIMARY KEY (chain, address)
+               ) WITHOUT ROWID"""
+        )
+        self._conn.commit()
+
+    def _fresh(self, abi: Optional[str], implementation: Optional[str], fetched_at: float, now: float) -> bool:
+        if implementation is not None:
+            return now - fetched_at < self.proxy_ttl
+        if abi is None:
+            return now - fetched_at < self.negative_ttl
+        return True
+
+    def get_many(self, chain: str, addresses: Sequence[str]) -> Dict[str, AbiEntry]:
+        """Unexpired entries for the (lowercased) addresses that have one."""
+        addresses = [a.lower() for a in addresses]
+        found: Dict[str, AbiEntry] = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(addresses), _SQL_CHUNK):
+                part = addresses[i:i + _SQL_CHUNK]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT address, abi, implementation, fetched_at FROM abis "
+                    f"WHERE chain = ? AND address IN ({marks})",
+                    [chain, *part],
+                ).fetchall()
+                for address, abi, implementation, fetched_at in rows:
+                    if self._fresh(abi, implementation, fetched_at, now):
+                        found[address] = (abi, implementation)
+            self.hits += len(found)
+            self.misses += len(set(addresses)) - len(found)
+        return found
+
+    def get(self, chain: str, address: str) -> Optional[AbiEntry]:
+        return self.get_many(chain, [address]).get(address.lower())
+
+    def put(self, chain: str, address: str, abi: Optional[str], implementation: Optional[str] = None) -> None:
+        """Store an ABI (None for an unverified contract) and, for proxies, the implementation."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO abis (chain, address, abi, implementation, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (chain, address.lower(), abi, implementation.lower() if implementation else None, time.time()),
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            entries, verified, proxies = self._conn.execute(
+                "SELECT COUNT(*), COUNT(abi), COUNT(implementation) FROM abis"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "verified": verified,
+            "proxies": proxies,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_cache: Optional[AbiCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_abi_cache() -> Optional[AbiCache]:
+    """Process-wide cache instance, or None when disabled with ABI_CACHE=0."""
+    global _cache
+    if os.getenv("ABI_CACHE", "1") == "0":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AbiCache()
+    return _cache
@@ -0,0 +1,203 @@
+# Shared HTTP client for Blockscout API calls.
+# One pooled requests.Session (keep-alive connections reused across threads), a token
+# bucket per host so concurrent fetchers stay under the explorer's rate limit, retries with
+# jittered exponential backoff on 429/5xx and connection errors, and per-endpoint
+# (module.action) latency and error counters.
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+BLOCKSCOUT_RATE = float(os.getenv("BLOCKSCOUT_RATE", "8"))          # requests/s per host
+BLOCKSCOUT_BURST = int(os.getenv("BLOCKSCOUT_BURST", "10"))
+BLOCKSCOUT_TIMEOUT = float(os.getenv("BLOCKSCOUT_TIMEOUT", "30"))
+BLOCKSCOUT_MAX_RETRIES = int(os.getenv("BLOCKSCOUT_MAX_RETRIES", "4"))
+BLOCKSCOUT_POOL_SIZE = int(os.getenv("BLOCKSCOUT_POOL_SIZE", "16"))
+# first retry waits about this long, doubling per attempt up to _MAX_BACKOFF
+BLOCKSCOUT_BACKOFF = float(os.getenv("BLOCKSCOUT_BACKOFF", "0.5"))
+_MAX_BACKOFF = 30.0
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """`rate` tokens per second, up to `burst` saved; acquire() blocks until one is free."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take a token; returns the seconds spent waiting for it."""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def drain(self) -> None:
+        # the server said we're over its limit: spend the saved burst
+        with self._lock:
+            self._tokens = min(self._tokens, 0.0)
+
+
+class _EndpointStats:
+    __slots__ = ("requests", "errors", "retries", "throttled", "seconds", "max_seconds")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttled = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+
+def _is_rate_limited(res: requests.Response) -> bool:
+    # some explorers answer 200 with {"message": "...rate limit..."} instead of a 429
+    if res.status_code == 429:
+        return True
+    if res.status_code != 200 or "json" not in res.headers.get("Content-Type", ""):
+        return False
+    try:
+        data = res.json()
+    except ValueError:
+        return False
+    text = f"{data.get('message', '')} {data.get('result', '')}" if isinstance(data, dict) else ""
+    return "rate limit" in text.lower()
+
+
+class BlockscoutClient:
+    """Thread-safe GET client for Blockscout-style `?module=...&action=...` APIs."""
+
+    def __init__(self, rate: float = BLOCKSCOUT_RATE, burst: int = BLOCKSCOUT_BURST,
+                 timeout: float = BLOCKSCOUT_TIMEOUT, max_retries: int = BLOCKSCOUT_MAX_RETRIES,
+                 backoff: float = BLOCKSCOUT_BACKOFF, pool_size: int = BLOCKSCOUT_POOL_SIZE):
+        self.rate = rate
+        self.burst = burst
+        self.timeout = timeout
+        self.max_retries = max(0, max_retries)
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(1, pool_size))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._stats: Dict[str, _EndpointStats] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, url: str) -> TokenBucket:
+        host = urlsplit(url).netloc
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _record(self, endpoint: str, seconds: float = 0.0, error: bool = False,
+                retry: bool = False, throttled: bool = False) -> None:
+        with self._lock:
+            stats = self._stats.get(endpoint)
+            if stats is None:
+                stats = self._stats[endpoint] = _EndpointStats()
+            if retry:
+                stats.retries += 1
+                stats.throttled += throttled
+                return
+            stats.requests += 1
+            stats.errors += error
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+
+    def _delay(self, attempt: int, res: Optional[requests.Response]) -> float:
+        retry_after = res.headers.get("Retry-After") if res is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), _MAX_BACKOFF)
+            except ValueError:
+                pass
+        # full jitter: uniform in [0, backoff * 2^attempt]
+        return random.uniform(0, min(_MAX_BACKOFF, self.backoff * 2 ** attempt))
+
+    def get(self, url: str, params: Dict) -> Dict:
+        """GET `url` with `params` and return the decoded JSON body. Retries throttled,
+        5xx and failed connections; raises the last error once retries run out."""
+        endpoint = f"{params.get('module')}.{params.get('action')}"
+        bucket = self._bucket(url)
+        start = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            res = None
+            try:
+                res = self.session.get(url, params=params, timeout=self.timeout)
+                throttled = _is_rate_limited(res)
+                if not throttled and res.status_code not in _RETRY_STATUS:
+                    res.raise_for_status()
+                    data = res.json()
+                    self._record(endpoint, time.perf_counter() - start)
+                    return data
+                if throttled:
+                    bucket.drain()
+                error: Exception = requests.HTTPError(
+                    f"{res.status_code} from {endpoint}" + (" (rate limited)" if throttled else ""), response=res)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                throttled, error = False, e
+            except (requests.HTTPError, ValueError):
+                # 4xx or a body that isn't JSON: retrying won't help
+                self._record(endpoint, time.perf_counter() - start, error=True)
+                raise
+            if attempt == self.max_retries:
+                break
+            self._record(endpoint, retry=True, throttled=throttled)
+            time.sleep(self._delay(attempt, res))
+        self._record(endpoint, time.perf_counter() - start, error=True)
+        raise error
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-endpoint counters; latency covers retries and rate-limit waits."""
+        with self._lock:
+            return {
+                endpoint: {
+                    "requests": s.requests,
+                    "errors": s.errors,
+                    "retries": s.retries,
+                    "throttled": s.throttled,
+                    "avg_ms": round(s.seconds * 1000 / s.requests, 3) if s.requests else 0.0,
+                    "max_ms": round(s.max_seconds * 1000, 3),
+                }
+                for endpoint, s in self._stats.items()
+            }
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_client: Optional[BlockscoutClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> BlockscoutClient:
+    """Process-wide client shared by every Blockscout call."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = BlockscoutClient()
+    return _client
@@ -0,0 +1,194 @@
+# Protocol contract discovery.
+# Starting from a factory, crawl breadth-first: fetch each level's logs and ABIs
+# concurrently, collect the addresses those logs mention (decoded address arguments where
+# the ABI is known, padded topics otherwise), confirm which are contracts and who created
+# them, and descend into the ones created by contracts already in the protocol. Contracts
+# that are only referenced (tokens, oracles, routers) are recorded but not expanded unless
+# asked for, since following them would pull in the logs of half the chain.
+# The resulting graph is saved as JSON per (chain, root) and reused until it goes stale.
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Union
+
+from ..chroma_storage.chroma_config import storage_path
+from .decoder import SelectorTable, compile_abis, referenced_addresses, summarize_logs
+from .trace import (CHAIN, _block, aggregate_protocol_logs, extract_new_contracts,
+                    get_contract_creations, resolve_abis)
+
+PROTOCOL_GRAPH_DIR = os.getenv("PROTOCOL_GRAPH_DIR", storage_path("protocol_graphs"))
+PROTOCOL_GRAPH_TTL = float(os.getenv("PROTOCOL_GRAPH_TTL", str(24 * 3600)))
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "2"))
+# addresses checked against the explorer (and so at most the contracts crawled) per crawl
+CRAWL_MAX_ADDRESSES = int(os.getenv("CRAWL_MAX_ADDRESSES", "200"))
+
+_ADDRESS_RE = re.compile(r"0x[0-9a-f]{40}")
+_ZERO_ADDRESS = "0x" + "0" * 40
+
+
+def _graph_path(root: str, graph_dir: str) -> str:
+    return os.path.join(graph_dir, CHAIN, f"{root.lower()}.json")
+
+
+def load_protocol_graph(root: str, graph_dir: str = PROTOCOL_GRAPH_DIR) -> Optional[Dict]:
+    path = _graph_path(root, graph_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def save_protocol_graph(graph: Dict, graph_dir: str = PROTOCOL_GRAPH_DIR) -> None:
+    path = _graph_path(graph["root"], graph_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(graph, fh)
+    os.replace(tmp, path)
+
+
+def protocol_addresses(graph: Dict) -> List[str]:
+    """The root and every contract the crawl expanded, in crawl order."""
+    return [a for a, node in graph["nodes"].items() if node.get("logs") is not None]
+
+
+def _block_key(value: Union[int, str]) -> Union[int, str]:
+    # 21000000, "21000000" and "0x1406f40" are the same block; named tags stay strings
+    try:
+        return _block(value)
+    except (TypeError, ValueError):
+        return str(value).lower()
+
+
+def _mentions(logs: List[Dict], table: SelectorTable) -> Dict[str, Dict[str, int]]:
+    # candidate address -> {emitting address: times mentioned}
+    mentions: Dict[str, Dict[str, int]] = {}
+    for log in logs:
+        found = referenced_addresses(log, table)
+        if found is None:
+            found = extract_new_contracts([log])
+        emitter = log.get("address", "").lower()
+        for address in found:
+            # decoded arguments come from arbitrary contracts: skip anything malformed
+            if not isinstance(address, str):
+                continue
+            address = address.lower()
+            if _ADDRESS_RE.fullmatch(address) and address not in (emitter, _ZERO_ADDRESS):
+                by_emitter = mentions.setdefault(address, {})
+                by_emitter[emitter] = by_emitter.get(emitter, 0) + 1
+    return mentions
+
+
+def _event_counts(logs: List[Dict], abis: Dict[str, str], table: SelectorTable) -> Dict[str, Dict[str, int]]:
+    counts: Dict[str, Dict[str, int]] = {}
+    summary = summarize_logs(logs, abis, table)
+    for row in summary["events"]:
+        counts.setdefault(row["address"], {})[row["event"]] = row["count"]
+    return counts
+
+
+def crawl_protocol(root: str, from_block: Union[int, str], max_depth: int = CRAWL_MAX_DEPTH,
+                   max_addresses: int = CRAWL_MAX_ADDRESSES, follow_references: bool = False,
+                   refresh: bool = False, graph_dir: str = PROTOCOL_GRAPH_DIR) -> Dict:
+    """Contract graph of the protocol behind `root`. Nodes are contracts (with creator,
+    whether the ABI is verified and, for crawled ones, log and per-event counts); edges
+    say which contract deployed or referenced which. A saved graph younger than
+    PROTOCOL_GRAPH_TTL, from the same block and at least as deep, is returned as is
+    unless `refresh`."""
+    root = root.lower()
+    from_block = _block_key(from_block)
+    cached = None if refresh else load_protocol_graph(root, graph_dir)
+    if cached and cached.get("max_depth", -1) >= max_depth and _block_key(cached.get("from_block")) == from_block \
+            and time.time() - cached.get("crawled_at", 0) < PROTOCOL_GRAPH_TTL:
+        return cached
+
+    nodes: Dict[str, Dict] = {root: {"depth": 0, "kind": "root", "creator": None, "creation_tx": None}}
+    edges: List[Dict] = []
+    protocol = {root}        # the root and the contracts it (transitively) deployed
+    visited = {root}         # every address already checked, contract or not
+    level = [root]
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        for depth in range(max_depth + 1):
+            # logs and ABIs of the whole level at once; each call fans out internally
+            logs_future = pool.submit(aggregate_protocol_logs, level, from_block)
+            abis_future = pool.submit(resolve_abis, level)
+            logs, abis = logs_future.result(), abis_future.result()
+            table = compile_abis(abis)
+            events = _event_counts(logs, abis, table)
+            log_counts: Dict[str, int] = {}
+            for log in logs:
+                emitter = log.get("address", "").lower()
+                log_counts[emitter] = log_counts.get(emitter, 0) + 1
+            verified = {a.lower() for a in abis}
+            for address in level:
+                nodes[address].update(verified=address in verified, logs=log_counts.get(address, 0),
+                                      events=events.get(address, {}))
+            if depth == max_depth:
+                break
+
+            mentions = _mentions(logs, table)
+            candidates = sorted((a for a in mentions if a not in visited),
+                                key=lambda a: -sum(mentions[a].values()))
+            candidates = candidates[:max(0, max_addresses - len(visited))]
+            visited.update(candidates)
+            creations = get_contract_creations(candidates)
+
+            next_level = []
+            for address in candidates:
+                creation = creations.get(address)
+                if creation is None:
+                    continue
+                deployed = creation["creator"] in protocol
+                nodes[address] = {"depth": depth + 1, "kind": "deployed" if deployed else "referenced",
+                                  "creator": creation["creator"], "creation_tx": creation["tx"]}
+                for emitter, count in mentions[address].items():
+                    edges.append({"from": emitter, "to": address, "kind": "referenced", "mentions": count})
+                if deployed:
+                    protocol.add(address)
+                    edges.append({"from": creation["creator"], "to": address, "kind": "deployed"})
+                if deployed or follow_references:
+                    next_level.append(address)
+            if not next_level:
+                break
+            level = next_level
+
+    graph = {
+        "chain": CHAIN,
+        "root": root,
+        "from_block": from_block,
+        "max_depth": max_depth,
+        "crawled_at": time.time(),
+        "nodes": nodes,
+        "edges": edges,
+    }
+    save_protocol_graph(graph, graph_dir)
+    return graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Discover a protocol's contracts from its factory")
+    parser.add_argument("root", help="factory (or any root) contract address")
+    parser.add_argument("--from-block", type=int, default=0)
+    parser.add_argument("--depth", type=int, default=CRAWL_MAX_DEPTH)
+    parser.add_argument("--max-addresses", type=int, default=CRAWL_MAX_ADDRESSES)
+    parser.add_argument("--follow-references", action="store_true",
+                        help="also crawl contracts the protocol didn't deploy")
+    parser.add_argument("--refresh", action="store_true", help="ignore a saved graph")
+    args = parser.parse_args()
+    graph = crawl_protocol(args.root, args.from_block, args.depth, args.max_addresses,
+                           args.follow_references, args.refresh)
+    kinds: Dict[str, int] = {}
+    for node in graph["nodes"].values():
+        kinds[node["kind"]] = kinds.get(node["kind"], 0) + 1
+    print(json.dumps({"nodes": kinds, "edges": len(graph["edges"]),
+                      "crawled": protocol_addresses(graph)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
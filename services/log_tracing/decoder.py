@@ -0,0 +1,427 @@
+# Event log and calldata decoding.
+# Fetched ABIs are compiled once into selector tables: topic0 -> event and 4-byte selector ->
+# function, keyed by the keccak-256 of each canonical signature (hashed once per signature
+# and memoized). Logs are then decoded into named, typed fields and folded into a compact
+# per-event summary (counts, block range, numeric aggregates, distinct addresses), which is
+# what the LLM gets instead of raw topics, data and ABI JSON.
+import json
+import logging
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# distinct values tracked per address field before only "at least" is reported
+_MAX_DISTINCT = 10000
+
+
+# --- keccak-256 ---
+
+def keccak256(data: bytes) -> bytes:
+    """keccak-256 digest (eth-hash, backed by pycryptodome)."""
+    try:
+        from eth_hash.auto import keccak
+    except ImportError as e:
+        raise ImportError("ABI decoding requires `pip install eth-hash[pycryptodome]`") from e
+    return keccak(data)
+
+
+@lru_cache(maxsize=None)
+def event_topic(signature: str) -> str:
+    """topic0 of an event signature such as "Transfer(address,address,uint256)"."""
+    return "0x" + keccak256(signature.encode()).hex()
+
+
+@lru_cache(maxsize=None)
+def function_selector(signature: str) -> str:
+    return "0x" + keccak256(signature.encode()).hex()[:8]
+
+
+# --- ABI compilation ---
+
+def _canonical_type(param: Dict) -> str:
+    kind = param.get("type", "")
+    if kind.startswith("tuple"):
+        inner = ",".join(_canonical_type(c) for c in param.get("components") or [])
+        return f"({inner}){kind[len('tuple'):]}"
+    if kind in ("uint", "int"):
+        return kind + "256"
+    return kind
+
+
+def signature(item: Dict) -> str:
+    return f"{item.get('name', '')}({','.join(_canonical_type(p) for p in item.get('inputs') or [])})"
+
+
+class EventSpec(NamedTuple):
+    name: str
+    signature: str
+    topic: str
+    inputs: Tuple[Dict, ...]
+    indexed: int          # number of indexed inputs, i.e. topics after topic0
+
+
+class FunctionSpec(NamedTuple):
+    name: str
+    signature: str
+    selector: str
+    inputs: Tuple[Dict, ...]
+
+
+@lru_cache(maxsize=1024)
+def _compile_abi(abi_json: str) -> Tuple[Tuple[EventSpec, ...], Tuple[FunctionSpec, ...]]:
+    # keyed by the ABI string, so every proxy sharing an implementation compiles it once
+    events: List[EventSpec] = []
+    functions: List[FunctionSpec] = []
+    for item in json.loads(abi_json):
+        if not isinstance(item, dict):
+            continue
+        inputs = tuple(item.get("inputs") or [])
+        if item.get("type") == "event" and not item.get("anonymous"):
+            sig = signature(item)
+            events.append(EventSpec(item.get("name", ""), sig, event_topic(sig), inputs,
+                                    sum(1 for p in inputs if p.get("indexed"))))
+        elif item.get("type") == "function":
+            sig = signature(item)
+            functions.append(FunctionSpec(item.get("name", ""), sig, function_selector(sig), inputs))
+    return tuple(events), tuple(functions)
+
+
+class SelectorTable:
+    """topic0 -> events and selector -> functions, per contract and across all contracts.
+    An emitter's own ABI is preferred; the shared table decodes logs of contracts without
+    a verified ABI that emit standard events (ERC-20 Transfer and the like)."""
+
+    def __init__(self):
+        self.events: Dict[str, List[EventSpec]] = {}
+        self.functions: Dict[str, FunctionSpec] = {}
+        self.contract_events: Dict[str, Dict[str, List[EventSpec]]] = {}
+        self.contract_functions: Dict[str, Dict[str, FunctionSpec]] = {}
+
+    def add(self, address: str, abi_json: str) -> None:
+        events, functions = _compile_abi(abi_json)
+        own_events = self.contract_events.setdefault(address.lower(), {})
+        own_functions = self.contract_functions.setdefault(address.lower(), {})
+        for spec in events:
+            for table in (own_events, self.events):
+                candidates = table.setdefault(spec.topic, [])
+                if spec not in candidates:
+                    candidates.append(spec)
+        for spec in functions:
+            own_functions[spec.selector] = spec
+            self.functions.setdefault(spec.selector, spec)
+
+    def event(self, address: str, topics: Sequence[str]) -> Optional[EventSpec]:
+        if not topics:
+            return None
+        topic0 = topics[0].lower()
+        # the same signature can differ in which inputs are indexed (ERC-20 vs ERC-721 Transfer)
+        for table in (self.contract_events.get(address.lower(), {}), self.events):
+            for spec in table.get(topic0, ()):
+                if spec.indexed == len(topics) - 1:
+                    return spec
+        return None
+
+    def function(self, selector: str, address: Optional[str] = None) -> Optional[FunctionSpec]:
+        selector = selector.lower()
+        own = self.contract_functions.get(address.lower(), {}) if address else {}
+        return own.get(selector) or self.functions.get(selector)
+
+
+def compile_abis(abis: Dict[str, str]) -> SelectorTable:
+    """Selector table for an address -> ABI JSON mapping, as returned by resolve_abis.
+    Empty (so every log counts as undecoded) when no keccak implementation is installed."""
+    table = SelectorTable()
+    try:
+        for address, abi_json in abis.items():
+            try:
+                table.add(address, abi_json)
+            except (ValueError, TypeError) as e:
+                logger.warning("Skipping unparseable ABI for %s: %s", address, e)
+    except ImportError as e:
+        logger.warning("Log decoding disabled: %s", e)
+        return SelectorTable()
+    return table
+
+
+# --- ABI decoding ---
+
+def _array_element(param: Dict) -> Tuple[Dict, Optional[int]]:
+    # "uint256[3][]" -> ("uint256[3]", None); "uint256[3]" -> ("uint256", 3)
+    kind = param["type"]
+    head, _, size = kind[:-1].rpartition("[")
+    return {**param, "type": head}, int(size) if size else None
+
+
+def _is_dynamic(param: Dict) -> bool:
+    kind = param["type"]
+    if kind in ("bytes", "string"):
+        return True
+    if kind.endswith("]"):
+        element, size = _array_element(param)
+        return size is None or _is_dynamic(element)
+    if kind == "tuple":
+        return any(_is_dynamic(c) for c in param.get("components") or [])
+    return False
+
+
+def _head_size(param: Dict) -> int:
+    if _is_dynamic(param):
+        return 32
+    kind = param["type"]
+    if kind.endswith("]"):
+        element, size = _array_element(param)
+        return size * _head_size(element)
+    if kind == "tuple":
+        return sum(_head_size(c) for c in param.get("components") or [])
+    return 32
+
+
+def _word(data: bytes, offset: int) -> bytes:
+    word = data[offset:offset + 32]
+    if len(word) != 32:
+        raise ValueError(f"ABI data too short at offset {offset}")
+    return word
+
+
+def _decode_elementary(kind: str, word: bytes):
+    if kind.startswith("uint"):
+        return int.from_bytes(word, "big")
+    if kind.startswith("int"):
+        return int.from_bytes(word, "big", signed=True)
+    if kind == "address":
+        return "0x" + word[12:].hex()
+    if kind == "bool":
+        return word[-1] != 0
+    if kind.startswith("bytes"):
+        return "0x" + word[:int(kind[5:])].hex()
+    # fixed/ufixed and anything newer: the raw word
+    return "0x" + word.hex()
+
+
+def _decode_at(param: Dict, data: bytes, start: int):
+    kind = param["type"]
+    if kind.endswith("]"):
+        element, size = _array_element(param)
+        if size is None:
+            size = int.from_bytes(_word(data, start), "big")
+            start += 32
+        return _decode_tuple([element] * size, data, start, named=False)
+    if kind == "tuple":
+        return _decode_tuple(param.get("components") or [], data, start, named=True)
+    if kind in ("bytes", "string"):
+        length = int.from_bytes(_word(data, start), "big")
+        raw = data[start + 32:start + 32 + length]
+        if len(raw) != length:
+            raise ValueError(f"ABI data too short for {kind} of length {length}")
+        return raw.decode("utf-8", "replace") if kind == "string" else "0x" + raw.hex()
+    return _decode_elementary(kind, _word(data, start))
+
+
+def _decode_tuple(params: Sequence[Dict], data: bytes, start: int, named: bool):
+    values = []
+    head = start
+    for param in params:
+        if _is_dynamic(param):
+            values.append(_decode_at(param, data, start + int.from_bytes(_word(data, head), "big")))
+        else:
+            values.append(_decode_at(param, data, head))
+        head += _head_size(param)
+    if named:
+        return {p.get("name") or str(i): v for i, (p, v) in enumerate(zip(params, values))}
+    return values
+
+
+def _hex_bytes(value: Optional[str]) -> bytes:
+    if not value or value == "0x":
+        return b""
+    return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+
+
+def _decode(log: Dict, table: SelectorTable) -> Tuple[Optional[EventSpec], Dict]:
+    topics = [t for t in log.get("topics") or [] if t]
+    spec = table.event(log.get("address", ""), topics)
+    if spec is None:
+        return None, {}
+    unindexed = [p for p in spec.inputs if not p.get("indexed")]
+    data = _decode_tuple(unindexed, _hex_bytes(log.get("data")), 0, named=False)
+    args = {}
+    topic_iter = iter(topics[1:])
+    data_iter = iter(data)
+    for i, param in enumerate(spec.inputs):
+        name = param.get("name") or str(i)
+        if param.get("indexed"):
+            topic = next(topic_iter)
+            kind = param["type"]
+            # strings, bytes, arrays and tuples are indexed by the keccak of their encoding
+            if kind in ("bytes", "string", "tuple") or kind.endswith("]"):
+                args[name] = {"hash": topic}
+            else:
+                args[name] = _decode_elementary(kind, _hex_bytes(topic).rjust(32, b"\0"))
+        else:
+            args[name] = next(data_iter)
+    return spec, args
+
+
+def _block_number(log: Dict) -> int:
+    value = log.get("blockNumber")
+    return int(value, 16) if isinstance(value, str) else int(value or 0)
+
+
+def decode_log(log: Dict, table: SelectorTable) -> Optional[Dict]:
+    """Named, typed arguments of a log, or None when no known event matches it (or its
+    data doesn't fit the event). Indexed strings, bytes, arrays and tuples are only stored
+    hashed, so they come back as {"hash": topic}."""
+    try:
+        spec, args = _decode(log, table)
+    except ValueError:
+        return None
+    if spec is None:
+        return None
+    return {
+        "address": log.get("address", "").lower(),
+        "event": spec.name,
+        "signature": spec.signature,
+        "block": _block_number(log),
+        "tx": log.get("transactionHash"),
+        "args": args,
+    }
+
+
+def referenced_addresses(log: Dict, table: SelectorTable) -> Optional[List[str]]:
+    """Values of the log's address and address[] arguments, or None when the log can't be
+    decoded (the caller then has to guess from the topics)."""
+    try:
+        spec, args = _decode(log, table)
+    except ValueError:
+        return None
+    if spec is None:
+        return None
+    found = []
+    for i, param in enumerate(spec.inputs):
+        value = args[param.get("name") or str(i)]
+        if param["type"] == "address":
+            found.append(value)
+        elif param["type"] == "address[]" and isinstance(value, list):
+            found.extend(value)
+    return found
+
+
+def decode_logs(logs: Iterable[Dict], table: SelectorTable) -> List[Dict]:
+    decoded = (decode_log(log, table) for log in logs)
+    return [d for d in decoded if d is not None]
+
+
+def decode_calldata(calldata: str, table: SelectorTable, address: Optional[str] = None) -> Optional[Dict]:
+    """Function name and arguments of transaction input data, or None when the selector
+    isn't in the table."""
+    raw = _hex_bytes(calldata)
+    if len(raw) < 4:
+        return None
+    spec = table.function("0x" + raw[:4].hex(), address)
+    if spec is None:
+        return None
+    try:
+        args = _decode_tuple(spec.inputs, raw[4:], 0, named=True)
+    except ValueError:
+        return None
+    return {"function": spec.name, "signature": spec.signature, "args": args}
+
+
+# --- summaries ---
+
+class _FieldStats:
+    __slots__ = ("kind", "count", "total", "low", "high", "distinct", "true")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.count = 0
+        self.total = 0
+        self.low = None
+        self.high = None
+        self.distinct = set()
+        self.true = 0
+
+    def add(self, value) -> None:
+        self.count += 1
+        if isinstance(value, bool):
+            self.true += value
+        elif isinstance(value, int):
+            self.total += value
+            self.low = value if self.low is None else min(self.low, value)
+            self.high = value if self.high is None else max(self.high, value)
+        elif self.kind == "address" and len(self.distinct) < _MAX_DISTINCT:
+            self.distinct.add(value)
+
+    def summary(self) -> Dict:
+        if self.kind == "bool":
+            return {"true": self.true, "false": self.count - self.true}
+        if self.low is not None:
+            return {"sum": self.total, "min": self.low, "max": self.high}
+        if self.kind == "address":
+            n = len(self.distinct)
+            return {"distinct": n if n < _MAX_DISTINCT else f"{n}+"}
+        return {}
+
+
+def summarize_logs(logs: Iterable[Dict], abis: Dict[str, str], table: Optional[SelectorTable] = None) -> Dict:
+    """Per (contract, event) counts, block ranges and value aggregates of integer, bool and
+    address arguments, plus counts of undecoded topic0s. Streams the logs once."""
+    table = table or compile_abis(abis)
+    events: Dict[Tuple[str, str], Dict] = {}
+    undecoded: Dict[str, int] = {}
+    total = 0
+    for log in logs:
+        total += 1
+        try:
+            spec, args = _decode(log, table)
+        except ValueError:
+            spec = None
+        if spec is None:
+            topic0 = ((log.get("topics") or [None])[0] or "none").lower()
+            undecoded[topic0] = undecoded.get(topic0, 0) + 1
+            continue
+        block = _block_number(log)
+        key = (log.get("address", "").lower(), spec.signature)
+        entry = events.get(key)
+        if entry is None:
+            entry = events[key] = {
+                "count": 0, "first_block": block, "last_block": block,
+                "fields": {p.get("name") or str(i): _FieldStats(p["type"]) for i, p in enumerate(spec.inputs)},
+            }
+        entry["count"] += 1
+        entry["first_block"] = min(entry["first_block"], block)
+        entry["last_block"] = max(entry["last_block"], block)
+        fields = entry["fields"]
+        for name, value in args.items():
+            fields[name].add(value)
+
+    rows = []
+    for (address, sig), entry in sorted(events.items(), key=lambda item: -item[1]["count"]):
+        fields = {name: stats.summary() for name, stats in entry["fields"].items()}
+        rows.append({
+            "address": address,
+            "event": sig,
+            "count": entry["count"],
+            "first_block": entry["first_block"],
+            "last_block": entry["last_block"],
+            "fields": {name: s for name, s in fields.items() if s},
+        })
+    return {"logs": total, "events": rows,
+            "undecoded": dict(sorted(undecoded.items(), key=lambda item: -item[1]))}
+
+
+def describe_abis(abis: Dict[str, str]) -> Dict[str, Dict[str, List[str]]]:
+    """Event and function signatures per address: the ABIs without their JSON bulk."""
+    described = {}
+    for address, abi_json in abis.items():
+        # signatures only, so this works without a keccak implementation
+        try:
+            items = [item for item in json.loads(abi_json) if isinstance(item, dict)]
+            described[address] = {
+                "events": [signature(i) for i in items if i.get("type") == "event"],
+                "functions": [signature(i) for i in items if i.get("type") == "function"],
+            }
+        except (ValueError, TypeError, AttributeError):
+            continue
+    return described
@@ -1,15 +1,317 @@
-from collections import Counter
-import time
-# For further development, we want to detect protocol behaviour 
-
-def detect_abnormal_event_spikes(logs):
-    topic_counts = Counter(log['topics'][0] for log in logs)
-    for topic, count in topic_counts.items():
-        if count > 1000:  # arbitrary threshold
-            print(f"Unusual spike in event {topic}: {count} occurrences")
-
-def detect_time_gaps(logs):
-    timestamps = sorted(int(log['timeStamp'], 16) for log in logs)
-    for i in range(1, len(timestamps)):
-        if timestamps[i] - timestamps[i-1] > 3600:  # 1 hour gap
-            print(f"Gap detected between blocks at {time.ctime(timestamps[i-1])}")
+# Streaming anomaly detection over event logs.
+# Logs are consumed once, in block order, as numpy column batches (block number, timestamp,
+# topic0), so millions of logs never have to exist as dicts at the same time. Two things
+# are tracked:
+#   - per-topic event rates, counted in fixed time windows and block windows. Each topic's
+#     window counts (including the empty windows between its events) feed an exponentially
+#     weighted mean/variance, and a window whose count is far above that baseline is a spike.
+#   - the time between consecutive active timestamps, on a log scale, with the same kind of
+#     baseline; a silence far longer than usual is a gap.
+# The EWMA recursions are evaluated in closed form over whole batches (see _ewma_before).
+import math
+import os
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+from .log_store import get_log_store
+from .trace import CHAIN, _block, fetch_logs, sync_logs
+
+DETECT_WINDOW_SECONDS = int(os.getenv("DETECT_WINDOW_SECONDS", "3600"))
+DETECT_WINDOW_BLOCKS = int(os.getenv("DETECT_WINDOW_BLOCKS", "300"))
+# weight of the newest window in the baseline; ~2/alpha windows dominate it
+DETECT_ALPHA = float(os.getenv("DETECT_ALPHA", "0.05"))
+DETECT_Z = float(os.getenv("DETECT_Z", "5.0"))
+# windows (or gaps) a series needs before it is scored
+DETECT_WARMUP = int(os.getenv("DETECT_WARMUP", "24"))
+# a spike needs at least this many events in its window, a gap at least this many seconds
+DETECT_MIN_COUNT = int(os.getenv("DETECT_MIN_COUNT", "20"))
+DETECT_MIN_GAP = int(os.getenv("DETECT_MIN_GAP", "600"))
+
+BATCH_LOGS = 5000
+# std floor for log-scale gaps, so a very regular series doesn't flag small jitter
+_MIN_LOG_STD = 0.25
+# keep r^-k (r = 1 - alpha) well inside float64 range when evaluating a batch in closed form
+_MAX_EXPONENT = 300.0
+
+
+class LogBatch(NamedTuple):
+    blocks: np.ndarray   # int64 block numbers, non-decreasing
+    times: np.ndarray    # int64 unix timestamps, -1 when unknown
+    topics: np.ndarray   # topic0 strings ("" when the log has none)
+
+
+class Anomaly(NamedTuple):
+    kind: str                 # "spike" or "gap"
+    axis: str                 # "time" or "block": the unit of start/end
+    topic: Optional[str]      # the event's topic0; None for gaps, which cover all events
+    start: int                # window (spike) or silence (gap) bounds
+    end: int
+    value: float              # events in the window, or the gap length in seconds
+    baseline: float           # what the EWMA baseline expected
+    zscore: float
+
+
+def _hex_int(value) -> int:
+    if value is None or value == "":
+        return -1
+    if isinstance(value, int):
+        return value
+    return int(value, 16) if value.startswith("0x") else int(value)
+
+
+def iter_batches(logs: Iterable[Dict], batch_logs: int = BATCH_LOGS) -> Iterator[LogBatch]:
+    """Column batches from log dicts as returned by the explorer (hex fields)."""
+    blocks: List[int] = []
+    times: List[int] = []
+    topics: List[str] = []
+    for log in logs:
+        blocks.append(_hex_int(log.get("blockNumber")))
+        times.append(_hex_int(log.get("timeStamp")))
+        topics.append(((log.get("topics") or [None])[0] or "").lower())
+        if len(blocks) >= batch_logs:
+            yield LogBatch(np.array(blocks, dtype=np.int64), np.array(times, dtype=np.int64),
+                           np.array(topics, dtype=object))
+            blocks, times, topics = [], [], []
+    if blocks:
+        yield LogBatch(np.array(blocks, dtype=np.int64), np.array(times, dtype=np.int64),
+                       np.array(topics, dtype=object))
+
+
+class _Ewma:
+    """Exponentially weighted mean and mean square of a series sampled at integer positions;
+    positions skipped between samples count as zeros."""
+    __slots__ = ("mean", "sq", "last", "first")
+
+    def __init__(self, first: int):
+        self.mean = 0.0
+        self.sq = 0.0
+        self.last = first - 1   # position the state is current at
+        self.first = first      # position of the first sample
+
+
+def _ewma_before(state: _Ewma, x: np.ndarray, pos: np.ndarray, alpha: float):
+    """Baseline (mean, std, samples) in force just before each sample x[k] at pos[k]
+    (strictly increasing, > state.last), then advance the state past the last sample.
+
+    m(p) = r^(p - p0) * m(p0) + alpha * sum over samples j <= p of r^(p - pos_j) * x_j, with
+    r = 1 - alpha, so a cumulative sum of r^-(pos_j - p0) * x_j gives every m at once.
+    Means are bias-corrected for the zero start, as the baseline of a young series would
+    otherwise be dragged towards zero."""
+    r = 1.0 - alpha
+    span = max(1, int(_MAX_EXPONENT / -math.log(r)))
+    n = len(x)
+    means = np.empty(n)
+    sqs = np.empty(n)
+    i = 0
+    while i < n:
+        base = int(pos[i]) - 1
+        j = int(np.searchsorted(pos, base + span, side="right"))
+        decay = r ** (base - state.last)
+        m0, s0 = state.mean * decay, state.sq * decay
+        rel = (pos[i:j] - base).astype(np.float64)
+        xs = x[i:j].astype(np.float64)
+        w = r ** -rel
+        cm = np.cumsum(w * xs)
+        cs = np.cumsum(w * xs * xs)
+        scale = r ** (rel - 1)
+        means[i:j] = scale * (m0 + alpha * (cm - w * xs))
+        sqs[i:j] = scale * (s0 + alpha * (cs - w * xs * xs))
+        state.mean = r ** rel[-1] * (m0 + alpha * cm[-1])
+        state.sq = r ** rel[-1] * (s0 + alpha * cs[-1])
+        state.last = int(pos[j - 1])
+        i = j
+    samples = pos - state.first
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correction = 1.0 - r ** samples.astype(np.float64)
+        means = np.where(samples > 0, means / correction, 0.0)
+        sqs = np.where(samples > 0, sqs / correction, 0.0)
+    return means, np.sqrt(np.maximum(sqs - means * means, 0.0)), samples
+
+
+class _RateTracker:
+    """Per-topic event counts in fixed windows along one axis (time or block)."""
+
+    def __init__(self, axis: str, window: int, detector: "AnomalyDetector"):
+        self.axis = axis
+        self.window = max(1, window)
+        self.detector = detector
+        self.open: Optional[int] = None          # window still being counted
+        self.pending: Dict[int, int] = {}        # topic id -> count in the open window
+        self.series: Dict[int, _Ewma] = {}
+
+    def update(self, values: np.ndarray, topic_ids: np.ndarray, out: List[Anomaly]) -> None:
+        if not len(values):
+            return
+        windows = values // self.window
+        if self.open is not None:
+            windows = np.maximum(windows, self.open)
+        # tolerate slightly out-of-order timestamps: count them in the current window
+        windows = np.maximum.accumulate(windows)
+        weights = np.ones(len(windows), dtype=np.int64)
+        if self.pending:
+            carried = np.fromiter(self.pending, dtype=np.int64, count=len(self.pending))
+            windows = np.concatenate([np.full(len(carried), self.open, dtype=np.int64), windows])
+            topic_ids = np.concatenate([carried, topic_ids])
+            weights = np.concatenate([np.fromiter(self.pending.values(), dtype=np.int64,
+                                                  count=len(carried)), weights])
+        self.open = int(windows[-1])
+        self._count(windows, topic_ids, weights, out, close_all=False)
+
+    def finish(self, out: List[Anomaly]) -> None:
+        # the last window is partial: it can only under-count, so a spike in it is still real
+        if self.pending:
+            topics = np.fromiter(self.pending, dtype=np.int64, count=len(self.pending))
+            counts = np.fromiter(self.pending.values(), dtype=np.int64, count=len(topics))
+            self._count(np.full(len(topics), self.open, dtype=np.int64), topics, counts, out, close_all=True)
+        self.open = None
+
+    def _count(self, windows, topic_ids, weights, out, close_all: bool) -> None:
+        order = np.lexsort((windows, topic_ids))
+        windows, topic_ids, weights = windows[order], topic_ids[order], weights[order]
+        starts = np.flatnonzero(np.r_[True, (windows[1:] != windows[:-1]) | (topic_ids[1:] != topic_ids[:-1])])
+        group_windows = windows[starts]
+        group_topics = topic_ids[starts]
+        counts = np.add.reduceat(weights, starts)
+
+        closed = np.ones(len(starts), dtype=bool) if close_all else group_windows < self.open
+        self.pending = {int(t): int(c) for t, c in zip(group_topics[~closed], counts[~closed])}
+        group_windows, group_topics, counts = group_windows[closed], group_topics[closed], counts[closed]
+        if not len(group_topics):
+            return
+
+        bounds = np.flatnonzero(np.r_[True, group_topics[1:] != group_topics[:-1], True])
+        d = self.detector
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            topic = int(group_topics[a])
+            pos = group_windows[a:b]
+            state = self.series.get(topic)
+            if state is None:
+                state = self.series[topic] = _Ewma(int(pos[0]))
+            x = counts[a:b]
+            mean, std, samples = _ewma_before(state, x, pos, d.alpha)
+            # Poisson-like floor: a count of k is noisy by about sqrt(k)
+            z = (x - mean) / np.maximum(std, np.sqrt(np.maximum(mean, 1.0)))
+            for k in np.flatnonzero((samples >= d.warmup) & (z >= d.z) & (x >= d.min_count)):
+                w = int(pos[k])
+                out.append(Anomaly("spike", self.axis, d.topic_names[topic], w * self.window,
+                                   (w + 1) * self.window - 1, float(x[k]), float(mean[k]), float(z[k])))
+
+
+class _GapTracker:
+    """Silences between consecutive distinct timestamps, scored on a log scale."""
+
+    def __init__(self, detector: "AnomalyDetector"):
+        self.detector = detector
+        self.last_time: Optional[int] = None
+        self.state = _Ewma(0)
+
+    def update(self, times: np.ndarray, out: List[Anomaly]) -> None:
+        times = times[times >= 0]
+        if not len(times):
+            return
+        if self.last_time is not None:
+            times = np.concatenate([[self.last_time], times])
+        times = np.maximum.accumulate(times)
+        self.last_time = int(times[-1])
+        diffs = np.diff(times)
+        ends = np.flatnonzero(diffs > 0)
+        if not len(ends):
+            return
+        gaps = diffs[ends]
+        x = np.log1p(gaps.astype(np.float64))
+        pos = np.arange(self.state.last + 1, self.state.last + 1 + len(x), dtype=np.int64)
+        d = self.detector
+        mean, std, samples = _ewma_before(self.state, x, pos, d.alpha)
+        z = (x - mean) / np.maximum(std, _MIN_LOG_STD)
+        for k in np.flatnonzero((samples >= d.warmup) & (z >= d.z) & (gaps >= d.min_gap)):
+            i = ends[k]
+            out.append(Anomaly("gap", "time", None, int(times[i]), int(times[i + 1]), float(gaps[k]),
+                               float(np.expm1(mean[k])), float(z[k])))
+
+
+class AnomalyDetector:
+    """Single-pass spike and gap detection. Feed batches in block order with update()
+    (each call returns the anomalies it completed) and call finish() at the end."""
+
+    def __init__(self, window_seconds: int = DETECT_WINDOW_SECONDS, window_blocks: int = DETECT_WINDOW_BLOCKS,
+                 alpha: float = DETECT_ALPHA, z: float = DETECT_Z, warmup: int = DETECT_WARMUP,
+                 min_count: int = DETECT_MIN_COUNT, min_gap: int = DETECT_MIN_GAP):
+        self.alpha = alpha
+        self.z = z
+        self.warmup = warmup
+        self.min_count = min_count
+        self.min_gap = min_gap
+        self.topic_ids: Dict[str, int] = {}
+        self.topic_names: List[str] = []
+        self.logs = 0
+        self._time_rates = _RateTracker("time", window_seconds, self)
+        self._block_rates = _RateTracker("block", window_blocks, self)
+        self._gaps = _GapTracker(self)
+
+    def _intern(self, topics: np.ndarray) -> np.ndarray:
+        names, inverse = np.unique(topics.astype(str), return_inverse=True)
+        ids = np.empty(len(names), dtype=np.int64)
+        for i, name in enumerate(names.tolist()):
+            topic_id = self.topic_ids.get(name)
+            if topic_id is None:
+                topic_id = self.topic_ids[name] = len(self.topic_names)
+                self.topic_names.append(name)
+            ids[i] = topic_id
+        return ids[inverse.reshape(-1)]
+
+    def update(self, batch: Union[LogBatch, Sequence[np.ndarray]]) -> List[Anomaly]:
+        blocks, times, topics = batch
+        if not len(blocks):
+            return []
+        self.logs += len(blocks)
+        topic_ids = self._intern(np.asarray(topics))
+        blocks = np.asarray(blocks, dtype=np.int64)
+        times = np.asarray(times, dtype=np.int64)
+        found: List[Anomaly] = []
+        timed = times >= 0
+        self._time_rates.update(times[timed], topic_ids[timed], found)
+        self._block_rates.update(blocks, topic_ids, found)
+        self._gaps.update(times, found)
+        return found
+
+    def finish(self) -> List[Anomaly]:
+        found: List[Anomaly] = []
+        self._time_rates.finish(found)
+        self._block_rates.finish(found)
+        return found
+
+    def run(self, batches: Iterable[Union[LogBatch, Sequence[np.ndarray]]]) -> List[Anomaly]:
+        """Every anomaly in `batches`, ordered by axis and start."""
+        found: List[Anomaly] = []
+        for batch in batches:
+            found.extend(self.update(batch))
+        found.extend(self.finish())
+        return sorted(found, key=lambda a: (a.axis, a.start, a.kind, a.topic or ""))
+
+
+def detect_anomalies(logs: Iterable[Dict], **settings) -> List[Anomaly]:
+    """Spikes and gaps in a block-ordered iterable of log dicts."""
+    return AnomalyDetector(**settings).run(iter_batches(logs))
+
+
+def detect_protocol_anomalies(contract_addresses: Iterable[str], from_block: Union[int, str],
+                              to_block: Union[int, str] = "latest", **settings) -> List[Anomaly]:
+    """Spikes and gaps in the addresses' logs. With the log store enabled the store is
+    synced and its indexed columns streamed; otherwise the logs are fetched."""
+    contract_addresses = list(contract_addresses)
+    store = get_log_store()
+    if store is None:
+        return detect_anomalies(fetch_logs(contract_addresses, from_block, to_block), **settings)
+    sync_logs(contract_addresses, from_block)
+    end = None if to_block == "latest" else _block(to_block)
+    return AnomalyDetector(**settings).run(
+        store.iter_columns(CHAIN, contract_addresses, from_block=_block(from_block), to_block=end))
+
+
+def detect_abnormal_event_spikes(logs) -> List[Anomaly]:
+    return [a for a in detect_anomalies(logs) if a.kind == "spike"]
+
+
+def detect_time_gaps(logs) -> List[Anomaly]:
+    return [a for a in detect_anomalies(logs) if a.kind == "gap"]
@@ -0,0 +1,209 @@
+# Local event-log store.
+# Logs fetched from the explorer are kept in SQLite, indexed by address, topic0 and block,
+# with a sync cursor per (chain, address) recording which block range is stored. A sync
+# then only fetches blocks past the cursor, and range/topic queries are answered locally.
+# Blocks newer than the confirmation depth at sync time may still be reorganised, so the
+# cursor only counts them as confirmed up to head - depth and the next sync fetches the
+# rest again, replacing what was stored for them.
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..chroma_storage.chroma_config import storage_path
+
+LOG_STORE_PATH = os.getenv("LOG_STORE_PATH", storage_path("log_store.sqlite3"))
+
+# rows fetched from sqlite per batch when iterating a query
+_FETCH_ROWS = 5000
+
+
+class SyncCursor(NamedTuple):
+    start_block: int       # first block stored
+    confirmed_to: int      # last block that can no longer be reorganised
+    synced_to: int         # head block at the last sync
+    synced_at: float       # unix time of the last sync
+
+
+def _hex_int(value) -> int:
+    if value is None or value == "":
+        return 0
+    if isinstance(value, int):
+        return value
+    return int(value, 16) if str(value).startswith("0x") else int(value)
+
+
+class LogStore:
+    """(chain, tx hash, log index) -> log, with sync cursors per address."""
+
+    def __init__(self, path: str = LOG_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS logs (
+                   chain TEXT NOT NULL,
+                   tx_hash TEXT NOT NULL,
+                   log_index INTEGER NOT NULL,
+                   address TEXT NOT NULL,
+                   block_number INTEGER NOT NULL,
+                   topic0 TEXT,
+                   time_stamp INTEGER,
+                   log TEXT NOT NULL,
+                   PRIMARY KEY (chain, tx_hash, log_index)
+               );
+               CREATE INDEX IF NOT EXISTS idx_logs_address ON logs(chain, address, block_number, log_index);
+               CREATE INDEX IF NOT EXISTS idx_logs_topic ON logs(chain, topic0, block_number);
+               CREATE TABLE IF NOT EXISTS sync_cursors (
+                   chain TEXT NOT NULL,
+                   address TEXT NOT NULL,
+                   start_block INTEGER NOT NULL,
+                   confirmed_to INTEGER NOT NULL,
+                   synced_to INTEGER NOT NULL,
+                   synced_at REAL NOT NULL,
+                   PRIMARY KEY (chain, address)
+               );"""
+        )
+        self._conn.commit()
+
+    # sync state
+
+    def cursor(self, chain: str, address: str) -> Optional[SyncCursor]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT start_block, confirmed_to, synced_to, synced_at FROM sync_cursors "
+                "WHERE chain = ? AND address = ?",
+                (chain, address.lower()),
+            ).fetchone()
+        return SyncCursor(*row) if row else None
+
+    def apply(self, chain: str, address: str, logs: Sequence[Dict], replace_from: int,
+              replace_to: Optional[int], cursor: SyncCursor) -> None:
+        """Replace the address's stored logs in [replace_from, replace_to] (open-ended
+        when replace_to is None) with `logs` and move its cursor, in one transaction."""
+        address = address.lower()
+        rows = [(chain, log.get("transactionHash", ""), _hex_int(log.get("logIndex")), address,
+                 _hex_int(log.get("blockNumber")),
+                 ((log.get("topics") or [None])[0] or "").lower() or None,
+                 _hex_int(log.get("timeStamp")) if log.get("timeStamp") else None,
+                 json.dumps(log))
+                for log in logs]
+        with self._lock, self._conn:
+            if replace_to is None:
+                self._conn.execute("DELETE FROM logs WHERE chain = ? AND address = ? AND block_number >= ?",
+                                   (chain, address, replace_from))
+            else:
+                self._conn.execute("DELETE FROM logs WHERE chain = ? AND address = ? "
+                                   "AND block_number BETWEEN ? AND ?",
+                                   (chain, address, replace_from, replace_to))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO logs (chain, tx_hash, log_index, address, block_number, topic0, "
+                "time_stamp, log) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_cursors (chain, address, start_block, confirmed_to, "
+                "synced_to, synced_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (chain, address, *cursor),
+            )
+
+    def touch(self, chain: str, address: str) -> None:
+        """Record a sync that found nothing new."""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE sync_cursors SET synced_at = ? WHERE chain = ? AND address = ?",
+                               (time.time(), chain, address.lower()))
+
+    # queries
+
+    @staticmethod
+    def _where(chain: str, addresses: Optional[Sequence[str]], topic0: Optional[Sequence[str]],
+               from_block: Optional[int], to_block: Optional[int]) -> Tuple[str, List]:
+        clauses, params = ["chain = ?"], [chain]
+        for column, values in (("address", addresses), ("topic0", topic0)):
+            if values is not None:
+                values = [v.lower() for v in values]
+                clauses.append(f"{column} IN ({','.join('?' * len(values))})")
+                params.extend(values)
+        if from_block is not None:
+            clauses.append("block_number >= ?")
+            params.append(from_block)
+        if to_block is not None:
+            clauses.append("block_number <= ?")
+            params.append(to_block)
+        return " AND ".join(clauses), params
+
+    def _iter_rows(self, sql: str, params: List, batch_rows: int) -> Iterator[List[Tuple]]:
+        # a separate cursor per query, so iterating doesn't hold the lock between batches
+        with self._lock:
+            cur = self._conn.execute(sql, params)
+            batch = cur.fetchmany(batch_rows)
+        while batch:
+            yield batch
+            with self._lock:
+                batch = cur.fetchmany(batch_rows)
+
+    def iter_logs(self, chain: str, addresses: Optional[Sequence[str]] = None,
+                  topic0: Optional[Sequence[str]] = None, from_block: Optional[int] = None,
+                  to_block: Optional[int] = None, limit: Optional[int] = None) -> Iterator[Dict]:
+        """Stored logs matching every given condition, in (block, log index) order."""
+        where, params = self._where(chain, addresses, topic0, from_block, to_block)
+        sql = f"SELECT log FROM logs WHERE {where} ORDER BY block_number, log_index"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        for batch in self._iter_rows(sql, params, _FETCH_ROWS):
+            for (log,) in batch:
+                yield json.loads(log)
+
+    def iter_columns(self, chain: str, addresses: Optional[Sequence[str]] = None,
+                     topic0: Optional[Sequence[str]] = None, from_block: Optional[int] = None,
+                     to_block: Optional[int] = None,
+                     batch_rows: int = _FETCH_ROWS) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """The same logs as iter_logs, as (block numbers, timestamps, topic0s) array batches
+        read from the indexed columns without decoding the stored JSON. Missing timestamps
+        are -1 and missing topics ""."""
+        where, params = self._where(chain, addresses, topic0, from_block, to_block)
+        sql = (f"SELECT block_number, COALESCE(time_stamp, -1), COALESCE(topic0, '') FROM logs "
+               f"WHERE {where} ORDER BY block_number, log_index")
+        for batch in self._iter_rows(sql, params, batch_rows):
+            blocks, times, topics = zip(*batch)
+            yield (np.array(blocks, dtype=np.int64), np.array(times, dtype=np.int64),
+                   np.array(topics, dtype=object))
+
+    def query(self, chain: str, addresses: Optional[Sequence[str]] = None,
+              topic0: Optional[Sequence[str]] = None, from_block: Optional[int] = None,
+              to_block: Optional[int] = None, limit: Optional[int] = None) -> List[Dict]:
+        return list(self.iter_logs(chain, addresses, topic0, from_block, to_block, limit))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            logs = self._conn.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+            addresses = self._conn.execute("SELECT COUNT(*) FROM sync_cursors").fetchone()[0]
+        return {"logs": logs, "addresses": addresses}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_store: Optional[LogStore] = None
+_store_lock = threading.Lock()
+
+
+def get_log_store() -> Optional[LogStore]:
+    """Process-wide store instance, or None when disabled with LOG_STORE=0."""
+    global _store
+    if os.getenv("LOG_STORE", "1") == "0":
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = LogStore()
+    return _store
@@ -1,14 +1,42 @@
-import requests
-from web3 import Web3 
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+from .abi_cache import AbiEntry, get_abi_cache
+from .blockscout import get_client
+from .log_store import SyncCursor, get_log_store
 
 #BLOCKSCOUT = "https://eth-sepolia.blockscout.com/api?"
 #FACTORY = "0x76cc67FF2CC77821A70ED14321111Ce381C2594D"
 #BLOCKSCOUT = "https://optimism.blockscout.com/api"     # Optimism
-BLOCKSCOUT = "https://eth.blockscout.com/api"   
+BLOCKSCOUT = os.getenv("BLOCKSCOUT_URL", "https://eth.blockscout.com/api")
 #FACTORY = "0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045" #vitalik address
 #FACTORY = "0x73bFE136fEba2c73F441605752b2B8CAAB6843Ec" # erc contract 
 FACTORY = "0x7d2768dE32b0b80b7a3454c06BdAc94A69DDc7A9" # Aave pool 
 
+# Blockscout returns at most this many logs per getLogs call; a window that comes back
+# full may have been truncated, so it is split and fetched again
+LOGS_RESULT_CAP = int(os.getenv("BLOCKSCOUT_LOGS_CAP", "1000"))
+# initial block range per getLogs call; halved for an address when a window hits the cap,
+# doubled (up to _MAX_WINDOW_GROWTH times this) while windows come back sparse
+LOGS_WINDOW_BLOCKS = int(os.getenv("LOGS_WINDOW_BLOCKS", "50000"))
+_MAX_WINDOW_GROWTH = 8
+# getLogs calls in flight at once, across all windows and addresses
+LOGS_FETCH_WORKERS = int(os.getenv("LOGS_FETCH_WORKERS", "4"))
+# blocks behind the head after which logs are treated as final (reorgs are re-fetched)
+LOG_CONFIRMATIONS = int(os.getenv("LOG_CONFIRMATIONS", "12"))
+# an address synced less than this many seconds ago is served from the store as is
+LOG_SYNC_INTERVAL = float(os.getenv("LOG_SYNC_INTERVAL", "15"))
+# ABI lookups in flight at once for addresses missing from the ABI cache
+ABI_FETCH_WORKERS = int(os.getenv("ABI_FETCH_WORKERS", "8"))
+# cached ABIs are keyed by chain, identified by the explorer host (e.g. eth.blockscout.com)
+CHAIN = urlsplit(BLOCKSCOUT).netloc
+# addresses per getcontractcreation call
+_CREATION_BATCH = 10
+
 """Transaction Logs (Event Logs per Transaction)
 
 Scope: Tied to a specific transaction (Tx hash).
@@ -16,7 +44,14 @@ What events were emitted during that transaction’s execution.
 Inspect what happened during a given function call (Deposit, Borrow, Swap, etc.).
 """
 
-def get_logs(contract_address, from_block, to_block="latest"):
+def get_block_number() -> int:
+    """Latest block number known to the explorer."""
+    params = {"module": "block", "action": "eth_block_number"}
+    return int(get_client().get(BLOCKSCOUT, params)["result"], 16)
+
+
+def _get_logs_window(contract_address: str, from_block: int, to_block: int) -> List[Dict]:
+    # one getLogs call; "No logs found" comes back as status 0 with an empty result
     params = {
         "module": "logs",
         "action": "getLogs",
@@ -24,9 +59,94 @@ def get_logs(contract_address, from_block, to_block="latest"):
         "toBlock": to_block,
         "address": contract_address,
     }
-    res = requests.get(BLOCKSCOUT, params=params)
-    data = res.json().get("result", [])
-    return data
+    data = get_client().get(BLOCKSCOUT, params)
+    result = data.get("result")
+    if not isinstance(result, list):
+        raise RuntimeError(f"getLogs {contract_address} {from_block}-{to_block} failed: "
+                           f"{data.get('message')} {result}")
+    return result
+
+
+def _log_key(log: Dict) -> Tuple[str, int]:
+    return log.get("transactionHash", ""), int(log.get("logIndex") or "0x0", 16)
+
+
+def _log_order(log: Dict) -> Tuple[int, int]:
+    return int(log.get("blockNumber") or "0x0", 16), int(log.get("logIndex") or "0x0", 16)
+
+
+def _block(value: Union[int, str]) -> int:
+    if isinstance(value, str) and value.startswith("0x"):
+        return int(value, 16)
+    return int(value)
+
+
+def fetch_logs(contract_addresses: Iterable[str], from_block: Union[int, str],
+               to_block: Union[int, str] = "latest", window_blocks: int = LOGS_WINDOW_BLOCKS,
+               max_workers: int = LOGS_FETCH_WORKERS) -> List[Dict]:
+    """Logs of every address in [from_block, to_block], complete despite the per-call
+    result cap. The range is walked in block windows fetched concurrently; a window that
+    returns a full page is split in half and fetched again, and each address's window
+    size adapts to how dense its logs are. The merged logs are deduplicated by
+    (transactionHash, logIndex) and sorted by block and log index."""
+    addresses = list(dict.fromkeys(contract_addresses))
+    if not addresses:
+        return []
+    start = _block(from_block)
+    end = get_block_number() if to_block == "latest" else _block(to_block)
+    window_blocks = max(1, window_blocks)
+    max_workers = max(1, max_workers)
+    cursors = {addr: start for addr in addresses}
+    sizes = {addr: window_blocks for addr in addresses}
+    # halves of windows that hit the cap, fetched before any new range
+    split: List[Tuple[str, int, int]] = []
+
+    def next_window() -> Optional[Tuple[str, int, int]]:
+        if split:
+            return split.pop()
+        for addr in addresses:
+            lo = cursors[addr]
+            if lo <= end:
+                hi = min(lo + sizes[addr] - 1, end)
+                cursors[addr] = hi + 1
+                return addr, lo, hi
+        return None
+
+    logs: Dict[Tuple[str, int], Dict] = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        in_flight = {}
+        while True:
+            while len(in_flight) < max_workers:
+                window = next_window()
+                if window is None:
+                    break
+                in_flight[pool.submit(_get_logs_window, *window)] = window
+            if not in_flight:
+                break
+            finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in finished:
+                addr, lo, hi = in_flight.pop(future)
+                result = future.result()
+                if len(result) >= LOGS_RESULT_CAP and hi > lo:
+                    # possibly truncated: fetch both halves, and use smaller windows from here on
+                    mid = (lo + hi) // 2
+                    split.extend([(addr, mid + 1, hi), (addr, lo, mid)])
+                    sizes[addr] = max(1, min(sizes[addr], mid - lo + 1))
+                    continue
+                if len(result) >= LOGS_RESULT_CAP:
+                    print(f"Warning: block {lo} of {addr} has at least {len(result)} logs, "
+                          "results may be truncated")
+                elif len(result) < LOGS_RESULT_CAP // 4:
+                    sizes[addr] = min(sizes[addr] * 2, window_blocks * _MAX_WINDOW_GROWTH)
+                for log in result:
+                    logs[_log_key(log)] = log
+    return sorted(logs.values(), key=_log_order)
+
+
+def get_logs(contract_address, from_block, to_block="latest", window_blocks: int = LOGS_WINDOW_BLOCKS,
+             max_workers: int = LOGS_FETCH_WORKERS):
+    """All logs emitted by `contract_address` from `from_block` to `to_block`, see fetch_logs."""
+    return fetch_logs([contract_address], from_block, to_block, window_blocks, max_workers)
 
 def get_stats(contract_address):
     params = {
@@ -35,9 +155,7 @@ def get_stats(contract_address):
         "contractaddress": contract_address,
     }
     try:
-        r = requests.get(BLOCKSCOUT, params=params, timeout=10)
-        r.raise_for_status()
-        data = r.json()
+        data = get_client().get(BLOCKSCOUT, params)
         if data.get("status") == "1":
             return int(data["result"])
         else:
@@ -47,41 +165,218 @@ def get_stats(contract_address):
         print(f"Request failed: {e}")
         return None
 
-def get_abi(contract_address):
+def _abi_json(value) -> Optional[str]:
+    # unverified contracts come back as a message ("Contract source code not verified")
+    if not isinstance(value, str):
+        return None
+    try:
+        return value if isinstance(json.loads(value), list) else None
+    except ValueError:
+        return None
+
+
+def _fetch_contract(contract_address: str) -> AbiEntry:
+    # getsourcecode gives the ABI and, for proxies, the implementation address in one call
     params = {
         "module": "contract",
-        "action": "getabi",
+        "action": "getsourcecode",
         "address": contract_address
     }
-    res = requests.get(BLOCKSCOUT, params=params)
-    abi_json = res.json().get("result")
-    return abi_json
+    result = get_client().get(BLOCKSCOUT, params).get("result")
+    info = result[0] if isinstance(result, list) and result and isinstance(result[0], dict) else {}
+    implementation = info.get("ImplementationAddress") or info.get("Implementation") or None
+    if not implementation and info.get("ImplementationAddresses"):
+        implementation = info["ImplementationAddresses"][0]
+    implementation = implementation.lower() if implementation else None
+    if implementation == contract_address.lower():
+        implementation = None
+    return _abi_json(info.get("ABI")), implementation
+
+
+def _resolve_entries(addresses: List[str], max_workers: int) -> Dict[str, AbiEntry]:
+    # cache first, then the misses concurrently; failed lookups are left out (not cached)
+    cache = get_abi_cache()
+    entries = cache.get_many(CHAIN, addresses) if cache is not None else {}
+    missing = [a for a in addresses if a not in entries]
+    if not missing:
+        return entries
+
+    def fetch(address: str) -> Tuple[str, Optional[AbiEntry]]:
+        try:
+            entry = _fetch_contract(address)
+        except Exception as e:
+            print(f"ABI lookup failed for {address}: {e}")
+            return address, None
+        if cache is not None:
+            cache.put(CHAIN, address, *entry)
+        return address, entry
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing)))) as pool:
+        entries.update((a, entry) for a, entry in pool.map(fetch, missing) if entry is not None)
+    return entries
+
+
+def _merge_abis(*abis: Optional[str]) -> Optional[str]:
+    # a proxy's own entries (Upgraded, admin functions) plus its implementation's
+    present = [abi for abi in abis if abi]
+    if len(present) < 2:
+        return present[0] if present else None
+    merged = {}
+    for abi in present:
+        for item in json.loads(abi):
+            merged.setdefault(json.dumps(item, sort_keys=True), item)
+    return json.dumps(list(merged.values()))
+
+
+def resolve_abis(contract_addresses: Iterable[str], max_workers: int = ABI_FETCH_WORKERS) -> Dict[str, str]:
+    """ABI JSON per address, for the addresses that have a verified ABI. Served from the
+    ABI cache where possible; misses are fetched concurrently. A proxy gets its
+    implementation's ABI merged with its own, the implementation resolved (and cached)
+    once for every proxy in front of it."""
+    originals = {a.lower(): a for a in contract_addresses}
+    addresses = list(originals)
+    entries = _resolve_entries(addresses, max_workers)
+    implementations = list({impl for _, impl in entries.values() if impl} - set(entries))
+    if implementations:
+        entries.update(_resolve_entries(implementations, max_workers))
 
-def fetch_abi_from_logs(logs_response):
     abis = {}
-    for log in logs_response:
-        addr = log["address"]
-        if addr not in abis: #avoid duplicate api call
-            abi = get_abi(addr)
-            if abi:
-                abis[addr] = abi
-    return abis 
+    for address in addresses:
+        abi, implementation = entries.get(address, (None, None))
+        impl_abi = entries.get(implementation, (None, None))[0] if implementation else None
+        merged = _merge_abis(abi, impl_abi)
+        if merged:
+            abis[originals[address]] = merged
+    return abis
+
+
+def get_abi(contract_address):
+    return resolve_abis([contract_address]).get(contract_address)
+
+def fetch_abi_from_logs(logs_response):
+    # one lookup per distinct emitting address, cached across requests
+    return resolve_abis(log["address"] for log in logs_response)
+
+def topic_address(topic: Optional[str]) -> Optional[str]:
+    """The address in a left-padded 32-byte topic, if it looks like one. Small integers
+    (amounts, ids) are padded the same way, so the address must also not start with 4
+    zero bytes; the rare vanity address that does is missed."""
+    if not topic or len(topic) != 66 or not topic.startswith("0x000000000000000000000000"):
+        return None
+    if topic[26:34] == "00000000":
+        return None
+    return "0x" + topic[-40:].lower()
+
 
 def extract_new_contracts(logs):
-    new_contracts = []
+    # candidates only: callers confirm they are contracts with get_contract_creations
+    new_contracts = set()
     for log in logs:
-        for topic in log["topics"]:
-            if topic.startswith("0x000000000000000000000000"):
-                addr = "0x" + topic[-40:]
-                new_contracts.append(addr)
-    return list(set(new_contracts))
-
-def aggregate_protocol_logs(contract_addresses, from_block):
-    all_logs = []
-    for addr in contract_addresses:
-        logs = get_logs(addr, from_block)
-        all_logs.extend(logs)
-    return all_logs
+        for topic in log["topics"][1:]:
+            addr = topic_address(topic)
+            if addr:
+                new_contracts.add(addr)
+    return list(new_contracts)
+
+
+def get_contract_creations(addresses: Iterable[str], max_workers: int = ABI_FETCH_WORKERS) -> Dict[str, Dict]:
+    """Creator and creation transaction per address, for the addresses that are contracts
+    (accounts without code are left out). Looked up in batches of _CREATION_BATCH."""
+    addresses = list(dict.fromkeys(a.lower() for a in addresses))
+    batches = [addresses[i:i + _CREATION_BATCH] for i in range(0, len(addresses), _CREATION_BATCH)]
+
+    def lookup(batch: List[str]) -> List[Dict]:
+        params = {
+            "module": "contract",
+            "action": "getcontractcreation",
+            "contractaddresses": ",".join(batch),
+        }
+        try:
+            result = get_client().get(BLOCKSCOUT, params).get("result")
+        except Exception as e:
+            print(f"Contract creation lookup failed for {len(batch)} addresses: {e}")
+            return []
+        # "No data found" (no contracts in the batch) comes back as a null or string result
+        return result if isinstance(result, list) else []
+
+    creations: Dict[str, Dict] = {}
+    if not batches:
+        return creations
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as pool:
+        for result in pool.map(lookup, batches):
+            for row in result:
+                if isinstance(row, dict) and row.get("contractAddress"):
+                    creations[row["contractAddress"].lower()] = {
+                        "creator": (row.get("contractCreator") or "").lower() or None,
+                        "tx": row.get("txHash"),
+                    }
+    return creations
+
+def sync_logs(contract_addresses: Iterable[str], from_block: Union[int, str],
+              max_workers: int = LOGS_FETCH_WORKERS) -> int:
+    """Bring the local log store up to the chain head for each address, from `from_block`.
+    Only blocks past an address's sync cursor are fetched (plus, the first time an
+    earlier from_block is asked for, the history before what is stored). Blocks within
+    LOG_CONFIRMATIONS of the head are fetched again on the next sync, so a reorg there
+    replaces the logs stored for them. Returns the number of logs written."""
+    store = get_log_store()
+    start = _block(from_block)
+    now = time.time()
+    # (from, to) block range -> addresses that need it; to=None means "up to the head"
+    ranges: Dict[Tuple[int, Optional[int]], List[str]] = {}
+    cursors: Dict[str, Optional[SyncCursor]] = {}
+    for address in dict.fromkeys(a.lower() for a in contract_addresses):
+        cursor = store.cursor(CHAIN, address)
+        cursors[address] = cursor
+        if cursor is None:
+            ranges.setdefault((start, None), []).append(address)
+            continue
+        if start < cursor.start_block:
+            ranges.setdefault((start, cursor.start_block - 1), []).append(address)
+        if now - cursor.synced_at >= LOG_SYNC_INTERVAL:
+            ranges.setdefault((cursor.confirmed_to + 1, None), []).append(address)
+    if not ranges:
+        return 0
+
+    head = get_block_number()
+    confirmed = head - LOG_CONFIRMATIONS
+    written = 0
+    # backfills first, so an address's cursor start moves before its head range is applied
+    for (lo, hi), addresses in sorted(ranges.items(), key=lambda item: item[0][1] is None):
+        if lo > (head if hi is None else hi):
+            for address in addresses:
+                store.touch(CHAIN, address)
+            continue
+        logs = fetch_logs(addresses, lo, head if hi is None else hi, max_workers=max_workers)
+        by_address: Dict[str, List[Dict]] = {a: [] for a in addresses}
+        for log in logs:
+            by_address.setdefault(log.get("address", "").lower(), []).append(log)
+        for address in addresses:
+            prev = cursors[address]
+            if hi is None:
+                cursor = SyncCursor(min(lo, prev.start_block) if prev else lo,
+                                    max(lo - 1, confirmed), head, time.time())
+            else:
+                cursor = prev._replace(start_block=lo)
+            store.apply(CHAIN, address, by_address[address], lo, hi, cursor)
+            cursors[address] = cursor
+            written += len(by_address[address])
+    return written
+
+
+def aggregate_protocol_logs(contract_addresses, from_block, to_block="latest",
+                            max_workers: int = LOGS_FETCH_WORKERS):
+    """Logs of all the addresses, sorted by block and log index. Served from the local
+    log store after syncing it (only new blocks are fetched); fetched directly, every
+    address's block windows sharing one bounded pool of getLogs calls, when the store is
+    disabled with LOG_STORE=0."""
+    contract_addresses = list(contract_addresses)
+    store = get_log_store()
+    if store is None:
+        return fetch_logs(contract_addresses, from_block, to_block, max_workers=max_workers)
+    sync_logs(contract_addresses, from_block, max_workers)
+    return store.query(CHAIN, contract_addresses, from_block=_block(from_block),
+                       to_block=None if to_block == "latest" else _block(to_block))
 
 #print("Detected new contracts:", contracts)
 #print("get logs:", get_logs(FACTORY, 21000000))
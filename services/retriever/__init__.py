@@ -5,7 +5,17 @@ Vector search and embedding services for the blockchain RAG system.
 Handles ChromaDB operations and embedding generation.
 """
 
-from .retriever import retrieve
-from .encoder import get_embedding
+from .retriever import retrieve, retrieve_many
+from .encoder import get_embedding, get_embeddings
+from .backends import EmbeddingBackend, register_backend, get_backend, available_backends
 
-__all__ = ["retrieve", "get_embedding"]
+__all__ = [
+    "retrieve",
+    "retrieve_many",
+    "get_embedding",
+    "get_embeddings",
+    "EmbeddingBackend",
+    "register_backend",
+    "get_backend",
+    "available_backends"
+]
@@ -0,0 +1,239 @@
+# Embedding backend registry.
+# A backend turns a batch of texts into a float32 matrix. The active backend is picked by
+# the EMBEDDING_BACKEND env var; collections record which backend built them so vectors
+# from a different model/dimension are never mixed into the same collection.
+import hashlib
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+_REGISTRY: Dict[str, Callable[[], "EmbeddingBackend"]] = {}
+_instances: Dict[str, "EmbeddingBackend"] = {}
+_instances_lock = threading.Lock()
+
+
+class EmbeddingBackend:
+    """Base class; subclasses set name/model/dimension and implement embed()."""
+    name = "base"
+    model = ""
+    dimension = 0
+    # request limits used by the encoder when batching
+    max_batch_size = 256
+    max_batch_tokens: Optional[int] = None
+
+    @property
+    def model_id(self) -> str:
+        # identifies the vector space; used for cache keys and collection checks
+        return f"{self.name}/{self.model}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into a (len(texts), dimension) float32 matrix, rows in input order."""
+        raise NotImplementedError
+
+    def is_transient(self, error: Exception) -> bool:
+        """True for failures worth retrying unchanged (rate limits, timeouts, 5xx)."""
+        return isinstance(error, (ConnectionError, TimeoutError))
+
+    def is_input_error(self, error: Exception) -> bool:
+        """True when the request was rejected because of one of its inputs (e.g. a text
+        over the context length), so a smaller batch may succeed."""
+        return False
+
+
+def register_backend(name: str):
+    """Decorator adding a backend class (or zero-argument factory) to the registry."""
+    def decorator(factory):
+        _REGISTRY[name] = factory
+        return factory
+    return decorator
+
+
+def available_backends() -> List[str]:
+    return sorted(_REGISTRY)
+
+
+def default_backend_name() -> str:
+    name = os.getenv("EMBEDDING_BACKEND")
+    if name:
+        return name
+    # no explicit choice: use OpenAI when a key is configured, otherwise stay offline
+    return "openai" if os.getenv("OPENAI_API_KEY") else "hashing"
+
+
+def get_backend(name: Optional[str] = None) -> EmbeddingBackend:
+    """Return the (cached) backend instance for `name`, or the configured default."""
+    name = name or default_backend_name()
+    if name not in _REGISTRY:
+        raise ValueError(f"Unknown embedding backend {name!r}; available: {available_backends()}")
+    backend = _instances.get(name)
+    if backend is None:
+        with _instances_lock:
+            backend = _instances.get(name)
+            if backend is None:
+                backend = _REGISTRY[name]()
+                _instances[name] = backend
+    return backend
+
+
+@register_backend("openai")
+class OpenAIBackend(EmbeddingBackend):
+    name = "openai"
+    # OpenAI embedding request limits: at most 2048 inputs and ~300k tokens per request
+    max_batch_size = 2048
+    max_batch_tokens = 300_000
+    _DIMENSIONS = {
+        "text-embedding-3-small": 1536,
+        "text-embedding-3-large": 3072,
+        "text-embedding-ada-002": 1536,
+    }
+
+    def __init__(self, model: Optional[str] = None):
+        from openai import OpenAI
+        from .encoder import _get_openai_client
+
+        self.model = model or os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+        self.dimension = self._DIMENSIONS.get(self.model, 0)
+        self.client = OpenAI(api_key=_get_openai_client())
+
+    @property
+    def model_id(self) -> str:
+        # bare model name, matching cache entries written before backends existed
+        return self.model
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        resp = self.client.embeddings.create(model=self.model, input=texts)
+        # the API tags each result with its input index; don't rely on response order
+        ordered = sorted(resp.data, key=lambda d: d.index)
+        matrix = np.asarray([d.embedding for d in ordered], dtype=np.float32)
+        if not self.dimension:
+            self.dimension = matrix.shape[1]
+        return matrix
+
+    def is_transient(self, error: Exception) -> bool:
+        import openai
+
+        if isinstance(error, openai.RateLimitError):
+            # an exhausted quota answers 429 too, but waiting won't fix it
+            return getattr(error, "code", None) != "insufficient_quota"
+        if isinstance(error, (openai.APIConnectionError, openai.InternalServerError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code in (408, 409) or error.status_code >= 500
+        return super().is_transient(error)
+
+    def is_input_error(self, error: Exception) -> bool:
+        import openai
+
+        if not isinstance(error, openai.BadRequestError):
+            return False
+        return getattr(error, "code", None) == "context_length_exceeded" or \
+            "maximum context length" in str(error)
+
+
+@register_backend("sentence-transformers")
+class SentenceTransformerBackend(EmbeddingBackend):
+    name = "sentence-transformers"
+    max_batch_size = 64
+
+    def __init__(self, model: Optional[str] = None):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise RuntimeError(
+                "sentence-transformers backend requires `pip install sentence-transformers`"
+            ) from e
+        self.model = model or os.getenv("LOCAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+        self._model = SentenceTransformer(self.model, device="cpu")
+        self.dimension = self._model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self._model.encode(texts, batch_size=self.max_batch_size,
+                                     convert_to_numpy=True, show_progress_bar=False)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]+|0x[0-9a-f]+")
+
+
+@lru_cache(maxsize=1 << 16)
+def _feature_slot(feature: str, dimension: int):
+    # stable across processes, unlike hash(); sign bit reduces collision bias
+    digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+    return digest % dimension, 1.0 if (digest >> 63) & 1 else -1.0
+
+
+@register_backend("hashing")
+class HashingBackend(EmbeddingBackend):
+    """Signed feature hashing of word unigrams and bigrams with log TF, L2-normalised.
+
+    Needs no model download or network, so it works offline and in tests. Quality is
+    lexical only, well below a neural model.
+    """
+    name = "hashing"
+    max_batch_size = 1024
+
+    def __init__(self, dimension: Optional[int] = None):
+        self.dimension = dimension or int(os.getenv("HASHING_EMBEDDING_DIM", "384"))
+        self.model = f"unigram-bigram-{self.dimension}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = _TOKEN_RE.findall(text.lower())
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            for feature in features:
+                slot, sign = _feature_slot(feature, self.dimension)
+                matrix[row, slot] += sign
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (matrix / norms).astype(np.float32, copy=False)
+
+
+def collection_backend_metadata(backend: EmbeddingBackend) -> Dict[str, object]:
+    return {
+        "embedding_backend": backend.name,
+        "embedding_model": backend.model_id,
+        "embedding_dim": backend.dimension,
+    }
+
+
+def ensure_collection_backend(collection, backend: Optional[EmbeddingBackend] = None):
+    """Reject collections built with a different embedding backend or dimension.
+
+    Collections without backend metadata (created before it was recorded) are adopted
+    once their stored vectors are checked against the backend's dimension.
+    """
+    backend = backend or get_backend()
+    if not backend.dimension:
+        # model not in the known-dimension table: ask it once
+        backend.dimension = int(backend.embed(["dimension probe"]).shape[1])
+    expected = collection_backend_metadata(backend)
+    meta = collection.metadata or {}
+    if "embedding_model" in meta:
+        if meta.get("embedding_model") != expected["embedding_model"] or \
+                int(meta.get("embedding_dim", 0)) != int(expected["embedding_dim"]):
+            raise ValueError(
+                f"Collection '{collection.name}' was built with {meta.get('embedding_model')} "
+                f"(dim {meta.get('embedding_dim')}) but the active embedding backend is "
+                f"{expected['embedding_model']} (dim {expected['embedding_dim']}). "
+                "Set EMBEDDING_BACKEND to match or index into a different collection."
+            )
+        return collection
+
+    sample = collection.get(limit=1, include=["embeddings"])
+    stored = sample.get("embeddings")
+    if stored is not None and len(stored) and backend.dimension and len(stored[0]) != backend.dimension:
+        raise ValueError(
+            f"Collection '{collection.name}' holds {len(stored[0])}-dim vectors but the active "
+            f"embedding backend {expected['embedding_model']} produces {backend.dimension}-dim vectors."
+        )
+    # hnsw:* keys are creation-time settings: passing them back to modify() is rejected
+    # ("changing the distance function ... is not supported") even when unchanged
+    kept = {k: v for k, v in meta.items() if not k.startswith("hnsw:")}
+    collection.modify(metadata={**kept, **expected})
+    return collection
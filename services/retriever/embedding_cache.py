@@ -0,0 +1,194 @@
+# Content-addressed embedding cache.
+# Vectors are keyed by (model name, sha256 of the embedded text) so identical chunks are
+# embedded once across re-indexes and repeated queries. Stored as packed blobs in SQLite
+# (float32, or quantized float16/int8 to fit more vectors in the same budget), evicted
+# least-recently-used once the cache grows past its size limit. Reads always return
+# float32 numpy vectors.
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from ..chroma_storage.chroma_config import storage_path
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", storage_path("embedding_cache.sqlite3"))
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# float32 (exact), float16 (half size) or int8 (quarter size, per-vector scale)
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32")
+
+# sqlite limits the number of bound parameters per statement
+_SQL_CHUNK = 500
+
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
+
+def _pack(vector, dtype: str = "float32") -> bytes:
+    vec = np.asarray(vector, dtype=np.float32)
+    if dtype == "float16":
+        return vec.astype(np.float16).tobytes()
+    if dtype == "int8":
+        # symmetric per-vector quantization; the float32 scale leads the blob
+        scale = float(np.abs(vec).max()) / 127.0 if vec.size else 0.0
+        q = np.round(vec / scale) if scale else np.zeros_like(vec)
+        return np.float32(scale).tobytes() + q.astype(np.int8).tobytes()
+    return vec.tobytes()
+
+
+def _unpack(blob: bytes, dtype: str = "float32") -> np.ndarray:
+    if dtype == "float16":
+        return np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+    if dtype == "int8":
+        scale = np.frombuffer(blob[:4], dtype=np.float32)[0]
+        return np.frombuffer(blob[4:], dtype=np.int8).astype(np.float32) * scale
+    # copy so callers get a writable array that doesn't pin the sqlite blob
+    return np.frombuffer(blob, dtype=np.float32).copy()
+
+
+class EmbeddingCache:
+    """On-disk (model, content hash) -> vector store with LRU eviction."""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_bytes: int = EMBEDDING_CACHE_MAX_BYTES,
+                 dtype: str = EMBEDDING_CACHE_DTYPE):
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported cache dtype {dtype!r}; expected one of {STORAGE_DTYPES}")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                   model TEXT NOT NULL,
+                   content_hash TEXT NOT NULL,
+                   vector BLOB NOT NULL,
+                   last_access REAL NOT NULL,
+                   PRIMARY KEY (model, content_hash)
+               )"""
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")}
+        if "dtype" not in columns:
+            # caches written before quantization support hold plain float32 blobs
+            self._conn.execute("ALTER TABLE embeddings ADD COLUMN dtype TEXT NOT NULL DEFAULT 'float32'")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_access ON embeddings(last_access)")
+        self._conn.commit()
+        row = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+        self._total_bytes = int(row[0])
+
+    def get_many(self, model: str, content_hashes: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Return the cached float32 vectors for the given hashes; misses are simply absent."""
+        found: Dict[str, np.ndarray] = {}
+        unique = list(dict.fromkeys(content_hashes))
+        with self._lock:
+            for i in range(0, len(unique), _SQL_CHUNK):
+                part = unique[i:i + _SQL_CHUNK]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT content_hash, vector, dtype FROM embeddings WHERE model = ? AND content_hash IN ({marks})",
+                    [model, *part],
+                ).fetchall()
+                for content_hash, blob, dtype in rows:
+                    found[content_hash] = _unpack(blob, dtype)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND content_hash = ?",
+                    [(now, model, h) for h in found],
+                )
+                self._conn.commit()
+            self.hits += sum(1 for h in content_hashes if h in found)
+            self.misses += sum(1 for h in content_hashes if h not in found)
+        return found
+
+    def get(self, model: str, content_hash: str) -> Optional[np.ndarray]:
+        return self.get_many(model, [content_hash]).get(content_hash)
+
+    def put_many(self, model: str, items: Dict[str, Sequence[float]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = [(model, h, _pack(vec, self.dtype), now, self.dtype) for h, vec in items.items()]
+        with self._lock:
+            for i in range(0, len(rows), _SQL_CHUNK):
+                part = rows[i:i + _SQL_CHUNK]
+                # account for rows being overwritten so the byte total stays exact
+                marks = ",".join("?" * len(part))
+                old = self._conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE model = ? AND content_hash IN ({marks})",
+                    [model, *(r[1] for r in part)],
+                ).fetchone()[0]
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, content_hash, vector, last_access, dtype) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    part,
+                )
+                self._total_bytes += sum(len(r[2]) for r in part) - int(old)
+            self._conn.commit()
+            self._evict()
+
+    def put(self, model: str, content_hash: str, vector: Sequence[float]) -> None:
+        self.put_many(model, {content_hash: vector})
+
+    def _evict(self) -> None:
+        # drop least recently used rows until we're back under 90% of the limit
+        if self._total_bytes <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        while self._total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT model, content_hash, LENGTH(vector) FROM embeddings ORDER BY last_access LIMIT ?",
+                (_SQL_CHUNK,),
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+            removed = []
+            for model, content_hash, size in rows:
+                if self._total_bytes <= target:
+                    break
+                removed.append((model, content_hash))
+                self._total_bytes -= size
+            self._conn.executemany("DELETE FROM embeddings WHERE model = ? AND content_hash = ?", removed)
+            self.evictions += len(removed)
+        self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "dtype": self.dtype,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Process-wide cache instance, or None when disabled with EMBEDDING_CACHE=0."""
+    global _cache
+    if os.getenv("EMBEDDING_CACHE", "1") == "0":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
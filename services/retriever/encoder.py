@@ -1,6 +1,12 @@
-from typing import List
+from typing import List, Optional, Sequence
+import hashlib
 import os
-from openai import OpenAI
+import time
+
+import numpy as np
+
+from .backends import EmbeddingBackend, get_backend
+from .embedding_cache import get_embedding_cache
 
 # API key handling with variable set
 def _get_openai_client():
@@ -13,39 +19,176 @@ def _get_openai_client():
         )
     return api_key
 
-_USE_OPENAI = True
-try:
-    api_key = _get_openai_client()
-    client = OpenAI(api_key=api_key)
-except RuntimeError as e:
-    print(f"OpenAI client initialization failed: {e}")
-    _USE_OPENAI = False
-    client = None
+MAX_RETRIES = 3
+# wall-clock cap on retrying transient failures within one get_embeddings call
+EMBED_RETRY_DEADLINE = float(os.getenv("EMBED_RETRY_DEADLINE", "120"))
+
+_token_encoder = None
+
+
+def get_token_encoder():
+    """cl100k_base tiktoken encoder, or None when tiktoken (or its data) is unavailable."""
+    global _token_encoder
+    if _token_encoder is None:
+        try:
+            import tiktoken
+            _token_encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _token_encoder = False
+    return _token_encoder or None
+
+
+def _count_tokens(text: str) -> int:
+    # token estimate used for batch packing; falls back to a chars/4 heuristic without tiktoken
+    encoder = get_token_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def _make_batches(texts: List[str], max_items: int, max_tokens: Optional[int]) -> List[List[int]]:
+    # group input positions into batches bounded by item count and total tokens
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        n_tokens = _count_tokens(text) if max_tokens else 0
+        if current and (len(current) >= max_items or (max_tokens and current_tokens + n_tokens > max_tokens)):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += n_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def content_hash(text: str) -> str:
+    # same sha256 the indexer uses for chunk hashes, so both share cache keys
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    # L2-normalise rows in place; zero rows are left as they are
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
 
 
-# fallback to local embeddings
+def _embed_with_retry(backend: EmbeddingBackend, texts: List[str], max_retries: int,
+                      deadline: float) -> np.ndarray:
+    # transient failures (rate limits, timeouts, 5xx) are retried with backoff, at most
+    # max_retries attempts and never past the deadline; a rejection caused by one of the
+    # inputs splits the batch so only the sub-batch holding it fails; anything else
+    # (bad key, unknown model, malformed request) would fail the same way again, so it
+    # is raised at once
+    attempt = 0
+    while True:
+        try:
+            return np.asarray(backend.embed(texts), dtype=np.float32)
+        except Exception as e:
+            if len(texts) > 1 and backend.is_input_error(e):
+                mid = len(texts) // 2
+                return np.vstack([_embed_with_retry(backend, texts[:mid], max_retries, deadline),
+                                  _embed_with_retry(backend, texts[mid:], max_retries, deadline)])
+            if not backend.is_transient(e):
+                raise
+            attempt += 1
+            delay = min(2 ** (attempt - 1), 8)
+            if attempt >= max_retries or time.monotonic() + delay > deadline:
+                raise RuntimeError(f"Embedding request failed after {attempt} attempts") from e
+            time.sleep(delay)
 
-def get_embedding(text: str) -> List[float]:
+
+def get_embedding(text: str, backend: Optional[str] = None, normalize: bool = False) -> np.ndarray:
     """
-    Convert text into an embedding vector using OpenAI if installed and API key present
-    might use local sentence-transformers model if available
+    Convert text into a float32 embedding vector using the configured embedding backend
+    (EMBEDDING_BACKEND: openai, sentence-transformers or hashing).
+    `normalize` scales the vector to unit length.
     """
     text = text.strip()
     if not text:
         raise ValueError("Cannot embed empty text.")
 
-    # Use OpenAI
-    if _USE_OPENAI:
-        resp = client.embeddings.create(
-            model="text-embedding-3-small",  
-            input=text
-        )
-        return resp.data[0].embedding
+    embedder = get_backend(backend)
+    cache = get_embedding_cache()
+    key = content_hash(text)
+    if cache is not None:
+        cached = cache.get(embedder.model_id, key)
+        if cached is not None:
+            return _normalize(cached) if normalize else cached
+
+    embedding = np.asarray(embedder.embed([text])[0], dtype=np.float32)
+    if cache is not None:
+        cache.put(embedder.model_id, key, embedding)
+    return _normalize(embedding) if normalize else embedding
+
+
+def get_embeddings(texts: List[str],
+                   batch_size: Optional[int] = None,
+                   max_batch_tokens: Optional[int] = None,
+                   max_retries: int = MAX_RETRIES,
+                   content_hashes: Optional[Sequence[str]] = None,
+                   backend: Optional[str] = None,
+                   normalize: bool = False) -> np.ndarray:
+    """
+    Embed many texts into a (len(texts), dim) float32 matrix with as few requests as possible.
+    Cached vectors are reused and only the misses are sent, in batches bounded by
+    `batch_size` items and `max_batch_tokens` tokens (defaulting to the backend's limits).
+    Results come back in input order. Transient failures are retried (up to `max_retries`
+    attempts and EMBED_RETRY_DEADLINE seconds); other errors are raised straight away.
+    `content_hashes` lets callers that already hashed the texts skip re-hashing.
+    `normalize` scales every row to unit length.
+    """
+    cleaned = [t.strip() for t in texts]
+    if any(not t for t in cleaned):
+        raise ValueError("Cannot embed empty text.")
+    embedder = get_backend(backend)
+    if not cleaned:
+        return np.zeros((0, embedder.dimension), dtype=np.float32)
+
+    if content_hashes is None:
+        content_hashes = [content_hash(t) for t in cleaned]
+    elif len(content_hashes) != len(cleaned):
+        raise ValueError("content_hashes must match texts one-to-one")
+
+    # rows are written straight into one preallocated matrix; allocated on the first
+    # vector seen so backends with an unknown dimension still work
+    results: Optional[np.ndarray] = None
+    filled = np.zeros(len(cleaned), dtype=bool)
+
+    def _place(rows: Sequence[int], vectors) -> None:
+        nonlocal results
+        if results is None:
+            results = np.empty((len(cleaned), len(vectors[0])), dtype=np.float32)
+        results[rows] = vectors
+        filled[rows] = True
+
+    cache = get_embedding_cache()
+    if cache is not None:
+        cached = cache.get_many(embedder.model_id, content_hashes)
+        hit_rows = [i for i, h in enumerate(content_hashes) if h in cached]
+        if hit_rows:
+            _place(hit_rows, np.stack([cached[content_hashes[i]] for i in hit_rows]))
+
+    # embed each distinct missing text once, even if it repeats within the input
+    missing: dict = {}
+    for i, h in enumerate(content_hashes):
+        if not filled[i]:
+            missing.setdefault(h, []).append(i)
 
-    # Use local model
-    #if local_model:
-        #return local_model.encode(text).tolist()
+    todo = list(missing)
+    todo_texts = [cleaned[missing[h][0]] for h in todo]
+    deadline = time.monotonic() + EMBED_RETRY_DEADLINE
+    batches = _make_batches(todo_texts,
+                            batch_size or embedder.max_batch_size,
+                            max_batch_tokens or embedder.max_batch_tokens) if todo else []
+    for batch in batches:
+        vectors = _embed_with_retry(embedder, [todo_texts[j] for j in batch], max_retries, deadline)
+        for j, vec in zip(batch, vectors):
+            _place(missing[todo[j]], vec[None, :])
+        if cache is not None:
+            cache.put_many(embedder.model_id, {todo[j]: vec for j, vec in zip(batch, vectors)})
 
-    raise RuntimeError(
-        "No embedding backend found. Install `openai` or `sentence-transformers`."
-    )
+    return _normalize(results) if normalize else results
@@ -0,0 +1,242 @@
+# Lexical (BM25) inverted index over indexed chunks.
+# Dense similarity ranks exact identifiers (function/event names, 0x addresses) poorly, so
+# retrieval fuses it with BM25 over this index. Postings live in SQLite next to the Chroma
+# store and are updated per chunk by the indexer, so only changed chunks are re-tokenized.
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+from ..chroma_storage.chroma_config import storage_path
+
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", storage_path("lexical_index.sqlite3"))
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# full addresses are 0x + 40 hex chars; shorter hex terms in a query match as prefixes
+_ADDRESS_LEN = 42
+_MIN_HEX_PREFIX = 6
+
+# sqlite limits the number of bound parameters per statement
+_SQL_CHUNK = 500
+
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+")
+_HEX_RE = re.compile(r"0x[0-9a-f]+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms. Identifiers are kept whole and also split on camelCase and
+    underscores, so `getReserveData` matches both itself and "reserve data"."""
+    terms = []
+    for word in _WORD_RE.findall(text):
+        lower = word.lower()
+        terms.append(lower)
+        if _HEX_RE.fullmatch(lower):
+            continue
+        parts = [p.lower() for piece in word.split("_") for p in _CAMEL_RE.findall(piece)]
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+class LexicalIndex:
+    """Per-collection BM25 index: postings (term -> doc id, tf) plus document lengths."""
+
+    def __init__(self, path: str = LEXICAL_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS docs (
+                   collection TEXT NOT NULL,
+                   doc_id TEXT NOT NULL,
+                   length INTEGER NOT NULL,
+                   PRIMARY KEY (collection, doc_id)
+               ) WITHOUT ROWID;
+               CREATE TABLE IF NOT EXISTS postings (
+                   collection TEXT NOT NULL,
+                   term TEXT NOT NULL,
+                   doc_id TEXT NOT NULL,
+                   tf INTEGER NOT NULL,
+                   PRIMARY KEY (collection, term, doc_id)
+               ) WITHOUT ROWID;
+               CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings(collection, doc_id);
+               CREATE TABLE IF NOT EXISTS stats (
+                   collection TEXT PRIMARY KEY,
+                   n_docs INTEGER NOT NULL,
+                   total_length INTEGER NOT NULL
+               );"""
+        )
+        self._conn.commit()
+
+    # writes
+
+    def _remove(self, collection: str, doc_ids: Sequence[str]) -> Tuple[int, int]:
+        # caller holds the lock; returns (docs removed, total length removed)
+        removed, length = 0, 0
+        for i in range(0, len(doc_ids), _SQL_CHUNK):
+            part = list(doc_ids[i:i + _SQL_CHUNK])
+            marks = ",".join("?" * len(part))
+            n, total = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs WHERE collection = ? AND doc_id IN ({marks})",
+                [collection, *part],
+            ).fetchone()
+            removed += n
+            length += total
+            self._conn.execute(f"DELETE FROM postings WHERE collection = ? AND doc_id IN ({marks})",
+                               [collection, *part])
+            self._conn.execute(f"DELETE FROM docs WHERE collection = ? AND doc_id IN ({marks})",
+                               [collection, *part])
+        return removed, length
+
+    def _bump_stats(self, collection: str, n_docs: int, total_length: int):
+        self._conn.execute(
+            "INSERT INTO stats (collection, n_docs, total_length) VALUES (?, ?, ?) "
+            "ON CONFLICT(collection) DO UPDATE SET n_docs = n_docs + excluded.n_docs, "
+            "total_length = total_length + excluded.total_length",
+            (collection, n_docs, total_length),
+        )
+
+    def upsert(self, collection: str, doc_ids: Sequence[str], documents: Sequence[str]) -> None:
+        if not doc_ids:
+            return
+        # tokenize outside the lock
+        counted = [Counter(tokenize(doc)) for doc in documents]
+        with self._lock:
+            removed, removed_length = self._remove(collection, doc_ids)
+            lengths = [sum(c.values()) for c in counted]
+            self._conn.executemany(
+                "INSERT INTO docs (collection, doc_id, length) VALUES (?, ?, ?)",
+                [(collection, d, n) for d, n in zip(doc_ids, lengths)],
+            )
+            self._conn.executemany(
+                "INSERT INTO postings (collection, term, doc_id, tf) VALUES (?, ?, ?, ?)",
+                [(collection, term, d, tf) for d, c in zip(doc_ids, counted) for term, tf in c.items()],
+            )
+            self._bump_stats(collection, len(doc_ids) - removed, sum(lengths) - removed_length)
+            self._conn.commit()
+
+    def delete(self, collection: str, doc_ids: Sequence[str]) -> None:
+        if not doc_ids:
+            return
+        with self._lock:
+            removed, removed_length = self._remove(collection, doc_ids)
+            self._bump_stats(collection, -removed, -removed_length)
+            self._conn.commit()
+
+    def clear(self, collection: str) -> None:
+        with self._lock:
+            for table in ("postings", "docs", "stats"):
+                self._conn.execute(f"DELETE FROM {table} WHERE collection = ?", (collection,))
+            self._conn.commit()
+
+    def count(self, collection: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT n_docs FROM stats WHERE collection = ?", (collection,)).fetchone()
+        return int(row[0]) if row else 0
+
+    # search
+
+    def _query_terms(self, collection: str, terms: Sequence[str]) -> Dict[str, List[str]]:
+        # map each query term to the indexed terms it covers (itself, or hex prefixes)
+        expanded: Dict[str, List[str]] = {}
+        for term in dict.fromkeys(terms):
+            if _HEX_RE.fullmatch(term) and _MIN_HEX_PREFIX <= len(term) < _ADDRESS_LEN:
+                rows = self._conn.execute(
+                    "SELECT DISTINCT term FROM postings WHERE collection = ? AND term >= ? AND term < ? LIMIT ?",
+                    (collection, term, term + "\uffff", _SQL_CHUNK),
+                ).fetchall()
+                expanded[term] = [r[0] for r in rows] or [term]
+            else:
+                expanded[term] = [term]
+        return expanded
+
+    def search(self, collection: str, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """BM25 top-k as (doc id, score), best first."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT n_docs, total_length FROM stats WHERE collection = ?", (collection,)
+            ).fetchone()
+            if not row or not row[0]:
+                return []
+            n_docs, total_length = row
+            avg_length = total_length / n_docs
+            query_counts = Counter(terms)
+            scores: Dict[Hashable, float] = {}
+            for term, indexed_terms in self._query_terms(collection, list(query_counts)).items():
+                marks = ",".join("?" * len(indexed_terms))
+                rows = self._conn.execute(
+                    f"SELECT p.doc_id, p.tf, d.length FROM postings p "
+                    f"JOIN docs d ON d.collection = p.collection AND d.doc_id = p.doc_id "
+                    f"WHERE p.collection = ? AND p.term IN ({marks})",
+                    [collection, *indexed_terms],
+                ).fetchall()
+                if not rows:
+                    continue
+                # a prefix can match several addresses in one doc: count the doc once
+                tfs: Dict[str, Tuple[int, int]] = {}
+                for doc_id, tf, length in rows:
+                    prev = tfs.get(doc_id, (0, length))[0]
+                    tfs[doc_id] = (prev + tf, length)
+                df = len(tfs)
+                idf = math.log((n_docs - df + 0.5) / (df + 0.5) + 1.0)
+                weight = idf * query_counts[term]
+                for doc_id, (tf, length) in tfs.items():
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + weight * tf * (BM25_K1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def rebuild_from_collection(index: LexicalIndex, collection, page_size: int = 1000) -> int:
+    """Re-index every document in a Chroma collection, e.g. one indexed before the
+    lexical index existed. Returns the number of documents indexed."""
+    index.clear(collection.name)
+    total = collection.count()
+    for offset in range(0, total, page_size):
+        page = collection.get(limit=page_size, offset=offset, include=["documents"])
+        index.upsert(collection.name, page["ids"], [doc or "" for doc in page["documents"]])
+    return total
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], weights: Sequence[float],
+                           k: int = 60) -> List[Tuple[Hashable, float]]:
+    """Fuse ranked id lists: score(id) = sum(weight / (k + rank)), best first."""
+    scores: Dict[Hashable, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        if weight <= 0:
+            continue
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+_index: Optional[LexicalIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> Optional[LexicalIndex]:
+    """Process-wide index instance, or None when disabled with LEXICAL_INDEX=0."""
+    global _index
+    if os.getenv("LEXICAL_INDEX", "1") == "0":
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = LexicalIndex()
+    return _index
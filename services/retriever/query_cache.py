@@ -0,0 +1,278 @@
+# Query result cache in front of retrieve().
+# The same questions arrive over and over. A repeat of a query (after normalizing case,
+# whitespace and trailing punctuation) is answered without embedding or searching; a
+# paraphrase whose embedding is within QUERY_CACHE_SIMILARITY (cosine) of a cached query
+# skips the Chroma and BM25 searches. Entries expire after a TTL, the least recently used
+# are evicted past the size limit, and a collection's entries are dropped whenever the
+# indexer writes to it (also across processes, through a stamp file). Results merged from
+# several collections (protocol shards) are cached under the tuple of their names.
+# Queries naming an address, selector or hash embed almost identically to the same query
+# naming another one, so they are only ever matched exactly.
+import copy
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from ..chroma_storage.chroma_config import storage_path
+
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+QUERY_CACHE_SIMILARITY = float(os.getenv("QUERY_CACHE_SIMILARITY", "0.95"))
+QUERY_CACHE_STAMP_DIR = os.getenv("QUERY_CACHE_STAMP_DIR", storage_path())
+
+_SPACE_RE = re.compile(r"\s+")
+# 0x-prefixed hex, or bare hex runs of 8+ chars mixing digits and letters (selectors, hashes)
+_IDENTIFIER_RE = re.compile(r"\b0x[0-9a-f]+|\b(?=[0-9a-f]*[0-9])(?=[0-9a-f]*[a-f])[0-9a-f]{8,}\b")
+
+# a collection name, or a tuple of names for results searched across several
+Scope = Union[str, Tuple[str, ...]]
+
+
+def normalize_query(query: str) -> str:
+    return _SPACE_RE.sub(" ", query.strip().lower()).rstrip("?!. ")
+
+
+def has_identifier(query: str) -> bool:
+    """Whether the query names an address, selector or hash, whose results must not be
+    served for (or from) a query that only embeds close to it."""
+    return _IDENTIFIER_RE.search(normalize_query(query)) is not None
+
+
+def _stamp_path(collection_name: str, stamp_dir: str = QUERY_CACHE_STAMP_DIR) -> str:
+    return os.path.join(stamp_dir, f".{collection_name}.written")
+
+
+def _collection_generation(collection_name: Scope) -> Hashable:
+    # the stamp is replaced atomically on every write, so (inode, mtime) changes each time
+    if isinstance(collection_name, tuple):
+        return tuple(_collection_generation(name) for name in collection_name)
+    try:
+        st = os.stat(_stamp_path(collection_name))
+    except OSError:
+        return (0, 0)
+    return (st.st_ino, st.st_mtime_ns)
+
+
+class _Entry:
+    __slots__ = ("collection", "params", "slot", "chunks", "expires", "exact_only")
+
+    def __init__(self, collection: Scope, params: Hashable, slot: int, chunks: List[Dict], expires: float,
+                 exact_only: bool = False):
+        self.collection = collection
+        self.params = params
+        self.slot = slot
+        self.chunks = chunks
+        self.expires = expires
+        self.exact_only = exact_only
+
+
+class QueryCache:
+    """(collection, normalized query, search params) -> ranked chunks, with a
+    nearest-neighbour fallback over the cached query embeddings."""
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, ttl: float = QUERY_CACHE_TTL,
+                 similarity: float = QUERY_CACHE_SIMILARITY):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple, _Entry]" = OrderedDict()
+        # unit-length query embeddings, one row per slot; allocated on the first put
+        self._matrix: Optional[np.ndarray] = None
+        self._free = list(range(self.max_entries - 1, -1, -1))
+        self._generations: Dict[Scope, Hashable] = {}
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.miss_seconds = 0.0
+        self.hit_seconds = 0.0
+
+    # lookups
+
+    def get(self, collection: Scope, query: str, params: Hashable) -> Optional[List[Dict]]:
+        """Exact (normalized text) lookup."""
+        start = time.perf_counter()
+        with self._lock:
+            self._check_generation(collection)
+            key = (collection, normalize_query(query), params)
+            entry = self._entries.get(key)
+            if entry is None or not self._alive(key, entry):
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            chunks = entry.chunks
+        return self._hit(chunks, start)
+
+    def embedding(self, collection: Scope, query: str, params: Hashable) -> Optional[np.ndarray]:
+        """The (unit-length) embedding stored with a cached query, so an exact hit doesn't
+        need the query embedded again."""
+        with self._lock:
+            entry = self._entries.get((collection, normalize_query(query), params))
+            if entry is None or self._matrix is None:
+                return None
+            return self._matrix[entry.slot].copy()
+
+    def get_similar(self, collection: Scope, query: str, embedding: np.ndarray,
+                    params: Hashable) -> Optional[List[Dict]]:
+        """Nearest cached query by cosine similarity, if within the threshold. Queries
+        naming identifiers neither use nor are used for this."""
+        if has_identifier(query):
+            return None
+        start = time.perf_counter()
+        q = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(q))
+        with self._lock:
+            self._check_generation(collection)
+            if self._matrix is None or not norm or self._matrix.shape[1] != q.shape[0]:
+                return None
+            now = time.time()
+            candidates = [(key, e) for key, e in self._entries.items()
+                          if e.collection == collection and e.params == params and e.expires > now
+                          and not e.exact_only]
+            if not candidates:
+                return None
+            sims = self._matrix[[e.slot for _, e in candidates]] @ (q / norm)
+            best = int(np.argmax(sims))
+            if sims[best] < self.similarity:
+                return None
+            key, entry = candidates[best]
+            self._entries.move_to_end(key)
+            self.semantic_hits += 1
+            chunks = entry.chunks
+        return self._hit(chunks, start)
+
+    def miss(self, elapsed: float = 0.0) -> None:
+        """Record a lookup that had to search; `elapsed` is what the search cost."""
+        with self._lock:
+            self.misses += 1
+            self.miss_seconds += elapsed
+
+    def generation(self, collection: Scope) -> Hashable:
+        """Token to take before searching and hand to put()."""
+        return _collection_generation(collection)
+
+    # writes
+
+    def put(self, collection: Scope, query: str, params: Hashable, embedding: np.ndarray,
+            chunks: List[Dict], generation: Optional[Hashable] = None) -> None:
+        """Cache a search result. Pass the generation() taken before searching so a
+        result computed while the indexer was writing is not kept."""
+        q = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(q)) or 1.0
+        with self._lock:
+            self._check_generation(collection)
+            if generation is not None and generation != self._generations[collection]:
+                return
+            if self._matrix is None or self._matrix.shape[1] != q.shape[0]:
+                # first entry, or the embedding backend changed: start over at the new dimension
+                self._clear()
+                self._matrix = np.zeros((self.max_entries, q.shape[0]), dtype=np.float32)
+            key = (collection, normalize_query(query), params)
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                if not self._free:
+                    self._evict(next(iter(self._entries)))
+                    self.evictions += 1
+                slot = self._free.pop()
+            else:
+                slot = entry.slot
+            self._matrix[slot] = q / norm
+            self._entries[key] = _Entry(collection, params, slot, copy.deepcopy(chunks), time.time() + self.ttl,
+                                        has_identifier(query))
+
+    def invalidate(self, collection: Optional[str] = None) -> None:
+        """Drop every entry searched over `collection` (all entries when None)."""
+        with self._lock:
+            if collection is None:
+                self._clear()
+            else:
+                for key in [k for k, e in self._entries.items()
+                            if e.collection == collection or
+                            (isinstance(e.collection, tuple) and collection in e.collection)]:
+                    self._evict(key)
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, float]:
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        avg_miss = self.miss_seconds / self.misses if self.misses else 0.0
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "avg_miss_ms": round(avg_miss * 1000, 3),
+            "avg_hit_ms": round(self.hit_seconds * 1000 / hits, 3) if hits else 0.0,
+            # time hits would have spent searching at the average miss cost
+            "saved_ms": round(max(0.0, hits * avg_miss - self.hit_seconds) * 1000, 3),
+        }
+
+    def _hit(self, chunks: List[Dict], start: float) -> List[Dict]:
+        # callers may annotate the chunks (e.g. proofs), so hand out copies
+        result = copy.deepcopy(chunks)
+        with self._lock:
+            self.hit_seconds += time.perf_counter() - start
+        return result
+
+    # internals (caller holds the lock)
+
+    def _alive(self, key: Tuple, entry: _Entry) -> bool:
+        if entry.expires > time.time():
+            return True
+        self._evict(key)
+        return False
+
+    def _evict(self, key: Tuple) -> None:
+        entry = self._entries.pop(key)
+        self._free.append(entry.slot)
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._free = list(range(self.max_entries - 1, -1, -1))
+
+    def _check_generation(self, collection: Scope) -> None:
+        # another process (the indexer CLI) may have written to the collection
+        generation = _collection_generation(collection)
+        if self._generations.get(collection, generation) != generation:
+            for key in [k for k, e in self._entries.items() if e.collection == collection]:
+                self._evict(key)
+            self.invalidations += 1
+        self._generations[collection] = generation
+
+
+def mark_collection_written(collection_name: str, stamp_dir: str = QUERY_CACHE_STAMP_DIR) -> None:
+    """Called by the indexer after writing to a collection: touches the collection's
+    stamp file so every process drops its cached results for it."""
+    os.makedirs(stamp_dir, exist_ok=True)
+    path = _stamp_path(collection_name, stamp_dir)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as fh:
+        fh.write(str(time.time_ns()))
+    os.replace(tmp, path)
+
+
+_cache: Optional[QueryCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> Optional[QueryCache]:
+    """Process-wide cache instance, or None when disabled with QUERY_CACHE=0."""
+    global _cache
+    if os.getenv("QUERY_CACHE", "1") == "0":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = QueryCache()
+    return _cache
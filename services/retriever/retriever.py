@@ -1,36 +1,367 @@
-from chromadb import Client 
-from chromadb.config import Settings
-from openai import OpenAI 
-
-from ..retriever.encoder import get_embedding
-from ..chroma_storage.chroma_config import get_chroma_client
-
-client = get_chroma_client()
-collection = client.get_or_create_collection(name="protocol_docs")
-print("col count:", collection.count())
-all_items = collection.get(limit=3)
-print("Sample stored items:", all_items) # get collection storage items
-
-# query embedding
-def retrieve(query: str, top_k: int = 1):
-    q_emb = get_embedding(query)
-    results = collection.query(query_embeddings=[q_emb], n_results=top_k)
-    
-    # results contain documents, metadatas, ids, distances
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from ..retriever.encoder import get_embeddings
+from ..retriever.backends import ensure_collection_backend, get_backend
+from ..retriever.lexical import get_lexical_index, rebuild_from_collection, reciprocal_rank_fusion
+from ..retriever.query_cache import get_query_cache
+from ..retriever.snapshot import open_snapshot
+from ..chroma_storage.chroma_config import (
+    DEFAULT_COLLECTION,
+    SHARD_BY_PROTOCOL,
+    get_chroma_client,
+    get_collection as open_collection,
+    on_close,
+    protocol_key,
+    shard_name,
+)
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = DEFAULT_COLLECTION
+
+# share of the fused score given to BM25 (0 = vector only, 1 = lexical only); above
+# 0.5 so an exact identifier match wins a tie against a purely semantic neighbour
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "0.6"))
+RRF_K = 60
+# candidates pulled from each ranker before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# serve queries from the collection's memory-mapped snapshot when one has been exported
+RETRIEVER_SNAPSHOT = os.getenv("RETRIEVER_SNAPSHOT", "1") != "0"
+# protocol shards searched in parallel when a query isn't scoped to one protocol
+SHARD_FANOUT_WORKERS = int(os.getenv("SHARD_FANOUT_WORKERS", "8"))
+# seconds the list of shard collections is reused before asking Chroma again
+SHARD_LIST_TTL = 60.0
+# BM25 knows nothing of metadata, so filtered queries rank this many times deeper
+# before dropping the hits that don't match the filter
+FILTERED_BM25_DEPTH = 5
+
+# collections checked against the embedding backend and lexical index in this process
+_checked = set()
+_collection_lock = threading.Lock()
+_shards: Optional[Tuple[float, List[str]]] = None
+_fanout_pool: Optional[ThreadPoolExecutor] = None
+_fanout_lock = threading.Lock()
+
+
+def get_collection(name: str = COLLECTION_NAME):
+    """Open a docs collection (the default one or a protocol shard) on first use and
+    check it matches the embedding backend."""
+    collection = open_collection(name)
+    if name not in _checked:
+        with _collection_lock:
+            if name not in _checked:
+                # query vectors must come from the backend the collection was built with
+                ensure_collection_backend(collection)
+                _sync_lexical(collection)
+                _checked.add(name)
+    return collection
+
+
+@on_close
+def _reset(path: str):
+    # handles from a closed client are dropped by the registry; check them again on reopen
+    global _shards
+    with _collection_lock:
+        _checked.clear()
+        _shards = None
+
+
+def _sync_lexical(collection):
+    # collections indexed before the lexical index existed (or by another tool) are
+    # backfilled once so hybrid ranking sees every chunk
+    lexical = get_lexical_index()
+    if lexical is None:
+        return
+    total = collection.count()
+    if lexical.count(collection.name) != total:
+        logger.info("Rebuilding lexical index for '%s' (%d chunks)", collection.name, total)
+        rebuild_from_collection(lexical, collection)
+
+
+def _snapshot(name: str = COLLECTION_NAME):
+    return open_snapshot(name) if RETRIEVER_SNAPSHOT else None
+
+
+def _shard_names() -> List[str]:
+    # the default collection plus every "<collection>-<protocol>" shard the indexer created
+    global _shards
+    now = time.monotonic()
+    if _shards is None or now - _shards[0] > SHARD_LIST_TTL:
+        # older chromadb releases list names, newer ones Collection objects
+        names = [getattr(c, "name", c) for c in get_chroma_client().list_collections()]
+        prefix = COLLECTION_NAME + "-"
+        _shards = (now, sorted(n for n in names if n == COLLECTION_NAME or n.startswith(prefix)))
+    return _shards[1]
+
+
+def _scope(protocol: Union[str, Sequence[str], None], where: Optional[Dict]) -> Tuple[List[str], Optional[Dict]]:
+    # collections to search, and the filter to apply in each of them
+    if isinstance(protocol, str):
+        protocol = [protocol]
+    protocols = [protocol_key(p) for p in protocol or []]
+    if not SHARD_BY_PROTOCOL:
+        if protocols:
+            clause = {"protocol": protocols[0] if len(protocols) == 1 else {"$in": protocols}}
+            where = {"$and": [clause, where]} if where else clause
+        return [COLLECTION_NAME], where
+    names = _shard_names()
+    if protocols:
+        wanted = {shard_name(COLLECTION_NAME, p) for p in protocols}
+        names = [n for n in names if n in wanted]
+    return names, where
+
+
+def warm_up():
+    """Open the collections (and their snapshots) and load the embedding backend ahead
+    of the first query."""
+    collection = get_collection()
+    get_backend()
+    for name in _shard_names() if SHARD_BY_PROTOCOL else [COLLECTION_NAME]:
+        snapshot = _snapshot(name)
+        if snapshot is not None:
+            logger.info("snapshot rows (%s): %d", name, snapshot.count)
+        logger.info("col count (%s): %d", name, get_collection(name).count())
+    return collection
+
+
+def _chunks_for(results, i: int, name: str = COLLECTION_NAME) -> List[Dict]:
+    # results contain documents, metadatas, ids, distances, embeddings, one list per query
     chunks = []
-    
-    # if multiple queries, loop over results['documents'][i] instead of hardcoded [0]
-    for doc, meta, dist in zip(results['documents'][0], results['metadatas'][0], results['distances'][0]):
+    embeddings = results.get('embeddings')
+    embeddings = embeddings[i] if embeddings is not None else [None] * len(results['ids'][i])
+    for cid, doc, meta, dist, emb in zip(results['ids'][i], results['documents'][i], results['metadatas'][i],
+                                         results['distances'][i], embeddings):
         chunks.append({
+            "id": cid,
             "content": doc, 
             "metadata": meta, 
-            "distance": dist})
-    #print(chunks)
-    best_chunk = min(chunks, key=lambda x: x["distance"])
-    print("best_chunk content:", best_chunk["content"])
+            "distance": dist,
+            "collection": name,
+            # kept so context packing doesn't embed retrieved chunks again
+            "embedding": None if emb is None else np.asarray(emb, dtype=np.float32)})
+    return chunks
+
+
+def _attach_proof(chunk: Dict):
+    # Merkle inclusion proof against the source root, verifiable with verify_chunk_proof
+    from ..indexer.merkle import prove_chunk
+    try:
+        chunk["proof"] = prove_chunk(chunk["id"], chunk.get("collection", COLLECTION_NAME))
+    except KeyError:
+        chunk["proof"] = None
+
+
+def _get(name: str, ids: Sequence[str], where: Optional[Dict] = None,
+         include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, List]:
+    snapshot = _snapshot(name)
+    if snapshot is not None:
+        return snapshot.get(ids, where)
+    return get_collection(name).get(ids=list(ids), where=where, include=list(include))
+
+
+def _search_collection(name: str, queries: Sequence[str], q_embs, depth: int, weight: float,
+                       where: Optional[Dict]) -> List[Tuple[List[Dict], List[Tuple[str, float]]]]:
+    # vector candidates and BM25 hits for each query within one collection
+    collection = get_collection(name)
+    snapshot = _snapshot(name)
+    if snapshot is not None:
+        # in-process scan of the mapped snapshot, no Chroma round trip
+        results = snapshot.query(q_embs, n_results=depth, where=where)
+    else:
+        results = collection.query(query_embeddings=q_embs, n_results=depth, where=where,
+                                   include=["documents", "metadatas", "distances", "embeddings"])
+    lexical = get_lexical_index() if weight > 0 else None
+    found = []
+    for i, query in enumerate(queries):
+        hits: List[Tuple[str, float]] = []
+        if lexical is not None:
+            hits = lexical.search(name, query, top_k=depth * FILTERED_BM25_DEPTH if where else depth)
+            if where and hits:
+                allowed = set(_get(name, [cid for cid, _ in hits], where, include=[])["ids"])
+                hits = [hit for hit in hits if hit[0] in allowed][:depth]
+        found.append((_chunks_for(results, i, name), hits))
+    return found
+
+
+def _fanout(search: Callable[[str], List], names: Sequence[str]) -> List[List]:
+    # one task per collection, in parallel; a single collection is searched inline
+    global _fanout_pool
+    if len(names) <= 1:
+        return [search(name) for name in names]
+    if _fanout_pool is None:
+        with _fanout_lock:
+            if _fanout_pool is None:
+                _fanout_pool = ThreadPoolExecutor(max_workers=max(1, SHARD_FANOUT_WORKERS),
+                                                  thread_name_prefix="retrieve-shard")
+    return list(_fanout_pool.map(search, names))
+
+
+def _rank(chunks: List[Dict], bm25: List[Tuple[str, str, float]], top_k: int,
+          lexical_weight: float) -> List[Dict]:
+    # fuse the vector ranking with BM25 (collection, id, score) hits by reciprocal rank;
+    # chunks only BM25 found are fetched from their collection and carry no distance.
+    # Candidates from several shards are ranked together, by distance and by BM25 score.
+    chunks = sorted(chunks, key=lambda x: x["distance"])
+    if get_lexical_index() is None or lexical_weight <= 0:
+        return chunks[:top_k]
+    bm25 = sorted(bm25, key=lambda hit: hit[2], reverse=True)
+    scores = {(name, cid): score for name, cid, score in bm25}
+    fused = reciprocal_rank_fusion([[(c["collection"], c["id"]) for c in chunks], list(scores)],
+                                   [1.0 - lexical_weight, lexical_weight], RRF_K)[:top_k]
+    by_key = {(c["collection"], c["id"]): c for c in chunks}
+    missing: Dict[str, List[str]] = {}
+    for name, cid in (key for key, _ in fused if key not in by_key):
+        missing.setdefault(name, []).append(cid)
+    for name, ids in missing.items():
+        found = _get(name, ids, include=("documents", "metadatas", "embeddings"))
+        embeddings = found.get("embeddings")
+        if embeddings is None:
+            embeddings = [None] * len(found["ids"])
+        for cid, doc, meta, emb in zip(found["ids"], found["documents"], found["metadatas"], embeddings):
+            by_key[(name, cid)] = {"id": cid, "content": doc, "metadata": meta, "distance": None,
+                                   "collection": name,
+                                   "embedding": None if emb is None else np.asarray(emb, dtype=np.float32)}
+    ranked = []
+    for key, score in fused:
+        if key in by_key:
+            by_key[key]["score"] = score
+            by_key[key]["bm25"] = scores.get(key)
+            ranked.append(by_key[key])
+    return ranked
+
+
+def _search(queries: Sequence[str], q_embs, top_k: int, weight: float, names: Sequence[str],
+            where: Optional[Dict] = None) -> List[List[Dict]]:
+    # hybrid ranking draws from a deeper vector candidate list than top_k
+    depth = max(top_k, HYBRID_CANDIDATES) if weight > 0 else top_k
+    per_collection = _fanout(lambda name: _search_collection(name, queries, q_embs, depth, weight, where), names)
+    ranked = []
+    for i in range(len(queries)):
+        chunks = [c for found in per_collection for c in found[i][0]]
+        bm25 = [(name, cid, score) for name, found in zip(names, per_collection) for cid, score in found[i][1]]
+        ranked.append(_rank(chunks, bm25, top_k, weight))
+    return ranked
+
+
+def _cached_search(queries: Sequence[str], top_k: int, lexical_weight: Optional[float],
+                   where: Optional[Dict] = None, protocol: Union[str, Sequence[str], None] = None,
+                   ) -> Tuple[List[List[Dict]], List[Optional[np.ndarray]]]:
+    # answer what the query cache can (exact text first, then a near-identical query
+    # embedding) and send only the rest to Chroma/BM25, in one batch. Also returns each
+    # query's embedding (None for an exact hit whose cache entry has since been evicted).
+    weight = HYBRID_LEXICAL_WEIGHT if lexical_weight is None else lexical_weight
+    names, where = _scope(protocol, where)
+    if not names:
+        # sharded, and none of the requested protocols has been indexed
+        return [[] for _ in queries], [None] * len(queries)
+    scope = names[0] if len(names) == 1 else tuple(names)
+    params = (top_k, weight, json.dumps(where, sort_keys=True) if where else None)
+    cache = get_query_cache()
+    ranked: List[Optional[List[Dict]]] = [None] * len(queries)
+    vectors: List[Optional[np.ndarray]] = [None] * len(queries)
+    if cache is not None:
+        for i, query in enumerate(queries):
+            ranked[i] = cache.get(scope, query, params)
+            if ranked[i] is not None:
+                vectors[i] = cache.embedding(scope, query, params)
+    todo = [i for i, chunks in enumerate(ranked) if chunks is None]
+    if not todo:
+        return ranked, vectors
+
+    start = time.perf_counter()
+    q_embs = get_embeddings([queries[i] for i in todo])
+    for row, i in enumerate(todo):
+        vectors[i] = q_embs[row]
+    rows = list(range(len(todo)))
+    generation = None
+    if cache is not None:
+        for row, i in enumerate(todo):
+            ranked[i] = cache.get_similar(scope, queries[i], q_embs[row], params)
+        rows = [row for row, i in enumerate(todo) if ranked[i] is None]
+        if not rows:
+            return ranked, vectors
+        generation = cache.generation(scope)
+
+    found = _search([queries[todo[row]] for row in rows], q_embs[rows], top_k, weight, names, where)
+    elapsed = (time.perf_counter() - start) / len(rows)
+    for row, chunks in zip(rows, found):
+        i = todo[row]
+        ranked[i] = chunks
+        if cache is not None:
+            cache.miss(elapsed)
+            cache.put(scope, queries[i], params, q_embs[row], chunks, generation)
+    return ranked, vectors
+
+
+def _strip_embeddings(chunks: List[Dict]) -> List[Dict]:
+    for chunk in chunks:
+        chunk.pop("embedding", None)
+    return chunks
+
+
+# query embedding
+def retrieve(query: str, top_k: int = 1, with_proof: bool = False,
+             lexical_weight: Optional[float] = None, where: Optional[Dict] = None,
+             protocol: Union[str, Sequence[str], None] = None):
+    """
+    Return the best chunk for `query`. Vector and BM25 rankings are fused with
+    reciprocal rank fusion, BM25 weighted by `lexical_weight` (HYBRID_LEXICAL_WEIGHT
+    by default, 0 for vector search only), so exact identifiers and addresses rank well.
+    Repeated and near-identical queries are served from the query cache.
+
+    `where` is a Chroma metadata filter, e.g. {"chain": "ethereum"} or
+    {"date": {"$gte": 20240101}}. `protocol` (one name or several) scopes the search
+    to those protocols: only their shards are searched with SHARD_BY_PROTOCOL=1,
+    otherwise it is added to the filter. Returns None when nothing matches.
+    """
+    chunks = _strip_embeddings(_cached_search([query], top_k, lexical_weight, where, protocol)[0][0])
+    if not chunks:
+        return None
+    best_chunk = chunks[0]
+
+    if with_proof:
+        _attach_proof(best_chunk)
     
     return best_chunk # currently test with most relevant chunk but we want to feed top-k chunks to llm 
 
+
+def retrieve_many(queries: Sequence[str], top_k: int = 5, with_proof: bool = False,
+                  lexical_weight: Optional[float] = None, where: Optional[Dict] = None,
+                  protocol: Union[str, Sequence[str], None] = None, with_embeddings: bool = False):
+    """
+    Retrieve the top-k chunks for several queries at once (e.g. sub-queries expanded
+    from one question): the queries the cache can't answer are embedded in one batch
+    and searched with a single collection query per shard. Returns one list of chunks
+    per query, best first, ranked and filtered as in retrieve().
+
+    With `with_embeddings`, each chunk keeps its stored vector under "embedding" and
+    (chunks per query, query embeddings) is returned, so callers such as context packing
+    don't have to embed any of it again.
+    """
+    if not queries:
+        return ([], []) if with_embeddings else []
+    ranked, vectors = _cached_search(queries, top_k, lexical_weight, where, protocol)
+    for chunks in ranked:
+        if not with_embeddings:
+            _strip_embeddings(chunks)
+        if with_proof:
+            for chunk in chunks:
+                _attach_proof(chunk)
+    return (ranked, vectors) if with_embeddings else ranked
+
+
+def query_cache_stats() -> Dict[str, float]:
+    cache = get_query_cache()
+    return cache.stats() if cache is not None else {}
+
 #retrieve("How does Aave protocol handle liquidity?")
 
 
@@ -0,0 +1,557 @@
+# Read-only, memory-mapped snapshots of a Chroma collection.
+# A snapshot is a directory of flat files: a float32 (n, dim) vector matrix with its row
+# norms, documents as one UTF-8 blob plus offsets, and an ids/metadata sidecar. Readers
+# np.memmap the arrays, so every API worker on the host shares one copy through the page
+# cache, and search is a vectorized scan (or an IVF probe on large snapshots) with
+# metadata pre-filters, with no Chroma round trip.
+#
+# Snapshots are versioned (<dir>/<collection>/v000001, ...) behind a CURRENT pointer that
+# is swapped atomically. The indexer journals the ids it upserts/deletes; refresh_snapshot
+# copies the unchanged rows from the current version, fetches only the journaled ids from
+# Chroma and publishes a new version. Readers notice the new pointer on their next query.
+#
+#   python -m services.retriever.snapshot export protocol_docs [--ivf]
+#   python -m services.retriever.snapshot refresh protocol_docs
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..chroma_storage.chroma_config import storage_path
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", storage_path("snapshots"))
+# build an IVF index automatically from this many rows; below it brute force is fast enough
+SNAPSHOT_IVF_MIN_ROWS = int(os.getenv("SNAPSHOT_IVF_MIN_ROWS", "50000"))
+# IVF lists probed per query; more is slower and closer to exact
+SNAPSHOT_NPROBE = int(os.getenv("SNAPSHOT_NPROBE", "8"))
+
+_PAGE_SIZE = 1000
+_KMEANS_SAMPLE = 50_000
+_KMEANS_ITERATIONS = 10
+_BLOCK_ROWS = 65_536
+# distinct `where` filters whose row masks are kept per snapshot
+_MASK_CACHE_SIZE = 64
+
+
+def _collection_dir(collection_name: str, snapshot_dir: str = SNAPSHOT_DIR) -> str:
+    return os.path.join(snapshot_dir, collection_name)
+
+
+def _pointer_path(collection_name: str, snapshot_dir: str = SNAPSHOT_DIR) -> str:
+    return os.path.join(_collection_dir(collection_name, snapshot_dir), "CURRENT")
+
+
+def _journal_path(collection_name: str, snapshot_dir: str = SNAPSHOT_DIR) -> str:
+    return os.path.join(_collection_dir(collection_name, snapshot_dir), "pending.jsonl")
+
+
+def _current_version(collection_name: str, snapshot_dir: str = SNAPSHOT_DIR) -> Optional[str]:
+    try:
+        with open(_pointer_path(collection_name, snapshot_dir), "r", encoding="utf-8") as fh:
+            return fh.read().strip() or None
+    except OSError:
+        return None
+
+
+def snapshot_exists(collection_name: str, snapshot_dir: str = SNAPSHOT_DIR) -> bool:
+    return _current_version(collection_name, snapshot_dir) is not None
+
+
+# metadata filters (Chroma `where` syntax)
+
+_COMPARE = {
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+}
+
+
+def _column_mask(column: np.ndarray, condition) -> np.ndarray:
+    if not isinstance(condition, dict):
+        condition = {"$eq": condition}
+    mask = np.ones(len(column), dtype=bool)
+    for op, value in condition.items():
+        if op == "$eq":
+            mask &= column == value
+        elif op == "$ne":
+            mask &= column != value
+        elif op == "$in":
+            mask &= np.isin(column, list(value))
+        elif op == "$nin":
+            mask &= ~np.isin(column, list(value))
+        elif op in _COMPARE:
+            compare = _COMPARE[op]
+            mask &= np.fromiter((v is not None and compare(v, value) for v in column), bool, len(column))
+        else:
+            raise ValueError(f"Unsupported filter operator {op!r}")
+    return mask
+
+
+# writing
+
+def _kmeans(sample: np.ndarray, k: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+    for _ in range(_KMEANS_ITERATIONS):
+        assign = _nearest_centroid(sample, centroids)
+        for c in range(k):
+            members = sample[assign == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+            else:
+                # re-seed an empty list from a random point
+                centroids[c] = sample[rng.integers(len(sample))]
+    return centroids
+
+
+def _nearest_centroid(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    c_norms = (centroids * centroids).sum(axis=1)
+    out = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + _BLOCK_ROWS], dtype=np.float32)
+        # |x - c|^2 up to the |x|^2 term, which doesn't change the argmin
+        out[start:start + len(block)] = np.argmin(c_norms[None, :] - 2 * block @ centroids.T, axis=1)
+    return out
+
+
+class _VersionWriter:
+    """Streams rows into a new version directory."""
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        os.makedirs(path)
+        self._vectors = open(os.path.join(path, "vectors.f32"), "wb")
+        self._docs = open(os.path.join(path, "docs.bin"), "wb")
+        self.ids: List[str] = []
+        self.metadatas: List[Dict] = []
+        self.norms: List[np.ndarray] = []
+        self.offsets: List[int] = [0]
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray, documents: Iterable[bytes], metadatas: Sequence[Dict]):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(f"expected (n, {self.dim}) vectors, got {vectors.shape}")
+        self._vectors.write(vectors.tobytes())
+        self.norms.append(np.linalg.norm(vectors, axis=1).astype(np.float32))
+        for doc in documents:
+            self._docs.write(doc)
+            self.offsets.append(self.offsets[-1] + len(doc))
+        self.ids.extend(ids)
+        self.metadatas.extend(metadatas)
+
+    def finish(self, info: Dict, ivf: Optional[bool], previous: Optional["Snapshot"]) -> Dict:
+        self._vectors.close()
+        self._docs.close()
+        n = len(self.ids)
+        norms = np.concatenate(self.norms) if self.norms else np.zeros(0, dtype=np.float32)
+        norms.tofile(os.path.join(self.path, "norms.f32"))
+        np.asarray(self.offsets, dtype=np.int64).tofile(os.path.join(self.path, "doc_offsets.i64"))
+        with open(os.path.join(self.path, "rows.json"), "w", encoding="utf-8") as fh:
+            json.dump({"ids": self.ids, "metadatas": self.metadatas}, fh)
+
+        info = dict(info, count=n, dim=self.dim, ivf_lists=0, ivf_trained_rows=0)
+        if ivf is None:
+            ivf = n >= SNAPSHOT_IVF_MIN_ROWS or bool(previous is not None and previous.centroids is not None)
+        if ivf and n:
+            vectors = np.memmap(os.path.join(self.path, "vectors.f32"), dtype=np.float32, mode="r",
+                                shape=(n, self.dim))
+            reuse = (previous is not None and previous.centroids is not None
+                     and previous.dim == self.dim
+                     and previous.ivf_trained_rows / 2 <= n <= previous.ivf_trained_rows * 2)
+            if reuse:
+                # the data hasn't drifted much: keep the lists, just place the new rows
+                centroids, trained = previous.centroids, previous.ivf_trained_rows
+            else:
+                k = max(1, min(4096, int(np.sqrt(n))))
+                sample_rows = np.random.default_rng(0).choice(n, min(n, _KMEANS_SAMPLE), replace=False)
+                centroids, trained = _kmeans(np.asarray(vectors[np.sort(sample_rows)]), k), n
+            assign = _nearest_centroid(vectors, centroids)
+            order = np.argsort(assign, kind="stable").astype(np.int32)
+            list_offsets = np.searchsorted(assign[order], np.arange(len(centroids) + 1)).astype(np.int64)
+            np.ascontiguousarray(centroids, dtype=np.float32).tofile(os.path.join(self.path, "ivf_centroids.f32"))
+            order.tofile(os.path.join(self.path, "ivf_order.i32"))
+            list_offsets.tofile(os.path.join(self.path, "ivf_offsets.i64"))
+            info.update(ivf_lists=len(centroids), ivf_trained_rows=trained)
+        with open(os.path.join(self.path, "info.json"), "w", encoding="utf-8") as fh:
+            json.dump(info, fh)
+        return info
+
+    def abort(self):
+        self._vectors.close()
+        self._docs.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def _next_version_dir(collection_name: str, snapshot_dir: str) -> Tuple[str, str]:
+    base = _collection_dir(collection_name, snapshot_dir)
+    os.makedirs(base, exist_ok=True)
+    existing = [int(name[1:]) for name in os.listdir(base) if name.startswith("v") and name[1:].isdigit()]
+    version = f"v{max(existing, default=0) + 1:06d}"
+    return version, os.path.join(base, version)
+
+
+def _publish(collection_name: str, version: str, snapshot_dir: str, keep: int = 2):
+    base = _collection_dir(collection_name, snapshot_dir)
+    tmp = _pointer_path(collection_name, snapshot_dir) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write(version)
+    os.replace(tmp, _pointer_path(collection_name, snapshot_dir))
+    # keep the previous version for readers that haven't switched yet; processes that still
+    # map an older one keep their mapping after the files are unlinked
+    versions = sorted(name for name in os.listdir(base) if name.startswith("v") and name[1:].isdigit())
+    for name in versions[:-keep]:
+        shutil.rmtree(os.path.join(base, name), ignore_errors=True)
+
+
+def _collection_space(collection) -> str:
+    # the distance lives in the collection configuration; older collections (and older
+    # chromadb) only have it as hnsw:space metadata, which tagging the backend drops
+    config = getattr(collection, "configuration", None) or {}
+    space = (config.get("hnsw") or {}).get("space") if isinstance(config, dict) else None
+    return space or (collection.metadata or {}).get("hnsw:space", "l2")
+
+
+def _collection_info(collection) -> Dict:
+    meta = collection.metadata or {}
+    return {
+        "collection": collection.name,
+        "space": _collection_space(collection),
+        "embedding_model": meta.get("embedding_model"),
+        "created": time.time(),
+    }
+
+
+def _iter_collection(collection, ids: Optional[Sequence[str]] = None):
+    include = ["embeddings", "documents", "metadatas"]
+    if ids is None:
+        total = collection.count()
+        for offset in range(0, total, _PAGE_SIZE):
+            yield collection.get(limit=_PAGE_SIZE, offset=offset, include=include)
+    else:
+        for start in range(0, len(ids), _PAGE_SIZE):
+            yield collection.get(ids=list(ids[start:start + _PAGE_SIZE]), include=include)
+
+
+def _add_page(writer: Optional[_VersionWriter], page: Dict, path_factory) -> Optional[_VersionWriter]:
+    if not len(page["ids"]):
+        return writer
+    vectors = np.asarray(page["embeddings"], dtype=np.float32)
+    if writer is None:
+        writer = path_factory(vectors.shape[1])
+    writer.add(page["ids"], vectors,
+               ((doc or "").encode("utf-8") for doc in page["documents"]),
+               [dict(m or {}) for m in page["metadatas"]])
+    return writer
+
+
+def export_snapshot(collection, snapshot_dir: str = SNAPSHOT_DIR, ivf: Optional[bool] = None) -> Dict:
+    """Write a full snapshot of `collection` and make it current. `ivf` forces the IVF
+    index on or off (default: on from SNAPSHOT_IVF_MIN_ROWS rows)."""
+    name = collection.name
+    version, path = _next_version_dir(name, snapshot_dir)
+    # anything journaled so far is covered by this full export
+    journal = _read_journal(name, snapshot_dir)
+    writer: Optional[_VersionWriter] = None
+    try:
+        for page in _iter_collection(collection):
+            writer = _add_page(writer, page, lambda dim: _VersionWriter(path, dim))
+        if writer is None:
+            raise ValueError(f"Collection '{name}' is empty; nothing to snapshot")
+        info = writer.finish(_collection_info(collection), ivf, None)
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    _publish(name, version, snapshot_dir)
+    _consume_journal(name, journal[1], snapshot_dir)
+    return dict(info, version=version)
+
+
+# journal of indexer writes since the current version
+
+def journal_writes(collection_name: str, upserted: Sequence[str], deleted: Sequence[str],
+                   snapshot_dir: str = SNAPSHOT_DIR) -> None:
+    """Record ids written by the indexer; a no-op for collections without a snapshot."""
+    if not (upserted or deleted) or not snapshot_exists(collection_name, snapshot_dir):
+        return
+    line = json.dumps({"upsert": list(upserted), "delete": list(deleted)}) + "\n"
+    with open(_journal_path(collection_name, snapshot_dir), "a", encoding="utf-8") as fh:
+        fh.write(line)
+
+
+def _read_journal(collection_name: str, snapshot_dir: str) -> Tuple[Dict[str, str], int]:
+    # final operation per id, and how many bytes of the journal that covers
+    ops: Dict[str, str] = {}
+    try:
+        with open(_journal_path(collection_name, snapshot_dir), "rb") as fh:
+            data = fh.read()
+    except OSError:
+        return ops, 0
+    consumed = data.rfind(b"\n") + 1  # ignore a line still being written
+    for line in data[:consumed].splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        for cid in entry.get("upsert", []):
+            ops[cid] = "upsert"
+        for cid in entry.get("delete", []):
+            ops[cid] = "delete"
+    return ops, consumed
+
+
+def _consume_journal(collection_name: str, consumed: int, snapshot_dir: str):
+    # drop the applied prefix, keeping anything appended while the refresh ran
+    path = _journal_path(collection_name, snapshot_dir)
+    try:
+        with open(path, "rb") as fh:
+            rest = fh.read()[consumed:]
+    except OSError:
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(rest)
+    os.replace(tmp, path)
+
+
+def refresh_snapshot(collection, snapshot_dir: str = SNAPSHOT_DIR, ivf: Optional[bool] = None) -> Optional[Dict]:
+    """Publish a new version with the journaled upserts/deletes applied: unchanged rows are
+    copied from the current version, only changed ids are read from Chroma. Returns None
+    when the collection has no snapshot or nothing changed."""
+    name = collection.name
+    current = open_snapshot(name, snapshot_dir)
+    if current is None:
+        return None
+    ops, consumed = _read_journal(name, snapshot_dir)
+    if not ops:
+        return None
+
+    version, path = _next_version_dir(name, snapshot_dir)
+    keep = np.fromiter((cid not in ops for cid in current.ids), bool, len(current.ids))
+    writer = _VersionWriter(path, current.dim)
+    try:
+        kept = np.flatnonzero(keep)
+        for start in range(0, len(kept), _BLOCK_ROWS):
+            rows = kept[start:start + _BLOCK_ROWS]
+            writer.add([current.ids[r] for r in rows], current.vectors[rows],
+                       (current.document_bytes(r) for r in rows),
+                       [current.metadatas[r] for r in rows])
+        upserted = [cid for cid, op in ops.items() if op == "upsert"]
+        for page in _iter_collection(collection, upserted):
+            _add_page(writer, page, None)
+        info = writer.finish(_collection_info(collection), ivf, current)
+    except BaseException:
+        writer.abort()
+        raise
+    _publish(name, version, snapshot_dir)
+    _consume_journal(name, consumed, snapshot_dir)
+    return dict(info, version=version, copied=int(keep.sum()), fetched=len(upserted))
+
+
+# reading
+
+class Snapshot:
+    """One published version, memory-mapped read-only."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "info.json"), "r", encoding="utf-8") as fh:
+            self.info = json.load(fh)
+        with open(os.path.join(path, "rows.json"), "r", encoding="utf-8") as fh:
+            rows = json.load(fh)
+        self.ids: List[str] = rows["ids"]
+        self.metadatas: List[Dict] = rows["metadatas"]
+        self.count = int(self.info["count"])
+        self.dim = int(self.info["dim"])
+        self.space = self.info.get("space", "l2")
+
+        def mapped(name, dtype, shape):
+            if not shape or not shape[0]:
+                return np.zeros(shape, dtype=dtype)
+            return np.memmap(os.path.join(path, name), dtype=dtype, mode="r", shape=shape)
+
+        self.vectors = mapped("vectors.f32", np.float32, (self.count, self.dim))
+        self.norms = mapped("norms.f32", np.float32, (self.count,))
+        self._doc_offsets = np.fromfile(os.path.join(path, "doc_offsets.i64"), dtype=np.int64)
+        self._docs = mapped("docs.bin", np.uint8, (int(self._doc_offsets[-1]),))
+        self.ivf_trained_rows = int(self.info.get("ivf_trained_rows", 0))
+        lists = int(self.info.get("ivf_lists", 0))
+        if lists:
+            self.centroids = np.fromfile(os.path.join(path, "ivf_centroids.f32"), dtype=np.float32).reshape(lists, self.dim)
+            self._ivf_order = mapped("ivf_order.i32", np.int32, (self.count,))
+            self._ivf_offsets = np.fromfile(os.path.join(path, "ivf_offsets.i64"), dtype=np.int64)
+        else:
+            self.centroids = None
+        self._row_of: Optional[Dict[str, int]] = None
+        self._columns: Dict[str, np.ndarray] = {}
+        self._masks: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def document_bytes(self, row: int) -> bytes:
+        return self._docs[self._doc_offsets[row]:self._doc_offsets[row + 1]].tobytes()
+
+    def document(self, row: int) -> str:
+        return self.document_bytes(row).decode("utf-8")
+
+    # filters
+
+    def _column(self, key: str) -> np.ndarray:
+        column = self._columns.get(key)
+        if column is None:
+            column = np.empty(self.count, dtype=object)
+            column[:] = [m.get(key) for m in self.metadatas]
+            self._columns[key] = column
+        return column
+
+    def _where_mask(self, where: Dict) -> np.ndarray:
+        mask = np.ones(self.count, dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._where_mask(clause)
+            elif key == "$or":
+                any_mask = np.zeros(self.count, dtype=bool)
+                for clause in condition:
+                    any_mask |= self._where_mask(clause)
+                mask &= any_mask
+            else:
+                mask &= _column_mask(self._column(key), condition)
+        return mask
+
+    def mask(self, where: Optional[Dict]) -> Optional[np.ndarray]:
+        """Boolean row mask for a Chroma-style `where` filter (cached per filter)."""
+        if not where:
+            return None
+        key = json.dumps(where, sort_keys=True, default=str)
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+        mask = self._where_mask(where)
+        with self._lock:
+            self._masks[key] = mask
+            while len(self._masks) > _MASK_CACHE_SIZE:
+                self._masks.popitem(last=False)
+        return mask
+
+    # search
+
+    def _distances(self, q: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        vectors = self.vectors if rows is None else self.vectors[rows]
+        norms = self.norms if rows is None else self.norms[rows]
+        dots = np.asarray(vectors @ q, dtype=np.float32)
+        # same distance definitions as Chroma's hnsw:space
+        if self.space == "cosine":
+            denom = norms * (np.linalg.norm(q) or 1.0)
+            denom[denom == 0] = 1.0
+            return 1.0 - dots / denom
+        if self.space == "ip":
+            return 1.0 - dots
+        return float(q @ q) + norms * norms - 2.0 * dots
+
+    def _candidates(self, q: np.ndarray, nprobe: int) -> np.ndarray:
+        # rows in the IVF lists whose centroids are nearest to q
+        c_dist = (self.centroids * self.centroids).sum(axis=1) - 2.0 * self.centroids @ q
+        probe = np.argsort(c_dist)[:max(1, nprobe)]
+        return np.concatenate([self._ivf_order[self._ivf_offsets[c]:self._ivf_offsets[c + 1]] for c in probe])
+
+    def search(self, q: np.ndarray, n_results: int, where: Optional[Dict] = None,
+               nprobe: int = SNAPSHOT_NPROBE, exact: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, distances) of the nearest rows to `q`, closest first."""
+        q = np.asarray(q, dtype=np.float32)
+        mask = self.mask(where)
+        rows = None
+        if not exact and self.centroids is not None:
+            rows = self._candidates(q, nprobe)
+            if mask is not None:
+                rows = rows[mask[rows]]
+            if len(rows) < n_results:
+                # too few matches in the probed lists: scan exactly instead
+                rows = None
+        if rows is None and mask is not None:
+            rows = np.flatnonzero(mask)
+        if rows is not None and not len(rows):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        dist = self._distances(q, rows)
+        k = min(n_results, len(dist))
+        top = np.argpartition(dist, k - 1)[:k] if k < len(dist) else np.arange(len(dist))
+        top = top[np.argsort(dist[top], kind="stable")]
+        found = top if rows is None else rows[top]
+        return found.astype(np.int64), dist[top]
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict] = None,
+              nprobe: int = SNAPSHOT_NPROBE) -> Dict[str, List[List]]:
+        """Same result layout as collection.query(), embeddings included."""
+        out: Dict[str, List[List]] = {"ids": [], "documents": [], "metadatas": [], "distances": [],
+                                      "embeddings": []}
+        for q in np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)):
+            rows, dist = self.search(q, n_results, where, nprobe)
+            out["ids"].append([self.ids[r] for r in rows])
+            out["documents"].append([self.document(r) for r in rows])
+            out["metadatas"].append([self.metadatas[r] for r in rows])
+            out["distances"].append([float(d) for d in dist])
+            out["embeddings"].append(np.array(self.vectors[rows]))
+        return out
+
+    def get(self, ids: Sequence[str], where: Optional[Dict] = None) -> Dict[str, List]:
+        """Same result layout as collection.get(ids=..., where=...), embeddings included;
+        unknown ids and rows not matching `where` are skipped."""
+        if self._row_of is None:
+            self._row_of = {cid: i for i, cid in enumerate(self.ids)}
+        mask = self.mask(where)
+        rows = [self._row_of[cid] for cid in ids
+                if cid in self._row_of and (mask is None or mask[self._row_of[cid]])]
+        return {
+            "ids": [self.ids[r] for r in rows],
+            "documents": [self.document(r) for r in rows],
+            "metadatas": [self.metadatas[r] for r in rows],
+            "embeddings": np.array(self.vectors[rows]),
+        }
+
+
+_open: Dict[str, Tuple[str, Snapshot]] = {}
+_open_lock = threading.Lock()
+
+
+def open_snapshot(collection_name: str, snapshot_dir: str = SNAPSHOT_DIR) -> Optional[Snapshot]:
+    """The current snapshot for a collection, reopened when a newer version is published;
+    None when the collection has never been exported."""
+    version = _current_version(collection_name, snapshot_dir)
+    if version is None:
+        return None
+    key = os.path.join(os.path.abspath(snapshot_dir), collection_name)
+    cached = _open.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with _open_lock:
+        cached = _open.get(key)
+        if cached is None or cached[0] != version:
+            cached = (version, Snapshot(os.path.join(_collection_dir(collection_name, snapshot_dir), version)))
+            _open[key] = cached
+    return cached[1]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from ..chroma_storage.chroma_config import get_collection
+
+    parser = argparse.ArgumentParser(description="Export or refresh a memory-mapped collection snapshot")
+    parser.add_argument("command", choices=["export", "refresh"])
+    parser.add_argument("collection")
+    parser.add_argument("--ivf", action="store_true", default=None, help="Build an IVF index")
+    parser.add_argument("--no-ivf", dest="ivf", action="store_false", help="Brute force only")
+    args = parser.parse_args()
+
+    col = get_collection(args.collection, create=False)
+    if args.command == "export":
+        print(export_snapshot(col, ivf=args.ivf))
+    else:
+        print(refresh_snapshot(col, ivf=args.ivf) or "nothing to refresh")
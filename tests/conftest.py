@@ -0,0 +1,11 @@
+# Point every store at a throwaway directory and use the offline embedding backend. This
+# runs before the test modules import the services, which read their settings at import.
+import atexit
+import os
+import shutil
+import tempfile
+
+_STORE = tempfile.mkdtemp(prefix="brag-tests-")
+os.environ["CHROMA_DB_PATH"] = _STORE
+os.environ["EMBEDDING_BACKEND"] = "hashing"
+atexit.register(shutil.rmtree, _STORE, ignore_errors=True)
@@ -0,0 +1,110 @@
+import json
+import threading
+import time
+
+import pytest
+
+from services.log_tracing import trace
+from services.log_tracing.abi_cache import AbiCache
+
+PROXY_A = "0x" + "aa" * 20
+PROXY_B = "0x" + "bb" * 20
+IMPL = "0x" + "11" * 20
+PLAIN = "0x" + "cc" * 20
+UNVERIFIED = "0x" + "dd" * 20
+BROKEN = "0x" + "ee" * 20
+
+
+def _abi(*names):
+    return json.dumps([{"type": "event", "name": n, "inputs": []} for n in names])
+
+
+CONTRACTS = {
+    PROXY_A: (_abi("Upgraded"), IMPL),
+    PROXY_B: (_abi("Upgraded"), IMPL),
+    IMPL: (_abi("Supply", "Borrow"), None),
+    PLAIN: (_abi("Transfer"), None),
+    UNVERIFIED: (None, None),
+}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = AbiCache(str(tmp_path / "abis.sqlite3"))
+    yield cache
+    cache.close()
+
+
+def test_entries_expire_by_kind(tmp_path):
+    cache = AbiCache(str(tmp_path / "abis.sqlite3"), negative_ttl=0.05, proxy_ttl=0.05)
+    cache.put("eth", PLAIN.upper().replace("0X", "0x"), _abi("Transfer"))
+    cache.put("eth", UNVERIFIED, None)
+    cache.put("eth", PROXY_A, _abi("Upgraded"), IMPL.upper().replace("0X", "0x"))
+    assert cache.get("eth", PROXY_A) == (_abi("Upgraded"), IMPL)
+    assert set(cache.get_many("eth", [PLAIN, UNVERIFIED, PROXY_A])) == {PLAIN, UNVERIFIED, PROXY_A}
+    assert cache.get("base", PLAIN) is None
+    time.sleep(0.1)
+    # verified ABIs are kept; negative entries and proxy pointers are looked up again
+    assert cache.get_many("eth", [PLAIN, UNVERIFIED, PROXY_A]) == {PLAIN: (_abi("Transfer"), None)}
+    stats = cache.stats()
+    assert (stats["entries"], stats["verified"], stats["proxies"]) == (3, 2, 1)
+    cache.close()
+
+
+@pytest.fixture
+def explorer(monkeypatch, cache):
+    calls = []
+    lock = threading.Lock()
+
+    def fetch(address):
+        with lock:
+            calls.append(address)
+        if address == BROKEN:
+            raise ConnectionError("explorer down")
+        return CONTRACTS[address]
+
+    monkeypatch.setattr(trace, "get_abi_cache", lambda: cache)
+    monkeypatch.setattr(trace, "_fetch_contract", fetch)
+    return calls
+
+
+def _names(abi):
+    return sorted(item["name"] for item in json.loads(abi))
+
+
+def test_proxies_get_their_implementation_merged_in(explorer):
+    abis = trace.resolve_abis([PROXY_A, PROXY_B.upper().replace("0X", "0x"), PLAIN, UNVERIFIED, BROKEN])
+    assert set(abis) == {PROXY_A, PROXY_B.upper().replace("0X", "0x"), PLAIN}
+    assert _names(abis[PROXY_A]) == ["Borrow", "Supply", "Upgraded"]
+    assert _names(abis[PLAIN]) == ["Transfer"]
+    # the shared implementation is looked up once for both proxies
+    assert sorted(explorer) == sorted([PROXY_A, PROXY_B, PLAIN, UNVERIFIED, BROKEN, IMPL])
+
+
+def test_second_lookup_is_served_from_the_cache(explorer, cache):
+    trace.resolve_abis([PROXY_A, PLAIN, UNVERIFIED, BROKEN])
+    explorer.clear()
+    logs = [{"address": a} for a in (PROXY_A, PLAIN, PLAIN, UNVERIFIED, BROKEN)]
+    assert set(trace.fetch_abi_from_logs(logs)) == {PROXY_A, PLAIN}
+    # only the failed lookup, which isn't cached, goes back to the explorer
+    assert explorer == [BROKEN]
+    assert cache.stats()["hits"] >= 4
+
+
+def test_getsourcecode_response_parsing(monkeypatch):
+    responses = {
+        PROXY_A: {"ABI": _abi("Upgraded"), "ImplementationAddress": IMPL.upper().replace("0X", "0x")},
+        PROXY_B: {"ABI": _abi("Upgraded"), "ImplementationAddresses": [IMPL]},
+        PLAIN: {"ABI": _abi("Transfer"), "ImplementationAddress": PLAIN},
+        UNVERIFIED: {"ABI": "Contract source code not verified"},
+    }
+
+    class Client:
+        def get(self, url, params):
+            return {"status": "1", "result": [responses[params["address"]]]}
+
+    monkeypatch.setattr(trace, "get_client", lambda: Client())
+    assert trace._fetch_contract(PROXY_A) == (_abi("Upgraded"), IMPL)
+    assert trace._fetch_contract(PROXY_B) == (_abi("Upgraded"), IMPL)
+    assert trace._fetch_contract(PLAIN) == (_abi("Transfer"), None)
+    assert trace._fetch_contract(UNVERIFIED) == (None, None)
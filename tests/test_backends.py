@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+
+from services.retriever.backends import ensure_collection_backend
+from services.retriever.snapshot import _collection_space
+
+
+class _Backend:
+    name = "test"
+    model_id = "test-model"
+    dimension = 3
+
+    def embed(self, texts):
+        return np.zeros((len(texts), 3), dtype=np.float32)
+
+
+def test_tags_legacy_collection_created_with_hnsw_space(tmp_path):
+    client = chromadb.PersistentClient(path=str(tmp_path))
+    collection = client.create_collection("legacy", metadata={"hnsw:space": "cosine", "owner": "docs"})
+    collection.add(ids=["a"], embeddings=[[0.1, 0.2, 0.3]])
+
+    ensure_collection_backend(collection, _Backend())
+
+    reopened = client.get_collection("legacy")
+    assert reopened.metadata["embedding_model"] == "test-model"
+    assert reopened.metadata["owner"] == "docs"
+    assert _collection_space(reopened) == "cosine"
+    # already tagged: checked, not modified again
+    ensure_collection_backend(reopened, _Backend())
@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from services.log_tracing.blockscout import BlockscoutClient, TokenBucket
+
+PARAMS = {"module": "logs", "action": "getLogs"}
+
+
+class _Stub:
+    """Local explorer stand-in answering with a scripted list of (status, headers, body)."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.hits = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.hits.append(time.monotonic())
+                status, headers, body = stub.script.pop(0) if stub.script else (200, {}, {"result": []})
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(script):
+        servers.append(_Stub(script))
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.close()
+
+
+def test_retries_429_then_5xx_then_succeeds(stub):
+    server = stub([
+        (429, {"Retry-After": "0.3"}, {"message": "Too many requests"}),
+        (503, {}, {"message": "unavailable"}),
+        (200, {}, {"status": "1", "result": ["ok"]}),
+    ])
+    client = BlockscoutClient(rate=100, burst=5, max_retries=4, backoff=0.05)
+    assert client.get(server.url, PARAMS) == {"status": "1", "result": ["ok"]}
+
+    assert len(server.hits) == 3
+    # Retry-After is honoured; the 5xx retry uses the (short) jittered backoff instead
+    assert server.hits[1] - server.hits[0] >= 0.3
+    assert server.hits[2] - server.hits[1] < 0.3
+    stats = client.stats()["logs.getLogs"]
+    assert (stats["requests"], stats["retries"], stats["throttled"], stats["errors"]) == (1, 2, 1, 0)
+    assert stats["max_ms"] >= 300
+
+
+def test_rate_limit_message_in_a_200_body_is_retried(stub):
+    server = stub([(200, {}, {"message": "Max rate limit reached"}), (200, {}, {"result": [1]})])
+    client = BlockscoutClient(rate=100, burst=5, backoff=0.01)
+    assert client.get(server.url, PARAMS) == {"result": [1]}
+    assert client.stats()["logs.getLogs"]["throttled"] == 1
+
+
+def test_gives_up_after_max_retries(stub):
+    server = stub([(502, {}, {})] * 5)
+    client = BlockscoutClient(rate=100, burst=5, max_retries=2, backoff=0.01)
+    with pytest.raises(requests.HTTPError):
+        client.get(server.url, PARAMS)
+    assert len(server.hits) == 3
+    stats = client.stats()["logs.getLogs"]
+    assert (stats["requests"], stats["retries"], stats["errors"]) == (1, 2, 1)
+
+
+def test_client_errors_are_not_retried(stub):
+    server = stub([(404, {}, {"message": "not found"})])
+    client = BlockscoutClient(rate=100, burst=5, max_retries=4, backoff=0.01)
+    with pytest.raises(requests.HTTPError):
+        client.get(server.url, PARAMS)
+    assert len(server.hits) == 1
+    assert client.stats()["logs.getLogs"]["errors"] == 1
+
+
+def test_requests_are_paced_by_the_token_bucket(stub):
+    server = stub([])
+    client = BlockscoutClient(rate=20, burst=2, backoff=0.01)
+    threads = [threading.Thread(target=client.get, args=(server.url, PARAMS)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(server.hits) == 8
+    hits = sorted(server.hits)
+    # two burst tokens, then one request per 1/20 s
+    assert hits[-1] - hits[0] >= 5 / 20
+    assert client.stats()["logs.getLogs"]["requests"] == 8
+
+
+def test_token_bucket_reports_waiting():
+    bucket = TokenBucket(rate=50, burst=1)
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() > 0.0
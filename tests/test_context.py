@@ -0,0 +1,33 @@
+import numpy as np
+
+import services.llm.context as context
+
+
+def _chunks(n=4, dim=8):
+    rng = np.random.default_rng(0)
+    return [{"id": f"doc:{i}", "content": f"passage {i} on liquidations",
+             "metadata": {"source": "doc", "chunk_index": i * 2},
+             "embedding": rng.normal(size=dim).astype(np.float32)} for i in range(n)]
+
+
+def test_select_context_reuses_retrieval_vectors(monkeypatch):
+    def embed(texts):
+        raise AssertionError(f"re-embedded {texts}")
+
+    monkeypatch.setattr(context, "get_embeddings", embed)
+    segments = context.select_context("liquidations", _chunks(), query_embedding=np.ones(8, dtype=np.float32))
+    assert len(segments) == 4
+
+
+def test_select_context_embeds_only_what_is_missing(monkeypatch):
+    embedded = []
+
+    def embed(texts):
+        embedded.extend(texts)
+        return np.ones((len(texts), 8), dtype=np.float32)
+
+    monkeypatch.setattr(context, "get_embeddings", embed)
+    chunks = _chunks()
+    chunks[1]["embedding"] = None
+    context.select_context("liquidations", chunks)
+    assert embedded == ["liquidations", chunks[1]["content"]]
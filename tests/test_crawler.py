@@ -0,0 +1,74 @@
+from services.log_tracing import crawler
+
+FACTORY = "0x" + "fa" * 20
+POOLS = ["0x" + "a1" * 20, "0x" + "a2" * 20]
+TOKEN = "0x" + "70" * 20
+DEPLOYER = "0x" + "de" * 20
+EVENT = "0x" + "ee" * 32
+
+
+def _topic(address):
+    return "0x" + "00" * 12 + address[2:]
+
+
+def _log(emitter, *mentioned):
+    return {"address": emitter, "topics": [EVENT] + [_topic(a) for a in mentioned], "data": "0x",
+            "blockNumber": "0x10", "logIndex": "0x0", "transactionHash": "0x01"}
+
+
+LOGS = {
+    FACTORY: [_log(FACTORY, POOLS[0]), _log(FACTORY, POOLS[1])],
+    POOLS[0]: [_log(POOLS[0], TOKEN)],
+    POOLS[1]: [_log(POOLS[1], TOKEN), _log(POOLS[1], TOKEN)],
+}
+CREATIONS = {POOLS[0]: FACTORY, POOLS[1]: FACTORY, TOKEN: DEPLOYER}
+
+
+def _fake_chain(monkeypatch):
+    calls = {"logs": 0}
+
+    def logs(addresses, from_block):
+        calls["logs"] += 1
+        return [log for a in addresses for log in LOGS.get(a, [])]
+
+    def creations(addresses):
+        return {a: {"creator": CREATIONS[a], "tx": "0x" + "11" * 32} for a in addresses if a in CREATIONS}
+
+    monkeypatch.setattr(crawler, "aggregate_protocol_logs", logs)
+    monkeypatch.setattr(crawler, "resolve_abis", lambda addresses: {})
+    monkeypatch.setattr(crawler, "get_contract_creations", creations)
+    return calls
+
+
+def test_crawl_expands_deployed_contracts_only(monkeypatch, tmp_path):
+    _fake_chain(monkeypatch)
+    graph = crawler.crawl_protocol(FACTORY, 100, max_depth=3, graph_dir=str(tmp_path))
+
+    assert crawler.protocol_addresses(graph) == [FACTORY] + POOLS
+    assert graph["nodes"][TOKEN]["kind"] == "referenced" and graph["nodes"][TOKEN].get("logs") is None
+    assert {graph["nodes"][p]["kind"] for p in POOLS} == {"deployed"}
+    assert graph["nodes"][POOLS[1]]["logs"] == 2
+    deployed = {(e["from"], e["to"]) for e in graph["edges"] if e["kind"] == "deployed"}
+    assert deployed == {(FACTORY, p) for p in POOLS}
+    token_mentions = {e["from"]: e["mentions"] for e in graph["edges"] if e["to"] == TOKEN}
+    assert token_mentions == {POOLS[0]: 1, POOLS[1]: 2}
+
+
+def test_saved_graph_is_reused_whatever_the_block_format(monkeypatch, tmp_path):
+    calls = _fake_chain(monkeypatch)
+    crawler.crawl_protocol(FACTORY, 21000000, max_depth=1, graph_dir=str(tmp_path))
+    crawled = calls["logs"]
+    for from_block in ("21000000", hex(21000000), 21000000):
+        crawler.crawl_protocol(FACTORY, from_block, max_depth=1, graph_dir=str(tmp_path))
+    assert calls["logs"] == crawled
+
+    crawler.crawl_protocol(FACTORY, 21000001, max_depth=1, graph_dir=str(tmp_path))
+    assert calls["logs"] > crawled
+    assert crawler.load_protocol_graph(FACTORY, str(tmp_path))["from_block"] == 21000001
+
+
+def test_malformed_decoded_addresses_are_skipped(monkeypatch):
+    found = ["0xnot-an-address", None, "0x" + "0" * 40, "0x1234", POOLS[0].upper().replace("0X", "0x")]
+    monkeypatch.setattr(crawler, "referenced_addresses", lambda log, table: found)
+    mentions = crawler._mentions([_log(FACTORY)], table=None)
+    assert mentions == {POOLS[0]: {FACTORY: 1}}
@@ -0,0 +1,69 @@
+from services.log_tracing.decoder import EventSpec, SelectorTable, decode_log, referenced_addresses
+
+EMITTER = "0x00000000000000000000000000000000000000e1"
+# made-up topic0: keccak isn't needed to exercise decoding
+TOPIC0 = "0x" + "ab" * 32
+OWNER = "0x" + "11" * 20
+
+
+def _table(inputs):
+    spec = EventSpec("Update", "Update(...)", TOPIC0, tuple(inputs), sum(1 for p in inputs if p.get("indexed")))
+    table = SelectorTable()
+    table.events[TOPIC0] = [spec]
+    return table
+
+
+def _topic(value: int) -> str:
+    return "0x" + value.to_bytes(32, "big").hex()
+
+
+def test_indexed_non_elementary_types_come_back_as_hashes():
+    table = _table([
+        {"name": "owner", "type": "address", "indexed": True},
+        {"name": "pair", "type": "uint256[2]", "indexed": True},
+        {"name": "label", "type": "string", "indexed": True},
+        {"name": "amount", "type": "uint256", "indexed": False},
+    ])
+    pair_hash, label_hash = "0x" + "cd" * 32, "0x" + "ef" * 32
+    log = {
+        "address": EMITTER,
+        "topics": [TOPIC0, "0x" + "00" * 12 + OWNER[2:], pair_hash, label_hash],
+        "data": _topic(7),
+        "blockNumber": "0x10",
+    }
+    decoded = decode_log(log, table)
+    assert decoded["args"] == {
+        "owner": OWNER,
+        "pair": {"hash": pair_hash},
+        "label": {"hash": label_hash},
+        "amount": 7,
+    }
+    assert decoded["block"] == 16
+    assert referenced_addresses(log, table) == [OWNER]
+
+
+def test_indexed_address_array_is_not_mistaken_for_addresses():
+    table = _table([{"name": "members", "type": "address[]", "indexed": True}])
+    log = {"address": EMITTER, "topics": [TOPIC0, "0x" + "12" * 32], "data": "0x"}
+    assert decode_log(log, table)["args"] == {"members": {"hash": "0x" + "12" * 32}}
+    assert referenced_addresses(log, table) == []
+
+
+def test_missing_keccak_degrades_to_undecoded_summary(monkeypatch):
+    from services.log_tracing import decoder
+
+    def no_keccak(data):
+        raise ImportError("ABI decoding requires `pip install eth-hash[pycryptodome]`")
+
+    monkeypatch.setattr(decoder, "keccak256", no_keccak)
+    decoder._compile_abi.cache_clear()
+    decoder.event_topic.cache_clear()
+    abi = '[{"type": "event", "name": "Update", "inputs": [{"name": "owner", "type": "address", "indexed": true}]},' \
+          ' {"type": "function", "name": "poke", "inputs": [{"name": "x", "type": "uint"}]}]'
+    abis = {EMITTER: abi}
+    table = decoder.compile_abis(abis)
+    assert table.events == {}
+    log = {"address": EMITTER, "topics": [TOPIC0, "0x" + "00" * 32], "data": "0x"}
+    summary = decoder.summarize_logs([log], abis, table)
+    assert summary["events"] == [] and summary["undecoded"] == {TOPIC0: 1}
+    assert decoder.describe_abis(abis) == {EMITTER: {"events": ["Update(address)"], "functions": ["poke(uint256)"]}}
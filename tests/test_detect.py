@@ -0,0 +1,53 @@
+import numpy as np
+
+from services.log_tracing.detect import AnomalyDetector, LogBatch, detect_time_gaps, iter_batches
+
+T0 = 1_700_000_000
+
+
+def _logs(n, start=T0, step=60, topic="0xaa"):
+    return [{"blockNumber": hex(100 + i), "timeStamp": hex(start + i * step), "topics": [topic]}
+            for i in range(n)]
+
+
+def test_single_window_batch():
+    # all logs fall in one hour: no window ever closes before finish()
+    assert detect_time_gaps(_logs(10)) == []
+    assert AnomalyDetector().run(iter_batches(_logs(10))) == []
+
+
+def test_batches_ending_before_first_window_boundary():
+    detector = AnomalyDetector()
+    found = []
+    for batch in iter_batches(_logs(50, step=10), batch_logs=7):
+        found.extend(detector.update(batch))
+    found.extend(detector.finish())
+    assert found == []
+
+
+def test_multi_batch_stream_matches_single_batch():
+    rng = np.random.default_rng(1)
+    blocks = np.sort(rng.integers(0, 200_000, 50_000))
+    times = T0 + blocks * 12
+    topics = rng.choice(np.array(["0xa", "0xb"], dtype=object), len(blocks))
+    spike = np.full(2000, 120_000)
+    blocks = np.concatenate([blocks, spike])
+    times = np.concatenate([times, T0 + spike * 12])
+    topics = np.concatenate([topics, np.array(["0xb"] * len(spike), dtype=object)])
+    order = np.argsort(blocks, kind="stable")
+    blocks, times, topics = blocks[order], times[order], topics[order]
+
+    whole = AnomalyDetector().run([LogBatch(blocks, times, topics)])
+    streamed = AnomalyDetector().run(LogBatch(blocks[i:i + 997], times[i:i + 997], topics[i:i + 997])
+                                     for i in range(0, len(blocks), 997))
+    # the closed-form EWMA is summed per batch, so only the last bits of the scores differ
+    assert [a[:6] for a in streamed] == [a[:6] for a in whole]
+    assert np.allclose([a.zscore for a in streamed], [a.zscore for a in whole])
+    assert any(a.kind == "spike" and a.topic == "0xb" and a.axis == "block" and a.start <= 120_000 <= a.end
+               for a in whole)
+
+
+def test_gap_detected():
+    logs = _logs(200) + _logs(50, start=T0 + 200 * 60 + 6 * 3600)
+    gaps = detect_time_gaps(logs)
+    assert len(gaps) == 1 and gaps[0].value >= 6 * 3600
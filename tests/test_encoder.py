@@ -0,0 +1,85 @@
+import time
+
+import numpy as np
+import pytest
+
+from services.retriever import encoder
+from services.retriever.backends import EmbeddingBackend
+
+
+class _InputRejected(Exception):
+    pass
+
+
+class _FlakyBackend(EmbeddingBackend):
+    name = "flaky"
+    dimension = 4
+
+    def __init__(self, failures, poison=None):
+        self.failures = list(failures)  # raised by the first calls, in order
+        self.poison = poison            # text whose batches are rejected as bad input
+        self.calls = []
+
+    def embed(self, texts):
+        self.calls.append(list(texts))
+        if self.failures:
+            raise self.failures.pop(0)
+        if self.poison in texts:
+            raise _InputRejected(self.poison)
+        return np.ones((len(texts), self.dimension), dtype=np.float32)
+
+    def is_input_error(self, error):
+        return isinstance(error, _InputRejected)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(encoder.time, "sleep", delays.append)
+    return delays
+
+
+def _far():
+    return time.monotonic() + 3600
+
+
+def test_transient_errors_are_retried_with_backoff(sleeps):
+    backend = _FlakyBackend([TimeoutError(), ConnectionError()])
+    out = encoder._embed_with_retry(backend, ["a", "b"], max_retries=3, deadline=_far())
+    assert out.shape == (2, 4)
+    assert len(backend.calls) == 3
+    assert sleeps == [1, 2]
+
+
+def test_permanent_errors_are_raised_without_retry_or_split(sleeps):
+    backend = _FlakyBackend([PermissionError("401 invalid api key")] * 10)
+    with pytest.raises(PermissionError):
+        encoder._embed_with_retry(backend, [str(i) for i in range(2048)], max_retries=3, deadline=_far())
+    assert len(backend.calls) == 1
+    assert sleeps == []
+
+
+def test_transient_errors_give_up_after_max_retries(sleeps):
+    backend = _FlakyBackend([TimeoutError()] * 10)
+    with pytest.raises(RuntimeError):
+        encoder._embed_with_retry(backend, ["a", "b"], max_retries=3, deadline=_far())
+    assert len(backend.calls) == 3
+
+
+def test_retries_stop_at_the_deadline(sleeps):
+    backend = _FlakyBackend([TimeoutError()] * 10)
+    with pytest.raises(RuntimeError):
+        encoder._embed_with_retry(backend, ["a"], max_retries=10, deadline=time.monotonic() + 0.5)
+    assert len(backend.calls) == 1
+    assert sleeps == []
+
+
+def test_input_errors_split_down_to_the_offending_text(sleeps):
+    texts = [f"t{i}" for i in range(8)]
+    backend = _FlakyBackend([], poison="t5")
+    with pytest.raises(_InputRejected):
+        encoder._embed_with_retry(backend, texts, max_retries=3, deadline=_far())
+    # halves that don't hold the bad text are embedded, the rest keeps halving
+    assert ["t0", "t1", "t2", "t3"] in backend.calls
+    assert backend.calls[-1] == ["t5"]
+    assert sleeps == []
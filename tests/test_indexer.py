@@ -0,0 +1,101 @@
+import pytest
+
+from services.chroma_storage.chroma_config import get_collection
+from services.indexer import indexer
+from services.indexer.indexer import _index_chunks, _index_text
+from services.indexer.manifest import load_manifest
+from services.indexer.merkle import load_tree
+from services.retriever.lexical import get_lexical_index
+
+SOURCE = "doc://protocol"
+WORDS = dict(chunk_size_words=10, overlap_words=0)
+
+
+def _text(n, changed=None):
+    return " ".join(f"word{i}" if i != changed else "CHANGED" for i in range(n))
+
+
+def _index(text, collection, **metadata):
+    return _index_text(text, SOURCE, "url", collection, metadata=metadata or None, **WORDS)
+
+
+def _stored(collection):
+    return sorted(get_collection(collection).get(where={"source": SOURCE}, include=[])["ids"])
+
+
+def test_reindex_touches_only_changed_chunks():
+    name = "t-incremental"
+    first = _index(_text(50), name)
+    assert (first["added"], first["unchanged"]) == ("5", "0")
+
+    again = _index(_text(50), name)
+    assert again["skipped"] == "true" and again["merkle_root"] == first["merkle_root"]
+
+    edited = _index(_text(50, changed=23), name)
+    assert (edited["added"], edited["updated"], edited["unchanged"], edited["deleted"]) == ("0", "1", "4", "0")
+    doc = get_collection(name).get(ids=[f"{SOURCE}:2"])["documents"][0]
+    assert "CHANGED" in doc
+
+    shrunk = _index(_text(30), name)
+    assert (shrunk["deleted"], shrunk["unchanged"]) == ("2", "2")
+    assert _stored(name) == [f"{SOURCE}:{i}" for i in range(3)]
+    manifest = load_manifest(SOURCE, name)
+    assert manifest["ids"] == _stored(name) and manifest["merkle_root"] == shrunk["merkle_root"]
+    assert get_lexical_index().count(name) == 3
+
+
+def test_retagging_rewrites_every_chunk():
+    name = "t-retag"
+    _index(_text(20), name, chain="ethereum")
+    retagged = _index(_text(20), name, chain="Arbitrum")
+    assert (retagged["updated"], retagged["unchanged"]) == ("2", "0")
+    metadatas = get_collection(name).get(where={"source": SOURCE})["metadatas"]
+    assert {m["chain"] for m in metadatas} == {"arbitrum"}
+
+
+def test_source_that_becomes_empty_is_unindexed():
+    name = "t-empty"
+    _index(_text(30), name)
+    result = _index("", name)
+    assert result["deleted"] == "3"
+    assert _stored(name) == []
+    assert get_lexical_index().count(name) == 0
+    assert load_manifest(SOURCE, name) is None and load_tree(SOURCE, name) is None
+    # and a source that never had chunks is simply skipped
+    assert _index_text("", "doc://never", "url", name) == {"added": "0", "merkle_root": None}
+
+
+
+def test_failed_stream_leaves_no_orphan_chunks():
+    name = "t-failed-stream"
+
+    def chunks():
+        for i in range(7):
+            yield {"text": f"chunk number {i}"}
+        raise IOError("extraction failed")
+
+    with pytest.raises(IOError):
+        _index_chunks(chunks(), SOURCE, "url", name, write_batch_size=3)
+    assert _stored(name) == []
+    assert load_manifest(SOURCE, name) is None
+    assert get_lexical_index().count(name) == 0
+
+
+def test_changed_chunks_are_embedded_while_the_stream_is_read(monkeypatch):
+    produced = []
+    calls = []  # (chunks read from the stream so far, chunks in this embed call)
+    embed = indexer.get_embeddings
+
+    def chunks():
+        for i in range(25):
+            produced.append(i)
+            yield {"text": f"streamed chunk {i}"}
+
+    def recording_embed(texts, **kwargs):
+        calls.append((len(produced), len(texts)))
+        return embed(texts, **kwargs)
+
+    monkeypatch.setattr(indexer, "get_embeddings", recording_embed)
+    _index_chunks(chunks(), SOURCE, "url", "t-stream", write_batch_size=4)
+    # each window is embedded as soon as it is full, not after the whole stream is read
+    assert calls == [(4, 4), (8, 4), (12, 4), (16, 4), (20, 4), (24, 4), (25, 1)]
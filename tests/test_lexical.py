@@ -0,0 +1,86 @@
+import pytest
+
+from services.chroma_storage.chroma_config import get_collection
+from services.indexer.indexer import _index_chunks
+from services.retriever import retriever
+from services.retriever.lexical import LexicalIndex, rebuild_from_collection, reciprocal_rank_fusion, tokenize
+
+POOL = "0x" + "8dfb" * 10
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    yield index
+    index.close()
+
+
+def test_tokenize_splits_identifiers_but_keeps_hex_whole():
+    assert tokenize("getReserveData(asset)") == ["getreservedata", "get", "reserve", "data", "asset"]
+    assert tokenize("flash_loan at 0xAbC123") == ["flash_loan", "flash", "loan", "at", "0xabc123"]
+
+
+def test_upserts_and_deletes_keep_the_stats_consistent(index):
+    index.upsert("c", ["a", "b", "c"], ["supply and borrow", "liquidation call", "borrow rate"])
+    index.upsert("c", ["b"], ["repay"])
+    assert index.count("c") == 3
+    assert [doc for doc, _ in index.search("c", "liquidation")] == []
+    assert sorted(doc for doc, _ in index.search("c", "borrow")) == ["a", "c"]
+    index.delete("c", ["a", "missing"])
+    assert index.count("c") == 2
+    assert [doc for doc, _ in index.search("c", "borrow")] == ["c"]
+    # collections don't see each other's documents
+    assert index.search("other", "borrow") == []
+    index.clear("c")
+    assert index.count("c") == 0 and index.search("c", "repay") == []
+
+
+def test_rare_exact_terms_outrank_common_ones(index):
+    docs = [f"the pool handles deposits {i}" for i in range(8)] + ["the pool calls flashLoanSimple"]
+    index.upsert("c", [f"d{i}" for i in range(9)], docs)
+    hits = index.search("c", "pool flashLoanSimple", top_k=3)
+    assert hits[0][0] == "d8" and len(hits) == 3
+    assert hits[0][1] > hits[1][1]
+
+
+def test_hex_prefix_matches_full_addresses(index):
+    index.upsert("c", ["pool", "other"], [f"pool deployed at {POOL}", "router at 0x" + "11" * 20])
+    assert [doc for doc, _ in index.search("c", POOL[:10])] == ["pool"]
+    # too short to be treated as a prefix
+    assert index.search("c", POOL[:4]) == []
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "b"]], [0.5, 0.5], k=1)
+    assert [doc for doc, _ in fused] == ["c", "b", "a"]
+    assert fused[0][1] == pytest.approx(0.5 / 4 + 0.5 / 2)
+    # a zero weight ranking contributes nothing
+    assert [doc for doc, _ in reciprocal_rank_fusion([["a"], ["b"]], [1.0, 0.0])] == ["a"]
+
+
+def test_rebuild_from_collection(index):
+    collection = get_collection("t-lexical-rebuild")
+    collection.upsert(ids=["x", "y", "z"], documents=["mint shares", "burn shares", None],
+                      embeddings=[[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]])
+    index.upsert(collection.name, ["stale"], ["left over shares"])
+    assert rebuild_from_collection(index, collection, page_size=2) == 3
+    assert index.count(collection.name) == 3
+    assert sorted(doc for doc, _ in index.search(collection.name, "shares")) == ["x", "y"]
+
+
+def test_hybrid_retrieval_surfaces_exact_identifier_matches(monkeypatch):
+    name = "t-hybrid"
+    texts = [f"overview of lending markets part {i}" for i in range(12)]
+    texts[7] = f"the USDC pool is deployed at {POOL}"
+    _index_chunks(iter({"text": t} for t in texts), "doc://hybrid", "url", name)
+    monkeypatch.setenv("QUERY_CACHE", "0")
+    monkeypatch.setattr(retriever, "COLLECTION_NAME", name)
+    # the vector ranker only contributes one candidate, so the BM25 hit has to be fetched
+    monkeypatch.setattr(retriever, "HYBRID_CANDIDATES", 1)
+
+    best = retriever.retrieve(f"where is {POOL[:12]}", lexical_weight=1.0)
+    assert best["id"] == "doc://hybrid:7" and best["bm25"] > 0
+    assert best["content"] == texts[7] and "embedding" not in best
+
+    vector_only = retriever.retrieve("where is the pool", top_k=3, lexical_weight=0)
+    assert "bm25" not in vector_only and vector_only["distance"] is not None
@@ -0,0 +1,105 @@
+import pytest
+
+from services.log_tracing import trace
+from services.log_tracing.log_store import LogStore, SyncCursor
+
+POOL = "0x" + "a1" * 20
+TOKEN = "0x" + "70" * 20
+SWAP = "0x" + "5a" * 32
+MINT = "0x" + "4d" * 32
+
+
+def _log(address, block, index=0, topic=SWAP, tx=None):
+    return {"address": address, "blockNumber": hex(block), "logIndex": hex(index), "timeStamp": hex(1000 + block),
+            "transactionHash": tx or f"0x{block:04x}{index:04x}", "topics": [topic], "data": "0x"}
+
+
+def _blocks(logs):
+    return [int(log["blockNumber"], 16) for log in logs]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LogStore(str(tmp_path / "logs.sqlite3"))
+    yield store
+    store.close()
+
+
+def test_apply_replaces_the_range_and_queries_filter(store):
+    cursor = SyncCursor(0, 80, 100, 0.0)
+    store.apply("eth", POOL.upper().replace("0X", "0x"), [_log(POOL, b, topic=MINT if b == 30 else SWAP)
+                                                          for b in (10, 30, 90, 95)], 0, None, cursor)
+    store.apply("eth", TOKEN, [_log(TOKEN, 20)], 0, None, cursor)
+    assert store.cursor("eth", POOL) == cursor and store.cursor("other", POOL) is None
+
+    assert _blocks(store.query("eth")) == [10, 20, 30, 90, 95]
+    assert _blocks(store.query("eth", [POOL], from_block=20, to_block=90)) == [30, 90]
+    assert _blocks(store.query("eth", topic0=[MINT.upper().replace("0X", "0x")])) == [30]
+    assert _blocks(store.query("eth", limit=2)) == [10, 20]
+    blocks, times, topics = next(store.iter_columns("eth", [POOL]))
+    assert blocks.tolist() == [10, 30, 90, 95] and times.tolist() == [1010, 1030, 1090, 1095]
+    assert topics.tolist() == [SWAP, MINT, SWAP, SWAP]
+
+    # a re-fetch of blocks 81+ drops what was reorganised away
+    store.apply("eth", POOL, [_log(POOL, 96, tx="0xnew")], 81, None, SyncCursor(0, 90, 102, 0.0))
+    assert _blocks(store.query("eth", [POOL])) == [10, 30, 96]
+    assert store.stats() == {"logs": 4, "addresses": 2}
+
+
+class _Chain:
+    """Explorer stand-in: a head block and the logs currently on chain."""
+
+    def __init__(self, head, logs):
+        self.head = head
+        self.logs = logs
+        self.fetched = []
+
+    def fetch(self, addresses, lo, hi, max_workers=None):
+        self.fetched.append((tuple(addresses), lo, hi))
+        return [log for log in self.logs if log["address"] in addresses and lo <= int(log["blockNumber"], 16) <= hi]
+
+
+@pytest.fixture
+def chain(monkeypatch, store):
+    chain = _Chain(1000, [_log(POOL, 500), _log(POOL, 995), _log(TOKEN, 700)])
+    monkeypatch.setattr(trace, "get_log_store", lambda: store)
+    monkeypatch.setattr(trace, "fetch_logs", chain.fetch)
+    monkeypatch.setattr(trace, "get_block_number", lambda: chain.head)
+    monkeypatch.setattr(trace, "LOG_CONFIRMATIONS", 12)
+    monkeypatch.setattr(trace, "LOG_SYNC_INTERVAL", 0)
+    return chain
+
+
+def test_sync_fetches_only_new_and_unconfirmed_blocks(chain, store):
+    assert trace.sync_logs([POOL, TOKEN], 400) == 3
+    assert chain.fetched == [((POOL, TOKEN), 400, 1000)]
+    assert store.cursor(trace.CHAIN, POOL)[:3] == (400, 988, 1000)
+
+    # block 995 is reorganised away and its log lands in 1001 instead
+    chain.head = 1010
+    chain.logs = [_log(POOL, 500), _log(POOL, 1001, tx="0xmoved"), _log(TOKEN, 700)]
+    trace.sync_logs([POOL, TOKEN], 400)
+    assert chain.fetched[-1] == ((POOL, TOKEN), 989, 1010)
+    assert _blocks(trace.aggregate_protocol_logs([POOL], 400)) == [500, 1001]
+
+
+def test_earlier_start_is_backfilled_once(chain, store):
+    trace.sync_logs([POOL], 600)
+    chain.logs.append(_log(POOL, 100))
+    trace.sync_logs([POOL], 50)
+    assert chain.fetched[-2:] == [((POOL,), 50, 599), ((POOL,), 989, 1000)]
+    assert store.cursor(trace.CHAIN, POOL).start_block == 50
+    assert _blocks(trace.aggregate_protocol_logs([POOL], 50, to_block=600)) == [100, 500]
+
+
+def test_recently_synced_addresses_are_served_from_the_store(chain, monkeypatch):
+    trace.sync_logs([POOL], 400)
+    monkeypatch.setattr(trace, "LOG_SYNC_INTERVAL", 60)
+    assert _blocks(trace.aggregate_protocol_logs([POOL], 400)) == [500, 995]
+    assert len(chain.fetched) == 1
+
+
+def test_store_can_be_disabled(chain, monkeypatch):
+    monkeypatch.setattr(trace, "get_log_store", lambda: None)
+    assert _blocks(trace.aggregate_protocol_logs([POOL], 0, 900)) == [500]
+    assert chain.fetched == [((POOL,), 0, 900)]
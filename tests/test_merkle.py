@@ -0,0 +1,81 @@
+import hashlib
+import random
+
+import pytest
+
+from services.indexer.indexer import _index_chunks
+from services.indexer.merkle import MerkleTree, prove_chunk, verify_chunk_proof, verify_proof
+
+
+def _leaves(n, salt=""):
+    return [hashlib.sha256(f"{salt}{i}".encode()).digest() for i in range(n)]
+
+
+def test_trailing_duplicate_leaf_changes_the_root():
+    a, b, c = _leaves(3)
+    assert MerkleTree([a, b, c]).root != MerkleTree([a, b, c, c]).root
+    assert MerkleTree([a]).root == a
+    assert MerkleTree([]).root is None
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_incremental_updates_match_a_rebuild(seed):
+    rng = random.Random(seed)
+    leaves = _leaves(rng.randint(1, 12))
+    tree = MerkleTree(leaves)
+    for step in range(40):
+        op = rng.choice(["update", "append", "truncate", "apply"])
+        fresh = hashlib.sha256(f"{seed}-{step}".encode()).digest()
+        if op == "update" and leaves:
+            i = rng.randrange(len(leaves))
+            leaves[i] = fresh
+            tree.update(i, fresh)
+        elif op == "append":
+            leaves.append(fresh)
+            tree.append(fresh)
+        elif op == "truncate" and leaves:
+            size = rng.randrange(1, len(leaves) + 1)
+            del leaves[size:]
+            tree.truncate(size)
+        else:
+            size = rng.randint(1, len(leaves) + 3)
+            changes = {i: hashlib.sha256(f"{fresh.hex()}{i}".encode()).digest()
+                       for i in range(size) if i >= len(leaves) or rng.random() < 0.3}
+            leaves = [changes.get(i, leaves[i] if i < len(leaves) else None) for i in range(size)]
+            tree.apply(size, changes)
+        rebuilt = MerkleTree(leaves)
+        assert tree.layers == rebuilt.layers
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 5, 8, 13])
+def test_every_leaf_has_a_valid_proof(n):
+    leaves = _leaves(n)
+    tree = MerkleTree(leaves)
+    for i, leaf in enumerate(leaves):
+        proof = tree.proof(i)
+        assert verify_proof(leaf, proof, tree.root)
+        assert not verify_proof(_leaves(1, salt="x")[0], proof, tree.root)
+
+
+def test_serialization_round_trips_and_rejects_the_old_layout():
+    tree = MerkleTree(_leaves(11))
+    assert MerkleTree.from_bytes(tree.to_bytes()).layers == tree.layers
+    with pytest.raises(ValueError):
+        MerkleTree.from_bytes(b"MRKL1" + tree.to_bytes()[5:])
+
+
+def test_document_gaining_a_copy_of_its_last_chunk_is_reindexed():
+    chunks = [{"text": t} for t in ("alpha", "beta", "gamma")]
+    _index_chunks(iter(chunks), "doc://dup", "url", "t-merkle")
+    result = _index_chunks(iter(chunks + [chunks[-1]]), "doc://dup", "url", "t-merkle")
+    assert "skipped" not in result and result["added"] == "1"
+
+
+def test_indexed_chunks_prove_against_the_manifest_root():
+    texts = [f"chunk {i} of the spec" for i in range(5)]
+    result = _index_chunks(iter({"text": t} for t in texts), "doc://proof", "url", "t-merkle")
+    for i, text in enumerate(texts):
+        proof = prove_chunk(f"doc://proof:{i}", "t-merkle")
+        assert proof["root"] == result["merkle_root"]
+        assert verify_chunk_proof(text, proof)
+        assert not verify_chunk_proof(text + " (edited)", proof)
@@ -0,0 +1,50 @@
+import os
+
+from services.chroma_storage.chroma_config import get_collection
+from services.indexer import pipeline
+
+
+def _text(url):
+    return " ".join(f"{url.rsplit('/', 1)[-1]}-word{i}" for i in range(60))
+
+
+def _fetch(url):
+    if url.endswith("/down"):
+        raise ConnectionError("site unreachable")
+    return _text(url)
+
+
+def test_expand_inputs(tmp_path):
+    (tmp_path / "docs" / "nested").mkdir(parents=True)
+    for name in ("docs/a.pdf", "docs/nested/b.pdf", "docs/notes.txt"):
+        (tmp_path / name).write_bytes(b"")
+    listing = tmp_path / "sources.txt"
+    listing.write_text(f"# protocol docs\nhttps://docs.example/one\n\n{tmp_path}/docs/*.pdf\n")
+
+    sources = pipeline.expand_inputs([str(tmp_path / "docs"), str(listing), "https://docs.example/one"])
+    assert sources == [
+        (str(tmp_path / "docs" / "a.pdf"), "pdf"),
+        (str(tmp_path / "docs" / "nested" / "b.pdf"), "pdf"),
+        ("https://docs.example/one", "url"),
+    ]
+
+
+def test_run_pipeline_indexes_each_source_and_reports_failures(monkeypatch):
+    monkeypatch.setattr(pipeline, "extract_text_from_url", _fetch)
+    urls = [f"https://docs.example/{name}" for name in ("one", "two", "three", "down")]
+    sources = [(u, "url") for u in urls]
+    options = dict(collection_name="t-pipeline", chunk_size_words=10, overlap_words=0,
+                   embed_workers=2, write_batch_size=4, flush_interval=0.05, report=False)
+
+    results = pipeline.run_pipeline(sources, **options)
+    by_source = {r["source"]: r for r in results}
+    assert set(by_source) == set(urls)
+    for url in urls[:3]:
+        assert by_source[url]["added"] == "6"
+    assert by_source[urls[3]]["stage"] == "extract" and "unreachable" in by_source[urls[3]]["error"]
+    assert get_collection("t-pipeline").count() == 18
+    # spool files are cleaned up once their chunks are indexed
+    assert not [f for f in os.listdir(pipeline.tempfile.gettempdir()) if f.startswith("index-chunks-")]
+
+    again = pipeline.run_pipeline(sources[:3], **options)
+    assert all(r["skipped"] == "true" for r in again)
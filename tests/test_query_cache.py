@@ -0,0 +1,43 @@
+import numpy as np
+
+from services.retriever.query_cache import QueryCache, has_identifier
+
+COLLECTION = "test-query-cache"
+PARAMS = ("top_k", 5)
+
+
+def _emb(noise=0.0):
+    vec = np.ones(16, dtype=np.float32)
+    vec[0] += noise
+    return vec
+
+
+def test_queries_differing_only_in_address_do_not_collide():
+    cache = QueryCache(similarity=0.95)
+    a = "What does 0x7d2768de32b0b80b7a3454c06bdac94a69ddc7a9 emit on upgrade?"
+    b = "What does 0x87870bca3f3fd6335c3f4ce8392d69350b4fa4e2 emit on upgrade?"
+    cache.put(COLLECTION, a, PARAMS, _emb(), [{"id": "a"}])
+
+    # embeddings this close would be a semantic hit for ordinary text
+    assert cache.get_similar(COLLECTION, b, _emb(0.01), PARAMS) is None
+    assert cache.get(COLLECTION, b, PARAMS) is None
+    assert cache.get(COLLECTION, a.upper(), PARAMS) == [{"id": "a"}]
+
+
+def test_identifier_entries_not_served_to_paraphrases():
+    cache = QueryCache(similarity=0.95)
+    cache.put(COLLECTION, "Which events does selector a9059cbb map to", PARAMS, _emb(), [{"id": "sel"}])
+    assert cache.get_similar(COLLECTION, "which events does this selector map to", _emb(0.01), PARAMS) is None
+
+
+def test_plain_paraphrase_still_hits_semantically():
+    cache = QueryCache(similarity=0.95)
+    cache.put(COLLECTION, "How are Aave liquidations triggered?", PARAMS, _emb(), [{"id": "liq"}])
+    assert cache.get_similar(COLLECTION, "how do aave liquidations get triggered", _emb(0.01), PARAMS) == [{"id": "liq"}]
+
+
+def test_has_identifier():
+    assert has_identifier("balance of 0xabc")
+    assert has_identifier("tx 5c504ed432cb51138bcf09aa5e8a410dd4a1e204ef84bfed1be16dfba1b22060")
+    assert not has_identifier("how does the deadbeef pattern work")
+    assert not has_identifier("summarize the 2024 governance proposals")
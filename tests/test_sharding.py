@@ -0,0 +1,85 @@
+import datetime
+
+import pytest
+
+from services.chroma_storage.chroma_config import get_chroma_client, shard_name
+from services.indexer import indexer
+from services.indexer.indexer import _index_chunks, document_metadata, target_collection
+from services.retriever import retriever
+
+DOCS = {
+    "doc://aave": ({"protocol": "Aave", "chain": "Ethereum", "date": "2024-03-01"}, "aave lending pool"),
+    "doc://uni": ({"protocol": "Uniswap V3", "chain": "arbitrum", "date": "2023-06-15"}, "uniswap concentrated pool"),
+    "doc://misc": ({"chain": "ethereum", "date": datetime.date(2022, 1, 2)}, "general pool notes"),
+}
+
+
+def _index_all(collection):
+    for source, (metadata, topic) in DOCS.items():
+        chunks = ({"text": f"{topic} section {i}"} for i in range(3))
+        _index_chunks(chunks, source, "url", collection, metadata=metadata)
+
+
+def _sources(chunks):
+    return {c["metadata"]["source"] for c in chunks}
+
+
+@pytest.fixture
+def scoped(monkeypatch):
+    monkeypatch.setenv("QUERY_CACHE", "0")
+    monkeypatch.setattr(retriever, "_shards", None)
+
+    def use(collection, sharded):
+        monkeypatch.setattr(indexer, "SHARD_BY_PROTOCOL", sharded)
+        monkeypatch.setattr(retriever, "SHARD_BY_PROTOCOL", sharded)
+        monkeypatch.setattr(retriever, "COLLECTION_NAME", collection)
+        _index_all(collection)
+    return use
+
+
+def test_document_metadata_is_normalized():
+    assert document_metadata({"protocol": " Aave ", "chain": "Ethereum", "date": "2024-03-01",
+                              "version": 3, "note": None}) == \
+        {"protocol": "aave", "chain": "ethereum", "date": 20240301, "version": 3}
+    with pytest.raises(ValueError):
+        document_metadata({"tags": ["a", "b"]})
+
+
+def test_shard_names_are_valid_collection_names():
+    assert shard_name("docs", "Uniswap V3") == "docs-uniswap-v3"
+    assert shard_name("docs", "!!!") == "docs"
+    long = shard_name("docs", "x" * 80 + " protocol")
+    assert len(long) == 63 and long[-1].isalnum()
+
+
+def test_target_collection_follows_the_sharding_flag(monkeypatch):
+    assert target_collection("docs", {"protocol": "aave"}) == "docs"
+    monkeypatch.setattr(indexer, "SHARD_BY_PROTOCOL", True)
+    assert target_collection("docs", {"protocol": "aave"}) == "docs-aave"
+    assert target_collection("docs", {"chain": "ethereum"}) == "docs"
+
+
+def test_filters_and_protocol_scope_in_one_collection(scoped):
+    scoped("t-filtered", sharded=False)
+    [aave] = retriever.retrieve_many(["pool"], top_k=9, protocol="AAVE")
+    assert _sources(aave) == {"doc://aave"}
+    [both] = retriever.retrieve_many(["pool"], top_k=9, protocol=["aave", "uniswap v3"])
+    assert _sources(both) == {"doc://aave", "doc://uni"}
+    [recent] = retriever.retrieve_many(["pool"], top_k=9, where={"date": {"$gte": 20230101}})
+    assert _sources(recent) == {"doc://aave", "doc://uni"}
+    [combined] = retriever.retrieve_many(["pool"], top_k=9, where={"chain": "ethereum"}, protocol="uniswap v3")
+    assert combined == []
+
+
+def test_sharded_collections_are_searched_together_or_alone(scoped):
+    scoped("t-sharded", sharded=True)
+    names = {getattr(c, "name", c) for c in get_chroma_client().list_collections()}
+    assert {"t-sharded", "t-sharded-aave", "t-sharded-uniswap-v3"} <= names
+
+    [everything] = retriever.retrieve_many(["pool"], top_k=9)
+    assert _sources(everything) == set(DOCS)
+    assert {c["collection"] for c in everything} == {"t-sharded", "t-sharded-aave", "t-sharded-uniswap-v3"}
+    [uni] = retriever.retrieve_many(["pool"], top_k=9, protocol="Uniswap V3")
+    assert _sources(uni) == {"doc://uni"} and {c["collection"] for c in uni} == {"t-sharded-uniswap-v3"}
+    # a protocol with no shard yet finds nothing instead of searching everything
+    assert retriever.retrieve("pool", protocol="compound") is None
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from services.chroma_storage.chroma_config import get_collection
+from services.indexer.indexer import _index_chunks
+from services.retriever.snapshot import export_snapshot, journal_writes, open_snapshot, refresh_snapshot
+
+CHAINS = ["ethereum", "arbitrum", "base"]
+
+
+def _fill(name, n=60, dim=8, space="l2"):
+    rng = np.random.default_rng(0)
+    collection = get_collection(name, metadata={"hnsw:space": space})
+    collection.upsert(ids=[f"id{i}" for i in range(n)], documents=[f"doc {i} ünïcode" for i in range(n)],
+                      metadatas=[{"chain": CHAINS[i % 3], "date": 20240000 + i} for i in range(n)],
+                      embeddings=rng.normal(size=(n, dim)).astype(np.float32).tolist())
+    return collection, rng.normal(size=(3, dim)).astype(np.float32)
+
+
+@pytest.mark.parametrize("space", ["l2", "cosine", "ip"])
+@pytest.mark.parametrize("where", [None, {"chain": "arbitrum"},
+                                   {"$and": [{"chain": {"$in": ["ethereum", "base"]}}, {"date": {"$gte": 20240030}}]}])
+def test_queries_match_chroma(tmp_path, space, where):
+    collection, queries = _fill(f"t-snap-{space}", space=space)
+    info = export_snapshot(collection, str(tmp_path))
+    assert (info["count"], info["dim"], info["space"]) == (60, 8, space)
+
+    snapshot = open_snapshot(collection.name, str(tmp_path))
+    ours = snapshot.query(queries, n_results=5, where=where)
+    theirs = collection.query(query_embeddings=queries.tolist(), n_results=5, where=where,
+                              include=["documents", "metadatas", "distances"])
+    assert ours["ids"] == theirs["ids"]
+    assert ours["documents"] == theirs["documents"] and ours["metadatas"] == theirs["metadatas"]
+    np.testing.assert_allclose(ours["distances"], theirs["distances"], rtol=1e-4, atol=1e-4)
+
+
+def test_get_skips_unknown_and_filtered_rows(tmp_path):
+    collection, _ = _fill("t-snap-get")
+    export_snapshot(collection, str(tmp_path))
+    found = open_snapshot(collection.name, str(tmp_path)).get(["id1", "id2", "nope"], where={"chain": "arbitrum"})
+    assert found["ids"] == ["id1"] and found["documents"] == ["doc 1 ünïcode"]
+    assert found["embeddings"].shape == (1, 8)
+
+
+def test_ivf_search_finds_the_exact_neighbours_when_probing_every_list(tmp_path):
+    collection, queries = _fill("t-snap-ivf", n=200)
+    info = export_snapshot(collection, str(tmp_path), ivf=True)
+    assert info["ivf_lists"] > 1
+    snapshot = open_snapshot(collection.name, str(tmp_path))
+    for q in queries:
+        rows, _ = snapshot.search(q, 10, nprobe=info["ivf_lists"])
+        exact, _ = snapshot.search(q, 10, exact=True)
+        assert rows.tolist() == exact.tolist()
+
+
+def test_refresh_applies_journaled_writes_only(tmp_path):
+    collection, _ = _fill("t-snap-refresh")
+    export_snapshot(collection, str(tmp_path))
+    first = open_snapshot(collection.name, str(tmp_path))
+    assert refresh_snapshot(collection, str(tmp_path)) is None
+
+    collection.upsert(ids=["id3", "new"], documents=["rewritten", "added"], embeddings=[[1.0] * 8, [2.0] * 8])
+    collection.delete(ids=["id4"])
+    journal_writes(collection.name, ["id3", "new"], ["id4"], str(tmp_path))
+    info = refresh_snapshot(collection, str(tmp_path))
+    assert (info["copied"], info["fetched"], info["count"]) == (58, 2, 60)
+
+    snapshot = open_snapshot(collection.name, str(tmp_path))
+    assert snapshot is not first and first.count == 60
+    assert snapshot.get(["id3", "new", "id4"])["documents"] == ["rewritten", "added"]
+    assert sorted(snapshot.ids) == sorted(collection.get(include=[])["ids"])
+    # the journal was consumed
+    assert refresh_snapshot(collection, str(tmp_path)) is None
+
+
+def test_empty_collection_cannot_be_exported(tmp_path):
+    with pytest.raises(ValueError):
+        export_snapshot(get_collection("t-snap-empty"), str(tmp_path))
+    assert open_snapshot("t-snap-empty", str(tmp_path)) is None
+
+
+def test_indexer_refreshes_an_exported_snapshot():
+    name = "t-snap-indexer"
+    texts = [f"section {i} of the spec" for i in range(4)]
+    _index_chunks(iter({"text": t} for t in texts), "doc://snap", "url", name)
+    export_snapshot(get_collection(name))
+
+    texts[2] = "section two, rewritten"
+    _index_chunks(iter({"text": t} for t in texts[:3]), "doc://snap", "url", name)
+    snapshot = open_snapshot(name)
+    assert sorted(snapshot.ids) == [f"doc://snap:{i}" for i in range(3)]
+    assert snapshot.get(["doc://snap:2"])["documents"] == ["section two, rewritten"]
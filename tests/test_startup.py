@@ -0,0 +1,22 @@
+import importlib
+
+from services.chroma_storage.chroma_config import get_chroma_client
+
+
+def test_imports_write_nothing_to_stdout(capsys):
+    for module in ("services.retriever.retriever", "services.llm.orchestrator", "services.indexer.indexer"):
+        importlib.import_module(module)
+    assert capsys.readouterr().out == ""
+
+
+def test_first_use_writes_nothing_to_stdout(capsys):
+    from services.indexer.indexer import _index_text
+    from services.retriever import retriever
+
+    get_chroma_client()
+    text = "Liquidations close undercollateralised positions. The health factor drops below one."
+    _index_text(text, "doc://startup", "url", retriever.COLLECTION_NAME, chunk_size_words=8, overlap_words=2)
+    retriever.warm_up()
+    best = retriever.retrieve("health factor")
+    assert best is not None and "health factor" in best["content"]
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,89 @@
+import pytest
+import tiktoken
+
+from services.indexer import token_chunker
+from services.indexer.token_chunker import _SENTENCE_RE, iter_token_chunks
+
+# one token per byte: a real tiktoken Encoding that needs no downloaded BPE data
+_BYTES = tiktoken.Encoding(name="test-bytes", pat_str=r"\S+|\s+",
+                           mergeable_ranks={bytes([i]): i for i in range(256)}, special_tokens={})
+
+PAGES = [
+    "1 Overview\n\nThe pool holds reserves. Each swap pays a fee. Fees accrue to liquidity providers.",
+    "2 Oracles\n\nPrices come from a time-weighted average. The window is thirty minutes long! "
+    "Short windows are cheaper to manipulate. Why? Because less capital is needed.",
+    "3 Governance\n\nProposals need a quorum. Votes are weighted by stake.",
+]
+
+
+@pytest.fixture(autouse=True)
+def byte_encoder(monkeypatch):
+    monkeypatch.setattr(token_chunker, "get_encoder", lambda name=None: _BYTES)
+
+
+def _sentence_starts(pages):
+    starts, offset = set(), 0
+    for page in pages:
+        starts.update(offset + m.start() for m in _SENTENCE_RE.finditer(page))
+        offset += len(page) + 1
+    return starts
+
+
+def test_unpunctuated_headings_are_their_own_sentences():
+    text = ("1 Introduction\n\nEthereum is a platform. It runs code!\n\n"
+            "2.1 Accounts\n  \nEach account has a nonce\nand a balance")
+    assert _SENTENCE_RE.findall(text) == [
+        "1 Introduction",
+        "Ethereum is a platform.",
+        "It runs code!",
+        "2.1 Accounts",
+        "Each account has a nonce\nand a balance",
+    ]
+
+
+def test_single_newlines_do_not_end_a_sentence():
+    assert _SENTENCE_RE.findall("A sentence wrapped\nacross lines. Next one") == [
+        "A sentence wrapped\nacross lines.",
+        "Next one",
+    ]
+
+
+def test_char_offsets_round_trip_across_pages():
+    document = "\n".join(PAGES)
+    page_ends = [sum(len(p) + 1 for p in PAGES[:i + 1]) - 1 for i in range(len(PAGES))]
+
+    def page_of(offset):
+        return next(i + 1 for i, end in enumerate(page_ends) if offset <= end)
+
+    chunks = list(iter_token_chunks([(p, i + 1) for i, p in enumerate(PAGES)], size_tokens=80, overlap_tokens=30))
+    assert len(chunks) > 3
+    for chunk in chunks:
+        assert document[chunk["char_start"]:chunk["char_end"]] == chunk["text"]
+        assert chunk["page_start"] == page_of(chunk["char_start"])
+        assert chunk["page_end"] == page_of(chunk["char_end"] - 1)
+    assert chunks[0]["char_start"] == 0
+    assert chunks[-1]["char_end"] == len(document)
+
+
+def test_no_chunk_exceeds_the_token_budget():
+    long_sentence = "word " * 100 + "end."
+    units = [(p, None) for p in PAGES] + [(long_sentence, None)]
+    for size in (40, 80, 200):
+        for chunk in iter_token_chunks(units, size_tokens=size, overlap_tokens=size // 4):
+            assert 0 < chunk["token_count"] <= size
+            assert chunk["token_end"] - chunk["token_start"] == chunk["token_count"]
+
+
+def test_overlap_is_carried_as_whole_sentences():
+    document = "\n".join(PAGES)
+    starts = _sentence_starts(PAGES)
+    chunks = list(iter_token_chunks([(p, None) for p in PAGES], size_tokens=80, overlap_tokens=30))
+    overlaps = 0
+    for prev, chunk in zip(chunks, chunks[1:]):
+        assert chunk["char_start"] in starts
+        if chunk["char_start"] < prev["char_end"]:
+            overlaps += 1
+            shared = document[chunk["char_start"]:prev["char_end"]]
+            assert prev["text"].endswith(shared) and chunk["text"].startswith(shared)
+            assert prev["token_end"] - chunk["token_start"] <= 30
+    assert overlaps
@@ -0,0 +1,93 @@
+import random
+import threading
+import time
+
+import pytest
+
+from services.log_tracing import trace
+
+POOL = "0x" + "a1" * 20
+TOKEN = "0x" + "70" * 20
+
+
+def _log(address, block, index, tx=None):
+    return {"address": address, "blockNumber": hex(block), "logIndex": hex(index),
+            "transactionHash": tx or f"0x{block:04x}{index:04x}", "topics": [], "data": "0x"}
+
+
+class _Explorer:
+    """getLogs over a fixed set of logs, truncated at the result cap like Blockscout."""
+
+    def __init__(self, logs, cap):
+        self.logs = logs
+        self.cap = cap
+        self.windows = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, address, lo, hi):
+        with self._lock:
+            self.windows.append((address, lo, hi))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.001)
+        with self._lock:
+            self.in_flight -= 1
+        found = [log for log in self.logs if log["address"] == address and lo <= int(log["blockNumber"], 16) <= hi]
+        return found[:self.cap]
+
+
+@pytest.fixture
+def explorer(monkeypatch):
+    def install(logs, cap=5, head=1000):
+        fake = _Explorer(logs, cap)
+        monkeypatch.setattr(trace, "LOGS_RESULT_CAP", cap)
+        monkeypatch.setattr(trace, "_get_logs_window", fake)
+        monkeypatch.setattr(trace, "get_block_number", lambda: head)
+        return fake
+    return install
+
+
+def test_windows_that_hit_the_cap_are_split_until_complete(explorer):
+    rng = random.Random(1)
+    # a dense burst for the pool, sparse logs for the token
+    logs = [_log(POOL, 400 + i // 3, i % 3) for i in range(60)]
+    logs += [_log(TOKEN, rng.randrange(0, 1001), 0, tx=f"0x{i:08x}") for i in range(20)]
+    fake = explorer(logs)
+
+    found = trace.fetch_logs([POOL, TOKEN, POOL], 0, "latest", window_blocks=100, max_workers=3)
+    assert sorted(map(trace._log_key, found)) == sorted(map(trace._log_key, logs))
+    assert found == sorted(found, key=trace._log_order)
+    assert fake.max_in_flight <= 3
+    # every block of the range was asked for, for each address, and nothing past the head
+    for address in (POOL, TOKEN):
+        covered = {b for a, lo, hi in fake.windows if a == address for b in range(lo, hi + 1)}
+        assert covered == set(range(0, 1001))
+
+
+def test_logs_are_deduplicated_and_the_range_respected(explorer):
+    logs = [_log(POOL, 10, 0), _log(POOL, 10, 0), _log(POOL, 20, 1), _log(POOL, 900, 0)]
+    explorer(logs, cap=100)
+    found = trace.fetch_logs([POOL], "0xa", 500, window_blocks=7)
+    assert [(log["blockNumber"], log["logIndex"]) for log in found] == [("0xa", "0x0"), ("0x14", "0x1")]
+    assert trace.fetch_logs([], 0) == []
+
+
+def test_single_block_over_the_cap_is_returned_truncated(explorer, capsys):
+    logs = [_log(POOL, 50, i) for i in range(8)]
+    explorer(logs, cap=5)
+    found = trace.fetch_logs([POOL], 0, 100, window_blocks=100)
+    assert len(found) == 5
+    assert "may be truncated" in capsys.readouterr().out
+
+
+def test_failed_window_is_raised(explorer, monkeypatch):
+    explorer([])
+
+    def failing(address, lo, hi):
+        raise RuntimeError("getLogs failed: rate limited")
+
+    monkeypatch.setattr(trace, "_get_logs_window", failing)
+    with pytest.raises(RuntimeError, match="rate limited"):
+        trace.fetch_logs([POOL], 0, 100)
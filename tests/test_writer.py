@@ -0,0 +1,89 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from services.indexer.writer import ChromaWriter
+
+
+class _Collection:
+    """Records what the writer sends, in order."""
+
+    def __init__(self, max_batch_size=None, fail_on=None):
+        self.ops = []
+        self.fail_on = fail_on
+        self.thread = None
+        if max_batch_size:
+            self._client = type("Client", (), {"get_max_batch_size": lambda _: max_batch_size})()
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        self.thread = threading.current_thread()
+        if self.fail_on in ids:
+            raise IOError("disk full")
+        assert isinstance(embeddings, np.ndarray) and embeddings.dtype == np.float32
+        self.ops.append(("upsert", list(ids)))
+
+    def delete(self, ids):
+        self.ops.append(("delete", list(ids)))
+
+
+def _records(start, n):
+    ids = [f"doc:{i}" for i in range(start, start + n)]
+    return dict(ids=ids, documents=ids, metadatas=[{}] * n, embeddings=np.ones((n, 3), dtype=np.float32))
+
+
+def test_batches_are_bounded_and_written_in_order():
+    collection = _Collection()
+    committed = []
+    with ChromaWriter(collection, batch_size=4, flush_interval=60) as writer:
+        writer.upsert(**_records(0, 10))
+        writer.delete(["old:1"])
+        writer.submit(lambda: committed.append(list(collection.ops)))
+        writer.upsert(**_records(10, 3))
+    assert collection.ops == [
+        ("upsert", ["doc:0", "doc:1", "doc:2", "doc:3"]),
+        ("upsert", ["doc:4", "doc:5", "doc:6", "doc:7"]),
+        ("upsert", ["doc:8", "doc:9"]),
+        ("delete", ["old:1"]),
+        ("upsert", ["doc:10", "doc:11", "doc:12"]),
+    ]
+    # the callback ran once everything issued before it was written (it may share a
+    # batch with later records, so small documents don't force partial batches)
+    assert len(committed) == 1 and committed[0][:4] == collection.ops[:4]
+    assert collection.thread is not threading.current_thread()
+    assert writer.stats()["records"] == 13 and writer.stats()["deleted"] == 1
+
+
+def test_batch_size_is_capped_by_the_client_limit():
+    writer = ChromaWriter(_Collection(max_batch_size=5), batch_size=1000)
+    assert writer.batch_size == 5
+    writer.close()
+
+
+def test_idle_partial_batch_is_flushed():
+    collection = _Collection()
+    writer = ChromaWriter(collection, batch_size=100, flush_interval=0.05)
+    writer.upsert(**_records(0, 2))
+    deadline = time.monotonic() + 2
+    while not collection.ops and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert collection.ops == [("upsert", ["doc:0", "doc:1"])]
+    writer.close()
+
+
+def test_write_error_is_raised_and_later_operations_skipped():
+    collection = _Collection(fail_on="doc:2")
+    committed = []
+    writer = ChromaWriter(collection, batch_size=2, flush_interval=60)
+    writer.upsert(**_records(0, 4))
+    writer.submit(lambda: committed.append(True))
+    with pytest.raises(RuntimeError) as excinfo:
+        writer.flush()
+    assert isinstance(excinfo.value.__cause__, IOError)
+    assert collection.ops == [("upsert", ["doc:0", "doc:1"])]
+    assert committed == []
+    with pytest.raises(RuntimeError):
+        writer.upsert(**_records(4, 1))
+    with pytest.raises(RuntimeError):
+        writer.close()